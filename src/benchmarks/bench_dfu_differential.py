@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Updates a simulated STM32 DFU bootloader from one firmware image to a minor revision of it (a few KB changed),
+# with write_elements(), which erases and writes every page, and with write_elements_differential(), using a manifest of the
+# old image's page hashes, and reading the old image back instead.
+# Reports pages written, control transfers and time, not counting the verify that follows either way.
+# Run from the src directory: python3 -m benchmarks.bench_dfu_differential
+
+import os
+import random
+import time
+import lib_six15_api.pydfu as PyDfu
+from lib_six15_api.firmware_image import Firmware_Element
+from lib_six15_api.pydfu_sim import Sim_DFU_Device
+
+FLASH_ADDRESS = 0x08000000
+IMAGE_SIZE = 128 * 1024
+PAGE_SIZE = 2048
+# A full speed control transfer takes about a 1ms frame. Erase and program times are an STM32L4's.
+TRANSFER_SECONDS = 0.001
+ERASE_SECONDS = 0.022
+PROGRAM_SECONDS = 0.003
+# Where a minor revision differs: a couple of functions, a string table, and the version.
+CHANGES = [(0x1200, 600), (0x9F00, 300), (0x14000, 1500), (0x1F000, 16)]
+
+
+def elementsOf(image: bytes):
+    return [Firmware_Element(0, FLASH_ADDRESS, len(image), memoryview(image))]
+
+
+def measure(name: str, old_image: bytes, new_image: bytes, write):
+    # Twice the image's size, so writing it erases page by page, instead of mass erasing.
+    device = Sim_DFU_Device(FLASH_ADDRESS, PAGE_SIZE, IMAGE_SIZE // PAGE_SIZE * 2, transfer_seconds=TRANSFER_SECONDS,
+                            erase_seconds=ERASE_SECONDS, program_seconds=PROGRAM_SECONDS)
+    device.attach()
+    old_hashes, _ = PyDfu.write_elements_differential(elementsOf(old_image), {})
+    device.control_transfers = 0
+    device.erased_pages = 0
+    device.transfer_seconds = TRANSFER_SECONDS
+    start = time.perf_counter()
+    write(elementsOf(new_image), old_hashes)
+    seconds = time.perf_counter() - start
+    transfers = device.control_transfers
+    device.transfer_seconds = 0.0
+    if (not PyDfu.verify_elements(elementsOf(new_image))):
+        raise AssertionError(f"{name}: verify failed")
+    print(f"{name:>24}: {device.erased_pages:3} pages erased, {transfers:5} control transfers, {seconds:5.2f}s")
+
+
+def main():
+    rand = random.Random(23)
+    old_image = bytes(rand.getrandbits(8) for _ in range(IMAGE_SIZE))
+    new_image = bytearray(old_image)
+    for offset, size in CHANGES:
+        new_image[offset:offset + size] = os.urandom(size)
+    new_image = bytes(new_image)
+
+    measure("every page", old_image, new_image, lambda elements, old_hashes: PyDfu.write_elements(elements, False))
+    measure("changed pages, manifest", old_image, new_image, lambda elements, old_hashes: PyDfu.write_elements_differential(elements, old_hashes))
+    measure("changed pages, read back", old_image, new_image, lambda elements, old_hashes: PyDfu.write_elements_differential(elements, None))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Writes firmware images to a simulated STM32 DFU bootloader with write_elements(), which follows a plan_write() plan,
+# and the way it used to: erasing every page of each element, then writing every byte of it, 0xFF padding included.
+# The images are a build padded with 0xFF to a fixed size, one split into elements with a gap, and one filling almost all of flash
+# (where the plan mass erases instead, if allowed to wipe the pages outside the image). Also times finding pages' segments with
+# bisect against the linear scan it replaced.
+# Run from the src directory: python3 -m benchmarks.bench_dfu_plan
+
+import os
+import time
+import lib_six15_api.pydfu as PyDfu
+from lib_six15_api.firmware_image import Firmware_Element
+from lib_six15_api.pydfu_sim import Sim_DFU_Device
+
+FLASH_ADDRESS = 0x08000000
+PAGE_SIZE = 2048
+NUM_PAGES = 128
+# A full speed control transfer takes about a 1ms frame. Erase and program times are an STM32L4's.
+TRANSFER_SECONDS = 0.001
+ERASE_SECONDS = 0.022
+MASS_ERASE_SECONDS = 0.025
+PROGRAM_SECONDS = 0.003
+
+
+def oldWriteElements(elements):
+    # write_elements() as it was.
+    mem_layout = PyDfu.get_memory_layout(PyDfu.__dev)
+    for elem in elements:
+        addr = elem.addr
+        end_addr = addr + elem.size
+        while addr < end_addr:
+            for segment in mem_layout:
+                if addr >= segment["addr"] and addr <= segment["last_addr"]:
+                    page_addr = addr & ~(segment["page_size"] - 1)
+                    PyDfu.page_erase(page_addr)
+                    addr = page_addr + segment["page_size"]
+                    break
+        PyDfu.write_memory(elem.addr, elem.data)
+
+
+def padded(size: int, used: int) -> bytes:
+    return os.urandom(used) + b"\xFF" * (size - used)
+
+
+def images():
+    yield "96KB of code padded to 192KB", [Firmware_Element(0, FLASH_ADDRESS, 192 * 1024, memoryview(padded(192 * 1024, 96 * 1024)))]
+    yield "code, a gap, 8KB of data", [
+        Firmware_Element(0, FLASH_ADDRESS, 60 * 1024, memoryview(padded(60 * 1024, 50 * 1024))),
+        Firmware_Element(1, FLASH_ADDRESS + 120 * 1024, 8 * 1024, memoryview(os.urandom(8 * 1024))),
+    ]
+    yield "240KB of 256KB", [Firmware_Element(0, FLASH_ADDRESS, 240 * 1024, memoryview(padded(240 * 1024, 236 * 1024)))]
+
+
+def measure(write, elements):
+    device = Sim_DFU_Device(FLASH_ADDRESS, PAGE_SIZE, NUM_PAGES, transfer_seconds=TRANSFER_SECONDS, erase_seconds=ERASE_SECONDS,
+                            program_seconds=PROGRAM_SECONDS, mass_erase_seconds=MASS_ERASE_SECONDS)
+    device.attach()
+    start = time.perf_counter()
+    write(elements)
+    seconds = time.perf_counter() - start
+    transfers = device.control_transfers
+    device.transfer_seconds = 0.0
+    if (not PyDfu.verify_elements(elements)):
+        raise AssertionError("Verify failed")
+    return transfers, seconds
+
+
+def timeSegmentLookup():
+    # A layout with a segment per page, like some bootloaders report, is the worst case for a linear scan.
+    mem_layout = [PyDfu.named((addr, addr + PAGE_SIZE - 1, PAGE_SIZE, 1, PAGE_SIZE), "addr last_addr size num_pages page_size")
+                  for addr in range(FLASH_ADDRESS, FLASH_ADDRESS + 1024 * PAGE_SIZE, PAGE_SIZE)]
+    addrs = list(range(FLASH_ADDRESS, FLASH_ADDRESS + 1024 * PAGE_SIZE, PAGE_SIZE // 2))
+    start = time.perf_counter()
+    for addr in addrs:
+        for segment in mem_layout:
+            if addr >= segment["addr"] and addr <= segment["last_addr"]:
+                break
+    linear = time.perf_counter() - start
+    start = time.perf_counter()
+    table = PyDfu.segment_table(mem_layout)
+    for addr in addrs:
+        PyDfu.find_segment(table, addr)
+    bisected = time.perf_counter() - start
+    print(f"segment lookup, {len(mem_layout)} segments, {len(addrs)} addresses: linear {linear * 1000:.1f}ms, bisect {bisected * 1000:.1f}ms")
+
+
+def main():
+    for image_name, elements in images():
+        device = Sim_DFU_Device(FLASH_ADDRESS, PAGE_SIZE, NUM_PAGES)
+        device.attach()
+        plan = PyDfu.plan_elements(elements)
+        PyDfu.print_plan(plan)
+        for name, write in [("every byte", oldWriteElements), ("plan", lambda elements: PyDfu.write_elements(elements, False)),
+                            ("plan, mass erase allowed", lambda elements: PyDfu.write_elements(elements, False, allow_mass_erase=True))]:
+            transfers, seconds = measure(write, elements)
+            print(f"{image_name:>29}, {name:>24}: {transfers:5} control transfers, {seconds:5.2f}s")
+    timeSegmentLookup()
+
+
+if __name__ == "__main__":
+    main()
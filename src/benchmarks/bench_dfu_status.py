@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Writes a firmware image to a simulated STM32 DFU bootloader that answers GETSTATUS while it's busy,
+# comparing pydfu's status polling, which waits out bwPollTimeout, with the loop it replaced, which asked again straight away.
+# Reports GETSTATUS requests and time, and pydfu's own split of each stage into device busy time and host overhead.
+# Run from the src directory: python3 -m benchmarks.bench_dfu_status
+
+import os
+import time
+import lib_six15_api.pydfu as PyDfu
+from lib_six15_api.firmware_image import Firmware_Element
+from lib_six15_api.pydfu_sim import Sim_DFU_Device
+
+FLASH_ADDRESS = 0x08000000
+IMAGE_SIZE = 64 * 1024
+PAGE_SIZE = 2048
+# A full speed control transfer takes about a 1ms frame. Erase and program times are an STM32L4's.
+TRANSFER_SECONDS = 0.001
+ERASE_SECONDS = 0.022
+PROGRAM_SECONDS = 0.003
+
+
+def oldGetStatus() -> int:
+    # What get_status() used to do, without the retries.
+    stat = PyDfu.__dev.ctrl_transfer(0xA1, 3, 0, 0, 6, 20000)
+    return stat[4]
+
+
+def oldCheckStatus(stage: str, expected: int):
+    # What check_status() used to do.
+    start_time = time.monotonic()
+    while (time.monotonic() - start_time) <= 5:
+        status = oldGetStatus()
+        if (status == expected):
+            return
+        if (status == PyDfu.__DFU_STATE_DFU_DOWNLOAD_BUSY and expected == PyDfu.__DFU_STATE_DFU_DOWNLOAD_IDLE):
+            continue
+        raise ValueError(f"DFU: {stage} failed")
+    raise ValueError(f"DFU: {stage} timeout")
+
+
+def oldRunCommand(stage: str, block: int, buf: bytes):
+    PyDfu.__dev.ctrl_transfer(0x21, 1, block, 0, buf, 4000)
+    oldCheckStatus(stage, PyDfu.__DFU_STATE_DFU_DOWNLOAD_BUSY)
+    oldCheckStatus(stage, PyDfu.__DFU_STATE_DFU_DOWNLOAD_IDLE)
+
+
+def oldWriteElements(elements):
+    # The same commands write_elements() sends, with the old status polling.
+    for elem in elements:
+        for page_addr in range(elem.addr, elem.addr + elem.size, PAGE_SIZE):
+            oldRunCommand("erase", 0, bytes([0x41]) + page_addr.to_bytes(4, "little"))
+        oldRunCommand("set address", 0, bytes([0x21]) + elem.addr.to_bytes(4, "little"))
+        chunk = PyDfu.__cfg_descr.wTransferSize
+        for block, offset in enumerate(range(0, elem.size, chunk), 2):
+            oldRunCommand("write memory", block, elem.data[offset:offset + chunk])
+
+
+def measure(write, elements) -> Sim_DFU_Device:
+    # Twice the image's size, so writing it erases page by page, instead of mass erasing.
+    device = Sim_DFU_Device(FLASH_ADDRESS, PAGE_SIZE, IMAGE_SIZE // PAGE_SIZE * 2, transfer_seconds=TRANSFER_SECONDS,
+                            erase_seconds=ERASE_SECONDS, program_seconds=PROGRAM_SECONDS)
+    device.attach()
+    PyDfu.reset_timing()
+    start = time.perf_counter()
+    write(elements)
+    device.seconds = time.perf_counter() - start
+    device.status_requests = device.requests.get(Sim_DFU_Device.GETSTATUS, 0)
+    device.timing = PyDfu.get_timing()
+    device.transfer_seconds = 0.0
+    if (not PyDfu.verify_elements(elements)):
+        raise AssertionError("Verify failed")
+    return device
+
+
+def main():
+    image = os.urandom(IMAGE_SIZE)
+    elements = [Firmware_Element(0, FLASH_ADDRESS, len(image), memoryview(image))]
+    for name, write in [("busy-spin", oldWriteElements), ("bwPollTimeout", lambda elements: PyDfu.write_elements(elements, False))]:
+        device = measure(write, elements)
+        print(f"{name:>13}: {device.status_requests:5} GETSTATUS, {device.control_transfers:5} control transfers, "
+              f"{device.seconds:5.2f}s, {IMAGE_SIZE / 1024 / device.seconds:5.1f}KB/s")
+    for stage, timing in device.timing.items():
+        count = timing["count"]
+        print(f"{stage:>13}: {count:4} x {timing['seconds'] / count * 1000:5.2f}ms, "
+              f"{timing['busy_seconds'] / count * 1000:5.2f}ms device busy, "
+              f"{(timing['seconds'] - timing['busy_seconds']) / count * 1000:5.2f}ms host and USB, "
+              f"{timing['status_requests'] / count:4.1f} GETSTATUS each")
+
+
+if __name__ == "__main__":
+    main()
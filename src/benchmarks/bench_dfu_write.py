@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Writes a firmware image to a simulated STM32 DFU bootloader, with pydfu's write_elements(),
+# and with the way it used to write: setting the address again before every chunk.
+# Reports control transfers and time, with only USB transfer time, and with flash erase and program time as well.
+# Run from the src directory: python3 -m benchmarks.bench_dfu_write
+
+import os
+import time
+import lib_six15_api.pydfu as PyDfu
+from lib_six15_api.firmware_image import Firmware_Element
+from lib_six15_api.pydfu_sim import Sim_DFU_Device
+
+FLASH_ADDRESS = 0x08000000
+IMAGE_SIZE = 128 * 1024
+# A full speed control transfer takes about a 1ms frame.
+TRANSFER_SECONDS = 0.001
+ERASE_SECONDS = 0.020
+PROGRAM_SECONDS = 0.003
+
+
+def oldWriteElements(elements):
+    # write_elements() as it was: erase a page, then write it a chunk at a time, setting the address for every chunk.
+    mem_layout = PyDfu.get_memory_layout(PyDfu.__dev)
+    for elem in elements:
+        addr = elem.addr
+        size = elem.size
+        data = elem.data
+        while size > 0:
+            write_size = size
+            for segment in mem_layout:
+                if addr >= segment["addr"] and addr <= segment["last_addr"]:
+                    page_size = segment["page_size"]
+                    page_addr = addr & ~(page_size - 1)
+                    if addr + write_size > page_addr + page_size:
+                        write_size = page_addr + page_size - addr
+                    PyDfu.page_erase(page_addr)
+                    break
+            written = 0
+            while written < write_size:
+                PyDfu.set_address(addr + written)
+                chunk = min(PyDfu.__cfg_descr.wTransferSize, write_size - written)
+                PyDfu.__dev.ctrl_transfer(0x21, 1, 2, 0, data[written:written + chunk], 4000)
+                PyDfu.check_status("write memory", PyDfu.__DFU_STATE_DFU_DOWNLOAD_BUSY)
+                PyDfu.check_status("write memory", PyDfu.__DFU_STATE_DFU_DOWNLOAD_IDLE)
+                written += chunk
+            data = data[write_size:]
+            addr += write_size
+            size -= write_size
+
+
+def measure(write, elements, **timing) -> Sim_DFU_Device:
+    # Twice the image's size, so writing it erases page by page, instead of mass erasing.
+    device = Sim_DFU_Device(FLASH_ADDRESS, num_pages=IMAGE_SIZE // 2048 * 2, **timing)
+    device.attach()
+    start = time.perf_counter()
+    write(elements)
+    device.seconds = time.perf_counter() - start
+    device.write_transfers = device.control_transfers
+    device.transfer_seconds = 0.0
+    if (not PyDfu.verify_elements(elements)):
+        raise AssertionError("Verify failed")
+    return device
+
+
+def main():
+    image = os.urandom(IMAGE_SIZE)
+    elements = [Firmware_Element(0, FLASH_ADDRESS, len(image), memoryview(image))]
+    timings = [
+        ("USB only", {"transfer_seconds": TRANSFER_SECONDS}),
+        ("USB and flash", {"transfer_seconds": TRANSFER_SECONDS, "erase_seconds": ERASE_SECONDS, "program_seconds": PROGRAM_SECONDS}),
+    ]
+    for timing_name, timing in timings:
+        for name, write in [("set address per chunk", oldWriteElements), ("write_elements()", lambda elements: PyDfu.write_elements(elements, False))]:
+            device = measure(write, elements, **timing)
+            print(f"{timing_name:>13}, {name:>21}: {device.write_transfers:5} control transfers, "
+                  f"{device.seconds:5.2f}s, {IMAGE_SIZE / 1024 / device.seconds:6.1f}KB/s")
+
+
+if __name__ == "__main__":
+    main()
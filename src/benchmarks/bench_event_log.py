@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Logs lines from a background thread into the event log, like a chatty device does.
+# Compares one signal and appendHtml() per line, batched appendHtml(), and the batched Event_Log_Model the GUI uses.
+# Reports lines/s until every line is shown, and the longest the GUI thread went without running its event loop.
+# Then checks that the model's memory use stays flat once it's full.
+# Needs PySide6. Run from the src directory: QT_QPA_PLATFORM=offscreen python3 -m benchmarks.bench_event_log
+
+import datetime
+import resource
+import sys
+import threading
+import time
+from html import escape
+from typing import List
+from PySide6.QtCore import QObject, QTimer, Signal
+from PySide6.QtWidgets import QApplication, QListView, QPlainTextEdit
+from lib_six15_api.logger import Logger, LogLevel, Log_Record, Log_Sink, Log_Timestamp_Cache
+from lib_six15_api.logger_qt import Qt_Log_Sink
+from ui_event_log_model import Event_Log_Model
+
+NUM_LINES = 50_000
+HEARTBEAT_MS = 5
+MEMORY_LINES = 1_000_000
+
+MODE_PER_LINE = "per line"
+MODE_BATCHED_TEXT = "batched text"
+MODE_MODEL = "model"
+
+
+class Signal_Per_Line_Sink(QObject, Log_Sink):
+    # How lines got to the GUI before batching: one queued signal per line.
+    line_signal = Signal(LogLevel, str)
+
+    def post(self, record: Log_Record):
+        self.line_signal.emit(record.level, record.message)
+
+
+def run(app: QApplication, mode: str, num_lines: int):
+    text_edit = QPlainTextEdit()
+    list_view = QListView()
+    list_view.setUniformItemSizes(True)
+    list_view.setLayoutMode(QListView.LayoutMode.Batched)
+    model = Event_Log_Model()
+    list_view.setModel(model)
+    list_view.show()
+    color_names = Logger.LOG_LEVEL_TO_COLOR_NAME
+    timestamps = Log_Timestamp_Cache("%Y-%m-%d %H:%M:%S| ")
+    shown = 0
+
+    def lineImpl(level: LogLevel, message: str):
+        # The event log before batching.
+        nonlocal shown
+        time_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S| ")
+        text_edit.appendHtml(f"<p style=\"color:{Qt_Log_Sink.LOG_LEVEL_TO_COLOR[level].name()};white-space:pre\">{time_str}{message}</p>")
+        shown += 1
+
+    def batchTextImpl(records: List[Log_Record]):
+        nonlocal shown
+        text_edit.appendHtml("".join(f"<p style=\"color:{color_names[record.level]};white-space:pre\">{timestamps.get(record.time)}{escape(record.message)}</p>" for record in records))
+        shown += len(records)
+
+    def batchModelImpl(records: List[Log_Record]):
+        nonlocal shown
+        model.appendRecords(records)
+        list_view.scrollToBottom()
+        shown += len(records)
+
+    if (mode == MODE_PER_LINE):
+        sink = Signal_Per_Line_Sink()
+        sink.line_signal.connect(lineImpl)
+    elif (mode == MODE_BATCHED_TEXT):
+        sink = Qt_Log_Sink(batchTextImpl)
+    else:
+        sink = Qt_Log_Sink(batchModelImpl)
+    Logger.addSink(sink)
+
+    max_gap = 0.0
+    last_beat = time.perf_counter()
+
+    def heartbeat():
+        nonlocal max_gap, last_beat
+        now = time.perf_counter()
+        max_gap = max(max_gap, now - last_beat)
+        last_beat = now
+        if (shown >= num_lines):
+            app.quit()
+
+    def produce():
+        for index in range(num_lines):
+            Logger.info(f"  I ({index}) ir: sent 0xE0E006F9")
+
+    timer = QTimer()
+    timer.timeout.connect(heartbeat)
+    timer.start(HEARTBEAT_MS)
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce)
+    producer.start()
+    app.exec()
+    elapsed = time.perf_counter() - start
+    producer.join()
+    timer.stop()
+    Logger.removeSink(sink)
+    sink.close()
+    print(f"{mode:>12}, {num_lines} lines: {num_lines / elapsed:10.0f} lines/s, longest GUI stall {max_gap * 1000:8.1f}ms")
+
+
+def maxRssMB() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def model_memory():
+    model = Event_Log_Model()
+    batch_size = Qt_Log_Sink.MAX_BATCH_LINES
+    for index in range(0, MEMORY_LINES, batch_size):
+        now = time.monotonic()
+        model.appendRecords([Log_Record(now, LogLevel.INFO, f"  I ({line}) ir: sent 0xE0E006F9") for line in range(index, index + batch_size)])
+        lines = index + batch_size
+        if (lines % (MEMORY_LINES // 5) == 0):
+            print(f"Model after {lines:8} lines: {model.rowCount():7} rows, max RSS {maxRssMB():7.1f}MB")
+
+
+def main():
+    app = QApplication(sys.argv)
+    run(app, MODE_PER_LINE, NUM_LINES)
+    run(app, MODE_BATCHED_TEXT, NUM_LINES)
+    run(app, MODE_MODEL, NUM_LINES)
+    model_memory()
+
+
+if __name__ == "__main__":
+    main()
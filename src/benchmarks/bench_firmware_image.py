@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Loads the same firmware as a .dfu, Intel HEX, .bin and ELF file with Firmware_Image, and the .dfu file with the
+# read_dfu_file() it replaced, which re-sliced the rest of the file after every element.
+# Reports time and peak Python memory (tracemalloc, which doesn't count the memory mapped file itself).
+# Run from the src directory: python3 -m benchmarks.bench_firmware_image [NUM_ELEMENTS]
+
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from typing import Callable, List, Tuple
+from lib_six15_api.firmware_image import Firmware_Image
+
+FLASH_ADDRESS = 0x08000000
+NUM_ELEMENTS = 256
+ELEMENT_SIZE = 16 * 1024
+# Elements are spread out with gaps between them, so the HEX and ELF files keep them apart.
+ELEMENT_STRIDE = 32 * 1024
+
+
+def oldReadDfuFile(file_name: str):
+    # What read_dfu_file() used to do, without the printing.
+    def consume(fmt, data, names):
+        size = struct.calcsize(fmt)
+        return dict(zip(names.split(), struct.unpack(fmt, data[:size]))), data[size:]
+
+    with open(file_name, "rb") as fin:
+        data = fin.read()
+    crc = 0xFFFFFFFF & -zlib.crc32(data[:-4]) - 1
+    elements = []
+    dfu_prefix, data = consume("<5sBIB", data, "signature version size targets")
+    for target_idx in range(dfu_prefix["targets"]):
+        img_prefix, data = consume("<6sBI255s2I", data, "signature altsetting named name size elements")
+        target_size = img_prefix["size"]
+        target_data = data[:target_size]
+        data = data[target_size:]
+        for elem_idx in range(img_prefix["elements"]):
+            elem_prefix, target_data = consume("<2I", target_data, "addr size")
+            elem_prefix["num"] = elem_idx
+            elem_size = elem_prefix["size"]
+            elem_prefix["data"] = target_data[:elem_size]
+            target_data = target_data[elem_size:]
+            elements.append(elem_prefix)
+    dfu_suffix = dict(zip("device product vendor dfu ufd len crc".split(), struct.unpack("<4H3sBI", data[:16])))
+    if crc != dfu_suffix["crc"]:
+        return None
+    return elements
+
+
+def writeDfu(file_name: str, elements: List[Tuple[int, bytes]]):
+    target = b"".join(struct.pack("<2I", addr, len(data)) + data for addr, data in elements)
+    body = struct.pack("<5sBIB", b"DfuSe", 1, 0, 1)
+    body += struct.pack("<6sBI255s2I", b"Target", 0, 0, b"", len(target), len(elements)) + target
+    body += struct.pack("<4H3sB", 0xFFFF, 0xDF11, 0x0483, 0x011A, b"UFD", 16)
+    with open(file_name, "wb") as file:
+        file.write(body + struct.pack("<I", 0xFFFFFFFF & -zlib.crc32(body) - 1))
+
+
+def writeHex(file_name: str, elements: List[Tuple[int, bytes]]):
+    def record(record_type: int, addr: int, data: bytes) -> str:
+        raw = bytes([len(data), (addr >> 8) & 0xFF, addr & 0xFF, record_type]) + data
+        return ":" + (raw + bytes([-sum(raw) & 0xFF])).hex().upper() + "\n"
+
+    lines = []
+    upper = None
+    for addr, data in elements:
+        for offset in range(0, len(data), 16):
+            if ((addr + offset) >> 16 != upper):
+                upper = (addr + offset) >> 16
+                lines.append(record(Firmware_Image.HEX_EXTENDED_LINEAR_ADDRESS, 0, struct.pack(">H", upper)))
+            lines.append(record(Firmware_Image.HEX_DATA, (addr + offset) & 0xFFFF, data[offset:offset + 16]))
+    lines.append(record(Firmware_Image.HEX_END_OF_FILE, 0, b""))
+    with open(file_name, "w") as file:
+        file.writelines(lines)
+
+
+def writeElf(file_name: str, elements: List[Tuple[int, bytes]]):
+    # A 32 bit little endian ARM executable, with a PT_LOAD segment for each element.
+    header_size = 52
+    program_header_size = 32
+    offset = header_size + program_header_size * len(elements)
+    program_headers = b""
+    for addr, data in elements:
+        program_headers += struct.pack("<8I", Firmware_Image.ELF_PT_LOAD, offset, addr, addr, len(data), len(data), 5, 4)
+        offset += len(data)
+    ident = Firmware_Image.ELF_MAGIC + bytes([1, 1, 1]) + bytes(9)
+    header = ident + struct.pack("<HHIIIIIHHHHHH", 2, 40, 1, FLASH_ADDRESS, header_size, 0, 0, header_size, program_header_size,
+                                 len(elements), 40, 0, 0)
+    with open(file_name, "wb") as file:
+        file.write(header + program_headers + b"".join(data for addr, data in elements))
+
+
+def release(image):
+    if (isinstance(image, Firmware_Image)):
+        image.close()
+
+
+def measure(name: str, load: Callable[[], object], expected: List[Tuple[int, bytes]]):
+    # Timed without tracemalloc, which slows down allocations a lot, then loaded again for the peak memory.
+    tracemalloc.start()
+    release(load())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    image = load()
+    seconds = time.perf_counter() - start
+    elements = image.elements if isinstance(image, Firmware_Image) else image
+    got = [(element.addr, bytes(element.data)) if isinstance(image, Firmware_Image) else (element["addr"], bytes(element["data"])) for element in elements]
+    if (got != expected):
+        raise AssertionError(f"{name}: wrong elements")
+    del elements
+    release(image)
+    print(f"{name:>24}: {seconds * 1000:8.1f}ms, peak {peak / 1e6:6.1f}MB")
+
+
+def main():
+    num_elements = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_ELEMENTS
+    elements = [(FLASH_ADDRESS + index * ELEMENT_STRIDE, os.urandom(ELEMENT_SIZE)) for index in range(num_elements)]
+    print(f"{num_elements} elements of {ELEMENT_SIZE // 1024}KB")
+    with tempfile.TemporaryDirectory() as directory:
+        dfu_name = os.path.join(directory, "firmware.dfu")
+        hex_name = os.path.join(directory, "firmware.hex")
+        elf_name = os.path.join(directory, "firmware.elf")
+        bin_name = os.path.join(directory, "firmware.bin")
+        writeDfu(dfu_name, elements)
+        writeHex(hex_name, elements)
+        writeElf(elf_name, elements)
+        with open(bin_name, "wb") as file:
+            file.write(elements[0][1])
+
+        measure("read_dfu_file(), before", lambda: oldReadDfuFile(dfu_name), elements)
+        measure(".dfu, Firmware_Image", lambda: Firmware_Image.load(dfu_name), elements)
+        measure(".elf, Firmware_Image", lambda: Firmware_Image.load(elf_name), elements)
+        measure(".hex, Firmware_Image", lambda: Firmware_Image.load(hex_name), elements)
+        measure(".bin, Firmware_Image", lambda: Firmware_Image.load(bin_name, FLASH_ADDRESS), elements[:1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Micro-benchmark for HID report framing in Six15_API_Backend_HID.writePacket
+# Run from the src directory: python3 -m benchmarks.bench_hid_framing
+
+import struct
+import time
+from lib_six15_api.six15_api_backend import Six15_API_Backend
+from lib_six15_api.six15_api_backend_hid import Six15_API_Backend_HID
+
+
+class Null_HID_Device:
+    def __init__(self) -> None:
+        self.reports = 0
+
+    def write(self, buf) -> int:
+        self.reports += 1
+        return len(buf)
+
+
+def legacy_writePacket(dev: Null_HID_Device, buf: bytes):
+    # The framing used before the reusable tx buffer and report cache.
+    buf_len = len(buf)
+    num_bytes_sent = 0
+    while (num_bytes_sent < buf_len):
+        num_byes_remaining = buf_len - num_bytes_sent
+        if (num_bytes_sent == 0):
+            header_bytes = struct.pack('<HHH', Six15_API_Backend_HID.REPORT_ID_OUT, Six15_API_Backend.API_VERSION, buf_len)
+        else:
+            header_bytes = struct.pack('<HH', Six15_API_Backend_HID.REPORT_ID_OUT, Six15_API_Backend.API_VERSION)
+        header_len = len(header_bytes)
+        max_payload_len = Six15_API_Backend_HID.HID_REPORT_SIZE - header_len
+        if (num_byes_remaining < max_payload_len):
+            payload_len = num_byes_remaining
+            padding_len = max_payload_len - num_byes_remaining
+        else:
+            payload_len = max_payload_len
+            padding_len = 0
+        padding_bytes = bytearray(padding_len)
+        final_buf = header_bytes + buf[num_bytes_sent:num_bytes_sent+payload_len] + padding_bytes
+        dev.write(final_buf)
+        num_bytes_sent = num_bytes_sent+payload_len
+
+
+def reports_per_second(dev: Null_HID_Device, write_func, packets, seconds: float = 1.0) -> float:
+    start_reports = dev.reports
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        for packet in packets:
+            write_func(packet)
+    elapsed = time.perf_counter() - start
+    return (dev.reports - start_reports) / elapsed
+
+
+def main():
+    read_log = bytes([0x04])
+    ir_codes = [bytes([0x06]) + struct.pack("<I", code) for code in (0xE0E006F9, 0xE0E08679, 0xE0E0A659, 0xE0E046B9)]
+    unique = [bytes([0x7F]) + i.to_bytes(4, "little") + bytes(200) for i in range(4096)]
+
+    cases = {
+        "READ_LOG poll (1 report)": [read_log],
+        "IR codes (1 report)": ir_codes,
+        "Unique 205 byte writes (4 reports)": unique,
+    }
+    for name, packets in cases.items():
+        legacy_dev = Null_HID_Device()
+        backend = Six15_API_Backend_HID(Null_HID_Device(), "bench", 0, 0)
+
+        before = reports_per_second(legacy_dev, lambda buf: legacy_writePacket(legacy_dev, buf), packets)
+        after = reports_per_second(backend.dev, backend.writePacket, packets)
+        print(f"{name}:")
+        print(f"    before: {before:12.0f} reports/s")
+        print(f"    after:  {after:12.0f} reports/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Compares the cost of Six15_API_Backend_HID.isConnected() using enumeration vs the device node.
+# Uses a fake HID layer that enumerates like hidapi's Linux backend, by reading a uevent file per hidraw node.
+# Run from the src directory: python3 -m benchmarks.bench_hid_liveness
+
+import os
+import shutil
+import tempfile
+import time
+import lib_six15_api.six15_api_backend_hid as Backend_HID_Module
+from lib_six15_api.six15_api_backend_hid import Six15_API_Backend_HID
+
+VID = 0x2dc4
+PID = 0x2a
+NUM_OTHER_HID_DEVICES = 12  # Keyboards, mice, headsets, ... that are also on a typical PC
+
+
+class Fake_HID_Layer:
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.class_dir = os.path.join(root, "sys_class_hidraw")
+        os.makedirs(self.class_dir)
+        self.our_devnode = self.addDevice(0, VID, PID)
+        for index in range(1, NUM_OTHER_HID_DEVICES + 1):
+            self.addDevice(index, 0x046d, 0xc500 + index)
+
+    def addDevice(self, index: int, vid: int, pid: int) -> str:
+        devnode = os.path.join(self.root, f"hidraw{index}")
+        with open(devnode, "w"):
+            pass
+        os.makedirs(os.path.join(self.class_dir, f"hidraw{index}"))
+        with open(os.path.join(self.class_dir, f"hidraw{index}", "uevent"), "w") as f:
+            f.write(f"DRIVER=hid-generic\nHID_ID=0003:{vid:08X}:{pid:08X}\nHID_NAME=Fake Device {index}\nHID_PHYS=usb-0000:00:14.0-{index}/input0\n")
+        return devnode
+
+    def removeDevice(self, index: int):
+        os.remove(os.path.join(self.root, f"hidraw{index}"))
+        shutil.rmtree(os.path.join(self.class_dir, f"hidraw{index}"))
+
+    def enumerate(self, vid: int = 0, pid: int = 0):
+        devices = []
+        for name in sorted(os.listdir(self.class_dir)):
+            with open(os.path.join(self.class_dir, name, "uevent")) as f:
+                props = dict(line.split("=", 1) for line in f.read().splitlines())
+            _, dev_vid, dev_pid = props["HID_ID"].split(":")
+            dev_vid = int(dev_vid, 16)
+            dev_pid = int(dev_pid, 16)
+            if ((vid == 0 or vid == dev_vid) and (pid == 0 or pid == dev_pid)):
+                path = os.path.join(self.root, name).encode()
+                devices.append({"path": path, "vendor_id": dev_vid, "product_id": dev_pid, "product_string": props["HID_NAME"], "interface_number": 0})
+        return devices
+
+
+def checks_per_second(backend: Six15_API_Backend_HID, seconds: float = 1.0) -> float:
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        if (not backend.isConnected()):
+            raise AssertionError("Device should be connected")
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        fake_hid = Fake_HID_Layer(root)
+        Backend_HID_Module.hid.enumerate = fake_hid.enumerate
+        path = fake_hid.our_devnode.encode()
+
+        enumerate_backend = Six15_API_Backend_HID(object(), path, VID, PID, Six15_API_Backend_HID.LIVENESS_ENUMERATE, 0)
+        devnode_backend = Six15_API_Backend_HID(object(), path, VID, PID, Six15_API_Backend_HID.LIVENESS_DEVNODE, 0)
+        cached_backend = Six15_API_Backend_HID(object(), path, VID, PID, Six15_API_Backend_HID.LIVENESS_AUTO)
+
+        enumerate_rate = checks_per_second(enumerate_backend)
+        devnode_rate = checks_per_second(devnode_backend)
+        cached_rate = checks_per_second(cached_backend)
+        print(f"Enumerate ({NUM_OTHER_HID_DEVICES + 1} HID devices): {enumerate_rate:12.0f} checks/s ({1e6 / enumerate_rate:8.2f}us each)")
+        print(f"Device node stat():              {devnode_rate:12.0f} checks/s ({1e6 / devnode_rate:8.2f}us each)")
+        print(f"Device node, {Six15_API_Backend_HID.DEFAULT_LIVENESS_TTL}s TTL cache:     {cached_rate:12.0f} checks/s ({1e6 / cached_rate:8.2f}us each)")
+
+        # Removing the node must be noticed once the TTL runs out.
+        fake_hid.removeDevice(0)
+        time.sleep(Six15_API_Backend_HID.DEFAULT_LIVENESS_TTL)
+        print(f"After removal: enumerate:{enumerate_backend.isConnected()} devnode:{devnode_backend.isConnected()} cached:{cached_backend.isConnected()}")
+
+
+if __name__ == "__main__":
+    main()
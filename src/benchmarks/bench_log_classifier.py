@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Classifies and logs a long synthetic device log, the way the log watcher does, comparing the compiled Log_Line_Classifier
+# with the loop over Logger.PREFIX_TO_LOG_LEVEL it replaced, and an anchored regex. Also times pulling out Log_Fields.
+# Run from the src directory: python3 -m benchmarks.bench_log_classifier [NUM_LINES]
+
+import random
+import re
+import sys
+import time
+from typing import Callable, List
+from lib_six15_api.logger import Logger, LogLevel, Queued_Log_Sink
+from lib_six15_api.log_fields import Log_Fields
+
+NUM_LINES = 2_000_000
+BATCH_LINES = 256  # Framework_IR.LOG_BATCH_MAX_LINES
+IR_CODES = [0xE0E006F9, 0xE0E08679, 0xE0E0A659, 0xE0E046B9, 0xE0E016E9, 0xE0E01AE5]
+
+
+def makeLines(num_lines: int) -> List[str]:
+    rand = random.Random(18)
+    lines: List[str] = []
+    for index in range(num_lines):
+        roll = rand.random()
+        if (roll < 0.0005):
+            lines.append(f"Error: usb: transfer timeout on ep {rand.randint(1, 3)}")
+        elif (roll < 0.003):
+            lines.append(f"Warn: ir: repeat code dropped after {rand.randint(1, 500)}ms")
+        elif (roll < 0.005):
+            lines.append(f"Warning: ({index}) battery low {rand.randint(3300, 3600)}mV")
+        else:
+            lines.append(f"I ({index}) ir: sent 0x{rand.choice(IR_CODES):08X}")
+    return lines
+
+
+def loopLevel(line: str) -> LogLevel:
+    # What Logger.prefixedLevel() used to do.
+    for prefix, level in Logger.PREFIX_TO_LOG_LEVEL.items():
+        if (line.startswith(prefix)):
+            return level
+    return LogLevel.INFO
+
+
+def regexLevels(lines: List[str]) -> List[LogLevel]:
+    pattern = re.compile("|".join(re.escape(prefix) for prefix in sorted(Logger.PREFIX_TO_LOG_LEVEL, key=len, reverse=True)))
+    match = pattern.match
+    prefix_to_level = Logger.PREFIX_TO_LOG_LEVEL
+    levels: List[LogLevel] = []
+    for line in lines:
+        found = match(line)
+        levels.append(prefix_to_level[found.group()] if found != None else LogLevel.INFO)
+    return levels
+
+
+def timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def report(name: str, seconds: float, num_lines: int):
+    print(f"{name:>40}: {seconds:6.2f}s, {num_lines / seconds / 1e6:5.2f}M lines/s")
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_LINES
+    lines = makeLines(num_lines)
+    batches = [lines[offset:offset + BATCH_LINES] for offset in range(0, num_lines, BATCH_LINES)]
+
+    expected = [loopLevel(line) for line in lines]
+    if (Logger.classifier.levels(lines) != expected or regexLevels(lines) != expected or [Logger.prefixedLevel(line) for line in lines] != expected):
+        raise AssertionError("Classifiers disagree")
+
+    report("classify, prefix loop", timed(lambda: [loopLevel(line) for line in lines]), num_lines)
+    report("classify, anchored regex", timed(lambda: regexLevels(lines)), num_lines)
+    report("classify, Logger.prefixedLevel()", timed(lambda: [Logger.prefixedLevel(line) for line in lines]), num_lines)
+    report("classify, classifier.levels()", timed(lambda: [Logger.classifier.levels(batch) for batch in batches]), num_lines)
+
+    # Drained after every batch, like the GUI does, so millions of queued records don't slow everything down.
+    sink = Queued_Log_Sink()
+    Logger.addSink(sink)
+    logged = [0]
+
+    def logPerLine():
+        # What the log watcher used to do for each line.
+        for batch in batches:
+            for line in batch:
+                Logger.log(loopLevel(line), "  %s", line)
+            sink.pending.clear()
+
+    def logBatches():
+        for batch in batches:
+            Logger.log_prefixed_batch(batch, "  ")
+            logged[0] += len(sink.pending)
+            sink.pending.clear()
+
+    report("classify and log, per line", timed(logPerLine), num_lines)
+    report("classify and log, log_prefixed_batch()", timed(logBatches), num_lines)
+    if (logged[0] != num_lines):
+        raise AssertionError(f"{logged[0]} records logged")
+    Logger.removeSink(sink)
+
+    def parseLines():
+        for line in lines:
+            Log_Fields.parse(line)
+
+    def parseBatches():
+        for batch in batches:
+            Log_Fields.parseBatch(batch)
+
+    report("Log_Fields.parse()", timed(parseLines), num_lines)
+    report("Log_Fields.parseBatch()", timed(parseBatches), num_lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Fills a Log_Index with a long session of host and device lines, then times searches against checking every line.
+# Run from the src directory: python3 -m benchmarks.bench_log_index [NUM_LINES]
+
+import gc
+import random
+import re
+import resource
+import sys
+import time
+from typing import Callable, List
+from lib_six15_api.logger import Logger, LogLevel, Log_Record
+from lib_six15_api.log_fields import Log_Fields
+from lib_six15_api.log_index import Log_Index, Log_Query
+
+NUM_LINES = 2_000_000
+BATCH_LINES = 500
+# Like the GUI's index, which only keeps the latest lines.
+CAPPED_CAPACITY = 100_000
+IR_CODES = [0xE0E006F9, 0xE0E08679, 0xE0E0A659, 0xE0E046B9, 0xE0E016E9, 0xE0E01AE5]
+
+
+def makeRecords(num_lines: int) -> List[Log_Record]:
+    rand = random.Random(15)
+    now = time.monotonic() - num_lines / 1000
+    records: List[Log_Record] = []
+    for index in range(num_lines):
+        roll = rand.random()
+        if (roll < 0.0005):
+            line = f"Error: ({index}) usb: transfer timeout on ep {rand.randint(1, 3)}"
+        elif (roll < 0.005):
+            line = f"Warn: ({index}) ir: repeat code dropped"
+        elif (roll < 0.9):
+            line = f"I ({index}) ir: sent 0x{rand.choice(IR_CODES):08X}"
+        else:
+            records.append(Log_Record(now + index / 1000, LogLevel.VERBOSE, f"Sent command {rand.randint(1, 9)} id {index}"))
+            continue
+        records.append(Log_Record(now + index / 1000, Logger.prefixedLevel(line), f"{Log_Index.DEVICE_PREFIX}{line}"))
+    return records
+
+
+def scan(records: List[Log_Record], query: Log_Query) -> int:
+    # What searching looks like without the index.
+    matcher = re.compile(query.text, re.IGNORECASE).search if query.regex else None
+    text = query.text.lower()
+    count = 0
+    for record in records:
+        if (query.levels != None and record.level not in query.levels):
+            continue
+        if (query.source == Log_Index.SOURCE_DEVICE and not record.message.startswith(Log_Index.DEVICE_PREFIX)):
+            continue
+        if (query.start_time != None and record.time < query.start_time):
+            continue
+        if (query.module != None and (not record.message.startswith(Log_Index.DEVICE_PREFIX) or
+                                      Log_Fields.parse(record.message[len(Log_Index.DEVICE_PREFIX):]).module != query.module)):
+            continue
+        if (matcher != None):
+            if (matcher(record.message) == None):
+                continue
+        elif (text not in record.message.lower()):
+            continue
+        count += 1
+    return count
+
+
+def bestOf(func: Callable[[], int], rounds: int = 3) -> float:
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return best
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_LINES
+    records = makeRecords(num_lines)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    index = Log_Index(num_lines)
+    start = time.perf_counter()
+    for offset in range(0, num_lines, BATCH_LINES):
+        index.addRecords(records[offset:offset + BATCH_LINES])
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Indexed {num_lines} lines in {elapsed:.2f}s ({elapsed / num_lines * 1e6:.1f}us/line), {len(index.trigram_ids)} trigrams, index ~{rss_after - rss_before:.0f}MB")
+
+    # The records are moved out of the garbage collector's way, or collections walking them are the slowest batches.
+    gc.freeze()
+    capped = Log_Index(CAPPED_CAPACITY)
+    worst = 0.0
+    start = time.perf_counter()
+    for offset in range(0, num_lines, BATCH_LINES):
+        batch_start = time.perf_counter()
+        capped.addRecords(records[offset:offset + BATCH_LINES])
+        worst = max(worst, time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {num_lines} lines keeping the latest {CAPPED_CAPACITY} in {elapsed:.2f}s, slowest batch of {BATCH_LINES} {worst * 1000:.1f}ms")
+    del capped
+    gc.unfreeze()
+
+    last_minute = records[-1].time - 60
+    queries = [
+        ("errors", Log_Query(levels=frozenset([LogLevel.ERROR, LogLevel.CRITICAL_ERROR]))),
+        ("\"timeout\"", Log_Query("timeout")),
+        ("\"0xE0E01AE5\"", Log_Query("0xE0E01AE5")),
+        ("device \"repeat\" last minute", Log_Query("repeat", source=Log_Index.SOURCE_DEVICE, start_time=last_minute)),
+        ("regex \"ep [23]$\"", Log_Query("ep [23]$", regex=True)),
+        ("\"(12345)\"", Log_Query("(12345)")),
+        ("module \"usb\"", Log_Query(module="usb")),
+        ("module \"ir\" \"repeat\"", Log_Query("repeat", module="ir")),
+        # Escapes that take more than one character, which the index can't narrow down with, but mustn't miss lines for.
+        ("regex \"0x\\x45\\x30E01AE5\"", Log_Query(r"0x\x45\x30E01AE5", regex=True)),
+        ("regex \"0x\\u0045\\u0030E01AE5\"", Log_Query(r"0x\u0045\u0030E01AE5", regex=True)),
+        ("regex \"0x\\105\\060E01AE5\"", Log_Query(r"0x\105\060E01AE5", regex=True)),
+    ]
+    for name, query in queries:
+        matches = len(index.search(query))
+        expected = scan(records, query)
+        if (matches != expected):
+            raise AssertionError(f"{name}: index found {matches}, scan found {expected}")
+        indexed = bestOf(lambda: len(index.search(query)))
+        scanned = bestOf(lambda: scan(records, query), 1)
+        print(f"{name:>30}: {matches:8} matches, index {indexed * 1000:8.2f}ms, scan {scanned * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
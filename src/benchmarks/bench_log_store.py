@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Adds device log lines to a Log_Store_Writer at a steady rate, like a chatty device, from a thread standing in for the log watcher.
+# Reports what add() costs the caller (including the worst call), compared to writing each line to a file itself,
+# whether the writer kept up, and how big the compressed segments are.
+# Run from the src directory: python3 -m benchmarks.bench_log_store
+
+import os
+import tempfile
+import threading
+import time
+from lib_six15_api.logger import LogLevel
+from lib_six15_api.log_store import Log_Store, Log_Store_Writer
+
+LINES_PER_SECOND = 100_000
+SECONDS = 3.0
+BURST_LINES = 1000
+
+
+def produce(add) -> float:
+    # Returns the longest single add() in seconds.
+    worst = 0.0
+    start = time.perf_counter()
+    total = int(LINES_PER_SECOND * SECONDS)
+    for burst in range(0, total, BURST_LINES):
+        for index in range(burst, burst + BURST_LINES):
+            before = time.perf_counter()
+            add(LogLevel.INFO, f"I ({index}) ir: sent 0xE0E006F9")
+            worst = max(worst, time.perf_counter() - before)
+        # Wait for the next burst, to keep to LINES_PER_SECOND.
+        delay = start + (burst + BURST_LINES) / LINES_PER_SECOND - time.perf_counter()
+        if (delay > 0):
+            time.sleep(delay)
+    return worst
+
+
+def timeAdds(add, lines: int = 200_000) -> float:
+    start = time.perf_counter()
+    for index in range(lines):
+        add(LogLevel.INFO, f"I ({index}) ir: sent 0xE0E006F9")
+    return (time.perf_counter() - start) / lines
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        with open(os.path.join(root, "direct.log"), "w") as f:
+            def writeDirect(level: LogLevel, message: str):
+                f.write(f"{level.name} {message}\n")
+                f.flush()
+            print(f"Writing each line to a file: {timeAdds(writeDirect) * 1e6:.2f}us per line")
+
+        for compression in ["gzip", "zstd", None]:
+            try:
+                writer = Log_Store_Writer(os.path.join(root, str(compression)), compression)
+            except ValueError as e:
+                print(f"{compression}: {e}")
+                continue
+            results = {}
+
+            def producer():
+                results["worst"] = produce(writer.add)
+
+            thread = threading.Thread(target=producer)
+            start = time.perf_counter()
+            thread.start()
+            thread.join()
+            writer.close()
+            elapsed = time.perf_counter() - start
+            file_names = Log_Store.segmentFileNames(writer.directory)
+            size = sum(os.path.getsize(file_name) for file_name in file_names)
+            print(f"{str(compression):>5}: {writer.written} lines written in {elapsed:.2f}s, {writer.dropped} dropped, "
+                  f"worst add() {results['worst'] * 1e6:.0f}us, {len(file_names)} segments {size / 1024:.0f}KB ({size / max(1, writer.written):.1f} bytes/line)")
+
+            writer = Log_Store_Writer(os.path.join(root, f"{compression}-flood"), compression)
+            per_add = timeAdds(writer.add)
+            writer.close()
+            print(f"       add() as fast as possible: {per_add * 1e6:.2f}us per line, {writer.dropped} of 200000 dropped")
+
+
+if __name__ == "__main__":
+    main()
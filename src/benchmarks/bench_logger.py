@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Times what logging costs the caller: a verbose line that is filtered out, with the message built eagerly (an f-string) or
+# left to the Logger (format args), and a line that is kept and queued for a sink, from one thread and from several at once.
+# Also checks that importing the logger doesn't load Qt.
+# Run from the src directory: python3 -m benchmarks.bench_logger
+
+import subprocess
+import sys
+import threading
+import time
+from lib_six15_api.logger import Logger, Log_Hex, Queued_Log_Sink
+
+CALLS = 200_000
+THREADS = 4
+PACKET = bytes(index & 0xFF for index in range(448))  # Six15_API_Backend.MAX_TX_SIZE
+
+
+def perCall(func, calls: int = CALLS) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def threaded(sink: Queued_Log_Sink) -> float:
+    # Returns the time per Logger.info() while THREADS threads log at once. Nothing is locked, so it should match one thread.
+    def run(thread_index: int):
+        for index in range(CALLS // THREADS):
+            Logger.info("Sent command %d id %d", thread_index, index)
+
+    threads = [threading.Thread(target=run, args=(thread_index,)) for thread_index in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if (len(sink.pending) != CALLS // THREADS * THREADS):
+        raise AssertionError(f"{len(sink.pending)} records queued")
+    sink.pending.clear()
+    return elapsed / CALLS
+
+
+def main():
+    imported = subprocess.run([sys.executable, "-c", "import sys, lib_six15_api.logger; print('PySide6' in sys.modules)"], capture_output=True, text=True)
+    print(f"Importing lib_six15_api.logger loads PySide6: {imported.stdout.strip()}")
+
+    sink = Queued_Log_Sink()
+    Logger.addSink(sink)
+
+    Logger.setEnableVerbose(False)
+    eager = perCall(lambda: Logger.verbose(f"Write:0x{PACKET.hex()}"))
+    deferred = perCall(lambda: Logger.verbose("Write:0x%s", Log_Hex(PACKET)))
+    print(f"Filtered verbose, f-string:     {eager * 1e9:6.0f}ns per call")
+    print(f"Filtered verbose, format args:  {deferred * 1e9:6.0f}ns per call")
+
+    Logger.setEnableVerbose(True)
+    kept = perCall(lambda: Logger.verbose("Write:0x%s", Log_Hex(PACKET)))
+    sink.pending.clear()
+    print(f"Kept verbose with hex:          {kept * 1e9:6.0f}ns per call")
+
+    plain = perCall(lambda: Logger.info("Sent command"))
+    sink.pending.clear()
+    formatted = perCall(lambda: Logger.info("Sent command %d", 7))
+    sink.pending.clear()
+    print(f"Logger.info() to a queued sink: {plain * 1e9:6.0f}ns per call, {formatted * 1e9:.0f}ns with a format arg")
+
+    print(f"{THREADS} threads logging at once:   {threaded(sink) * 1e9:6.0f}ns per call")
+    Logger.removeSink(sink)
+
+
+if __name__ == "__main__":
+    main()
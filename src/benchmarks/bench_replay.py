@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Records a log reading session from the simulated device, then replays it as fast as possible.
+# Pass a trace file to replay that instead, like one captured from a real device with: framework_ir.py --capture FILE ...
+# Run from the src directory: python3 -m benchmarks.bench_replay [TRACE_FILE]
+
+import os
+import sys
+import tempfile
+import time
+from framework_ir import Framework_IR
+from framework_ir_sim import Framework_IR_Sim
+from lib_six15_api.six15_api_backend_capture import Six15_API_Backend_Capture, Six15_API_Backend_Replay, Six15_API_Trace
+
+
+def capture(file_name: str, seconds: float = 1.0):
+    firmware = Framework_IR_Sim(log_bytes_per_second=100_000)
+    framework_ir = Framework_IR(Six15_API_Backend_Capture(Framework_IR_Sim.openBackend(firmware), file_name), True)
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        framework_ir.readLog(lambda line: None, lambda: time.perf_counter() > end)
+    framework_ir.close()
+
+
+def replay(file_name: str):
+    framework_ir = Framework_IR(Six15_API_Backend_Replay(file_name), True)
+    lines = 0
+    log_bytes = 0
+
+    def lineFunc(line: str):
+        nonlocal lines, log_bytes
+        lines += 1
+        log_bytes += len(line) + 1
+
+    start = time.perf_counter()
+    while framework_ir.isConnected():
+        try:
+            framework_ir.readLog(lineFunc, lambda: False)
+        except OSError:
+            break
+    elapsed = time.perf_counter() - start
+    framework_ir.close()
+    print(f"Replayed {lines} lines ({log_bytes} bytes) in {elapsed:.3f}s: {lines / elapsed:10.0f} lines/s {log_bytes / elapsed:10.0f} bytes/s")
+
+
+def main():
+    if (len(sys.argv) > 1):
+        replay(sys.argv[1])
+        return
+    with tempfile.TemporaryDirectory() as root:
+        file_name = os.path.join(root, "sim.trace")
+        capture(file_name)
+        records = sum(1 for _ in Six15_API_Trace.read(file_name))
+        print(f"Captured {records} records, {os.path.getsize(file_name)} bytes")
+        replay(file_name)
+
+
+if __name__ == "__main__":
+    main()
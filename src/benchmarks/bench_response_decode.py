@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Micro-benchmark for decoding responses, the hot path while polling the device log.
+# Run from the src directory: python3 -m benchmarks.bench_response_decode
+
+import struct
+import time
+import framework_ir_six15_api as Six15_API
+from lib_six15_api.six15_api import Base_Response
+from lib_six15_api.logger import Logger
+
+
+def legacy_unpack_checked(format: str, buffer: bytes, resp_name: str):
+    # Base_Response.unpack_checked() as it was, parsing the format on every call.
+    format_size = struct.calcsize(format)
+    buffer_size = len(buffer)
+    if (buffer_size < format_size):
+        Logger.warn(f"Response \"{resp_name}\" size too small. Got size:{buffer_size} expected size:{format_size}")
+        return None
+    if (buffer_size > format_size):
+        Logger.warn(f"Response \"{resp_name}\" size too big. Got size:{buffer_size} expected size:{format_size}")
+        buffer = buffer[0:format_size]
+    return struct.unpack(format, buffer)
+
+
+class Legacy_LogPart:
+    # How LogPart was decoded before responses were compiled: a dict backed object, and the format parsed on every call.
+    @staticmethod
+    def format():
+        return f"<58s"
+
+    def __init__(self, resp):
+        data = legacy_unpack_checked(self.format(), resp, self.__class__.__name__)
+        if (data == None):
+            raise ValueError(f"Device did not respond with: {self.__class__.__name__} as expected.")
+        self.msg = Base_Response.decodeToStr(data[0])
+        self.log_finished = data[0][-1] == 0
+
+
+def legacy_decode(resp_type, payload):
+    # Six15_API.sendCommand also computed the response size on every call.
+    struct.calcsize(resp_type.format())
+    return resp_type(payload)
+
+
+def compiled_decode(resp_type, payload):
+    resp_type.compiled_size
+    return resp_type(payload)
+
+
+def decodes_per_second(decode, resp_type, payload, rounds: int = 5, seconds: float = 0.2) -> float:
+    # Best of several short rounds, to keep noise from other processes out of the result.
+    best = 0.0
+    for _ in range(rounds):
+        count = 0
+        start = time.perf_counter()
+        end = start + seconds
+        while time.perf_counter() < end:
+            for _ in range(1000):
+                decode(resp_type, payload)
+            count += 1000
+        best = max(best, count / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    payload = bytearray(b"I (1234) ir: sent 0xE0E006F9 in 67ms\n".ljust(58, b"\0"))
+    before = decodes_per_second(legacy_decode, Legacy_LogPart, payload)
+    after = decodes_per_second(compiled_decode, Six15_API.Response.LogPart, payload)
+    print("LogPart decode:")
+    print(f"    before: {before:12.0f} responses/s")
+    print(f"    after:  {after:12.0f} responses/s ({after / before:.2f}x)")
+
+    legacy = Legacy_LogPart(payload)
+    compiled = Six15_API.Response.LogPart(payload)
+    print(f"    instance has __dict__: before:{hasattr(legacy, '__dict__')} after:{hasattr(compiled, '__dict__')}")
+
+
+if __name__ == "__main__":
+    main()
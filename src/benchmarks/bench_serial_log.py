@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Feeds a device log through a pseudo terminal, as fast as the port reader takes it and at a fixed rate,
+# and compares Serial_LogWatcher.readPort() with the readline() loop it replaced: lines per second, and CPU time of the reading thread.
+# Needs pyserial and a system with pseudo terminals (Linux, macOS).
+# Run from the src directory: python3 -m benchmarks.bench_serial_log
+
+import os
+import resource
+import threading
+import time
+from typing import Callable, Tuple
+import serial
+from lib_six15_api.logger import Logger, Log_Sink
+from lib_six15_api.serial_log_watcher import Serial_LogWatcher
+
+FLOOD_LINES = 200_000
+RATE_BYTES_PER_SECOND = 2_000_000 // 10  # A 2 Mbaud UART
+RATE_SECONDS = 3.0
+LINE = "I (123456) ir: sent 0xE0E006F9 repeat 0\n"
+
+
+class Counting_Log_Sink(Log_Sink):
+    def __init__(self) -> None:
+        self.count = 0
+
+    def post(self, record):
+        self.count += 1
+
+    def postMany(self, records):
+        self.count += len(records)
+
+
+def oldReadPort(dev: serial.Serial, abortFunc: Callable[[], bool]):
+    # What Serial_LogWatcher.run() used to do once connected.
+    data = bytearray(0)
+    while (not abortFunc()):
+        data += dev.readline()
+        if (len(data) == 0):
+            time.sleep(0.1)
+            continue
+        line = data.decode(errors='replace')
+        if (not line.endswith("\n")):
+            continue
+        data = bytearray(0)
+        line = line.rstrip()
+        level = Logger.prefixedLevel(line)
+        Logger.log(level, "%s%s", "  ", line)
+
+
+def feed(master: int, total_lines: int, bytes_per_second: float, deadline: float):
+    # Gives up at deadline, when the reader does. Otherwise a full pseudo terminal would block it forever.
+    block = (LINE * 100).encode()
+    start = time.perf_counter()
+    sent = 0
+    os.set_blocking(master, False)
+    for _ in range(total_lines // 100):
+        offset = 0
+        while (offset < len(block)):
+            try:
+                offset += os.write(master, block[offset:])
+            except BlockingIOError:
+                if (time.perf_counter() > deadline):
+                    return
+                time.sleep(0.001)
+        sent += len(block)
+        if (bytes_per_second != 0):
+            delay = start + sent / bytes_per_second - time.perf_counter()
+            if (delay > 0):
+                time.sleep(delay)
+
+
+def measure(readPort, total_lines: int, bytes_per_second: float) -> Tuple[int, float, float]:
+    # Returns (lines received, seconds, CPU seconds of the reading thread) to receive total_lines, or until it gave up.
+    master, slave = os.openpty()
+    sink = Counting_Log_Sink()
+    Logger.addSink(sink)
+    results = {}
+    with serial.Serial(os.ttyname(slave), 115200, timeout=Serial_LogWatcher.READ_TIMEOUT_SECONDS) as dev:
+        def reader():
+            cpu_start = resource.getrusage(resource.RUSAGE_THREAD)
+            readPort(dev, lambda: sink.count >= total_lines or time.perf_counter() > deadline)
+            cpu_end = resource.getrusage(resource.RUSAGE_THREAD)
+            results["cpu"] = (cpu_end.ru_utime + cpu_end.ru_stime) - (cpu_start.ru_utime + cpu_start.ru_stime)
+            results["end"] = time.perf_counter()
+
+        start = time.perf_counter()
+        deadline = start + 60
+        thread = threading.Thread(target=reader)
+        thread.start()
+        feed(master, total_lines, bytes_per_second, deadline)
+        thread.join()
+    os.close(master)
+    os.close(slave)
+    Logger.removeSink(sink)
+    if (sink.count < total_lines):
+        print(f"    only got {sink.count} of {total_lines} lines")
+    return min(sink.count, total_lines), results["end"] - start, results["cpu"]
+
+
+def main():
+    watcher = Serial_LogWatcher(0, 0)
+    for name, readPort in [("readline() loop", oldReadPort), ("Serial_LogWatcher", watcher.readPort)]:
+        received, seconds, cpu = measure(readPort, FLOOD_LINES, 0)
+        print(f"{name:>18}, flood:     {received / seconds:9.0f} lines/s ({received * len(LINE) * 10 / seconds / 1e6:5.1f} Mbaud), {cpu / seconds * 100:5.1f}% CPU")
+        lines = int(RATE_BYTES_PER_SECOND * RATE_SECONDS / len(LINE)) // 100 * 100
+        received, seconds, cpu = measure(readPort, lines, RATE_BYTES_PER_SECOND)
+        print(f"{name:>18}, 2 Mbaud:   {received / seconds:9.0f} lines/s, {cpu / seconds * 100:5.1f}% CPU")
+
+
+if __name__ == "__main__":
+    main()
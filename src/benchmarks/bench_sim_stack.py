@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Benchmarks the whole client stack (Framework_IR, reactor, HID framing) against the simulated firmware.
+# Run from the src directory: python3 -m benchmarks.bench_sim_stack
+
+import time
+import framework_ir_six15_api as Six15_API
+from framework_ir_sim import Framework_IR_Sim
+
+
+def commands_per_second(seconds: float = 1.0, latency: float = 0.0, jitter: float = 0.0) -> float:
+    framework_ir = Framework_IR_Sim.open(None, latency, jitter)
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        framework_ir.queryMicroVersion()
+        count += 1
+    rate = count / (time.perf_counter() - start)
+    framework_ir.close()
+    return rate
+
+
+def log_bytes_per_second(seconds: float = 1.0) -> float:
+    # The firmware logs faster than it can be read, so this is how fast the host drains the log.
+    firmware = Framework_IR_Sim(log_bytes_per_second=10_000_000)
+    framework_ir = Framework_IR_Sim.open(firmware)
+    received = 0
+
+    def lineFunc(line: str):
+        nonlocal received
+        received += len(line) + 1
+
+    start = time.perf_counter()
+    end = start + seconds
+    framework_ir.readLog(lineFunc, lambda: time.perf_counter() > end)
+    rate = received / (time.perf_counter() - start)
+    framework_ir.close()
+    return rate
+
+
+def lossy_commands(count: int = 50, loss: float = 0.1) -> int:
+    # Lost responses surface as timeouts, make sure the stack keeps going after them.
+    framework_ir = Framework_IR_Sim.open(None, loss=loss, seed=1)
+    timeouts = 0
+    for _ in range(count):
+        try:
+            framework_ir.sendCommand(Six15_API.CMD.VERSION_MICRO, None, 10)
+        except TimeoutError:
+            timeouts += 1
+    framework_ir.close()
+    return timeouts
+
+
+def main():
+    print(f"VERSION_MICRO, no latency:       {commands_per_second():10.0f} commands/s")
+    print(f"VERSION_MICRO, 1ms latency:      {commands_per_second(latency=0.001):10.0f} commands/s")
+    print(f"VERSION_MICRO, 1ms + 2ms jitter: {commands_per_second(latency=0.001, jitter=0.002):10.0f} commands/s")
+    print(f"READ_LOG drain:                  {log_bytes_per_second():10.0f} bytes/s")
+    print(f"10% loss: {lossy_commands()} of 50 commands timed out")
+
+
+if __name__ == "__main__":
+    main()
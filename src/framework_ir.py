@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import os
-from typing import Callable, Optional
+import json
+import re
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
 
 # os.environ['PYUSB_DEBUG'] = 'debug' # uncomment for verbose pyusb output
 import sys
@@ -12,8 +14,13 @@ import time
 from generated import app_version as AppVersion
 import framework_ir_six15_api as Six15_API
 from lib_six15_api.six15_api_backend import Six15_API_Backend
-from framework_ir_six15_api import Framework_IR_Six15_API
-from lib_six15_api.logger import Logger
+from framework_ir_six15_api import Framework_IR_Six15_API, AsyncFramework_IR_Six15_API
+from lib_six15_api.six15_api_async import Six15_API_Backend_Async_Reactor
+from lib_six15_api.six15_api_stats import Six15_API_Stats
+from lib_six15_api.log_line_assembler import Log_Line_Assembler, Log_Line_Batch
+from lib_six15_api.log_index import Log_Index, Log_Query
+from lib_six15_api.log_store import Log_Store
+from lib_six15_api.logger import Logger, LogLevel, Log_Record
 import lib_six15_api.stm32_firmware_updater as STM32_Firmware_Update
 
 NUM_CHARGER_BAYS = 4
@@ -24,37 +31,62 @@ class Framework_IR(Framework_IR_Six15_API):
     REBOOT_TO_BOOTLOADER_DELAY_SECONDS = 2
     REBOOT_TO_DISCONNECT_DELAY_SECONDS = 0.5
 
-    def __init__(self, backend: Six15_API_Backend, *args) -> None:
-        super().__init__(backend, False, *args)
+    LOG_PARTIAL_LINE_WARNING = "<Warning, log ended with partial line>"
+    LOG_BATCH_MAX_LINES = 256
+    LOG_SEARCH_POLL_SECONDS = 0.1
+
+    def __init__(self, backend: Six15_API_Backend, fake: bool = False, *args) -> None:
+        super().__init__(backend, fake, *args)
         self.backend = backend
 
     def readLog(self, lineFunc: Callable[[str], None], abortFunc: Callable[[None], bool]):
+        for line in self.iter_log_lines(abortFunc):
+            lineFunc(line)
+
+    def iter_log_lines(self, abortFunc: Optional[Callable[[], bool]] = None, batch: bool = False) -> Iterator[Union[str, Log_Line_Batch]]:
+        # Drains the device log, yielding each complete line as soon as the part that ends it arrives.
+        # With batch, yields Log_Line_Batches instead: everything read in one drain, split every LOG_BATCH_MAX_LINES lines,
+        # with when each line arrived.
+        # Stops once the device has nothing more to send.
+        assembler = Log_Line_Assembler()
+        lines_batch: List[str] = []
+        received_batch: List[int] = []
         keepReading = True
-        partial_line = ""
-        while keepReading and not abortFunc():
+        while keepReading and (abortFunc == None or not abortFunc()):
             log_part: Optional[Six15_API.Response.LogPart] = self.sendCommand(Six15_API.CMD.READ_LOG, None, 100)
             if (log_part == None):
                 break
-            lines = log_part.msg.splitlines(keepends=True)
-            if (len(lines) != 0):
-                lines[0] = partial_line + lines[0]
-                partial_line = ""
-                lastHasEnd = lines[-1].endswith("\n")
-                if (not lastHasEnd):
-                    partial_line = lines[-1]
-                    del lines[-1]
-                for line in lines:
-                    line = line.strip("\r\n")
-                    # print(f"line:{line}")
-                    lineFunc(line)
+            lines = assembler.feed(log_part.raw)
+            if (batch):
+                lines_batch += lines
+                received_batch += [log_part.received_ns] * len(lines)
+                if (len(lines_batch) >= Framework_IR.LOG_BATCH_MAX_LINES):
+                    yield Log_Line_Batch(lines_batch, received_batch)
+                    lines_batch = []
+                    received_batch = []
+            else:
+                yield from lines
             keepReading = not log_part.log_finished
-            # print(f"Log Part:{log_part.msg}")
-        if (partial_line != ""):
-            lineFunc("<Warning, log ended with partial line>")
+        if (assembler.hasPartial()):
+            if (batch):
+                lines_batch.append(Framework_IR.LOG_PARTIAL_LINE_WARNING)
+                received_batch.append(time.monotonic_ns())
+            else:
+                yield Framework_IR.LOG_PARTIAL_LINE_WARNING
+        if (batch and len(lines_batch) != 0):
+            yield Log_Line_Batch(lines_batch, received_batch)
 
 
     def parseForArgs():
         parser = argparse.ArgumentParser(description='Framework IR CLI')
+        parser.add_argument("--sim", action="store_true", help="Use a simulated device instead of a real one")
+        parser.add_argument("--sim-latency-ms", type=float, default=1.0, help="Simulated device response latency")
+        parser.add_argument("--sim-jitter-ms", type=float, default=0.0, help="Up to this much extra latency per simulated response")
+        parser.add_argument("--sim-loss", type=float, default=0.0, help="Chance (0 to 1) that a simulated response is lost")
+        parser.add_argument("--capture", metavar="TRACE_FILE", help="Record all device traffic to a trace file")
+        parser.add_argument("--replay", metavar="TRACE_FILE", help="Use a recorded trace instead of a device")
+        parser.add_argument("--replay-realtime", action="store_true", help="Replay responses at the speed they were recorded, instead of as fast as possible")
+        parser.add_argument("--log-file", metavar="FILE", help="Also append everything logged to this file, with timestamps")
         sub_parsers = parser.add_subparsers(dest="sub_command", required=True)
 
         # Version
@@ -66,29 +98,160 @@ class Framework_IR(Framework_IR_Six15_API):
         # Reboot Bootloader
         sub_parsers.add_parser("reboot_bootloader",  help="Reboot the system and jump to the bootloader")
 
+        # Stats
+        stats_parser = sub_parsers.add_parser("stats", help="Exercise the device for a while, then print command latencies and traffic counters")
+        stats_parser.add_argument("--seconds", type=float, default=5.0)
+        stats_parser.add_argument("--json", action="store_true", help="Print the stats as JSON")
+
+        # Log
+        log_parser = sub_parsers.add_parser("log", help="Work with the device log")
+        log_sub_parsers = log_parser.add_subparsers(dest="log_command", required=True)
+        log_search_parser = log_sub_parsers.add_parser("search", help="Read the device log and print the lines that match")
+        log_search_parser.add_argument("text", nargs="?", default="", help="Text to look for, ignoring case. Matches every line if left out")
+        log_search_parser.add_argument("--regex", action="store_true", help="Treat text as a regular expression")
+        log_search_parser.add_argument("--level", choices=["verbose", "info", "warn", "error"], help="Only lines at this level or above")
+        log_search_parser.add_argument("--module", help="Only lines from this firmware module, like \"ir\" in \"I (1234) ir: sent 0xE0E006F9\"")
+        log_search_parser.add_argument("--seconds", type=float, default=0.0, help="Keep reading the log for this long, instead of only what the device has buffered")
+        log_search_parser.add_argument("--store", nargs="?", const=Framework_IR.defaultLogStoreDirectory(), metavar="DIR",
+                                       help=f"Search the device log saved by the GUI instead of reading the device. DIR defaults to {Framework_IR.defaultLogStoreDirectory()}")
+
         # Flash STM32 FW
         flash_stm32_fw_parser = sub_parsers.add_parser("flash_stm32_fw", help="Flash and Verify the STM32 microcontroller")
         flash_stm32_fw_parser.add_argument("file_name")
+        flash_stm32_fw_parser.add_argument("--full", action="store_true",
+                                           help="Erase and write every page, instead of only the ones that changed since this device was last flashed")
+        flash_stm32_fw_parser.add_argument("--dry-run", action="store_true",
+                                           help="Print what would be erased and written, and about how many USB transfers it would take, without flashing")
+        flash_stm32_fw_parser.add_argument("--address", type=lambda x: int(x, 0), help="Where a .bin file goes, like 0x08000000. Other formats have their addresses in them")
+        flash_stm32_fw_parser.add_argument("--mass-erase", action="store_true",
+                                           help="Allow erasing the whole flash when most of it changes, which is faster, but also wipes pages outside the image, like settings")
+
+        # Verify STM32 FW
+        verify_stm32_fw_parser = sub_parsers.add_parser("verify_stm32_fw", help="Verify the STM32 microcontroller's firmware, without flashing it")
+        verify_stm32_fw_parser.add_argument("file_name")
+        verify_stm32_fw_parser.add_argument("--address", type=lambda x: int(x, 0), help="Where a .bin file goes, like 0x08000000. Other formats have their addresses in them")
 
         args = parser.parse_args()
         return args
 
-    def flashAndVerifySTM32InBootloader(file_name):
+    def flashAndVerifySTM32InBootloader(file_name, full: bool = False, dry_run: bool = False, bin_address: Optional[int] = None, allow_mass_erase: bool = False):
         def callback(finished: bool, is_verify: bool, percent_complete: float):
             stage = "Verify" if is_verify else "Flash"
             print(f"\r {stage} Progress:{percent_complete:3.0f} ", end="\n" if finished else "")
-        verify_ok = STM32_Firmware_Update.flash_and_verify_STM32_FW(file_name, True, True, callback)
+        manifest_directory = None if full else Framework_IR.defaultFlashManifestDirectory()
+        if (dry_run):
+            STM32_Firmware_Update.plan_STM32_FW(file_name, manifest_directory, bin_address, allow_mass_erase)
+            return
+        verify_ok = STM32_Firmware_Update.flash_and_verify_STM32_FW(file_name, True, True, callback, manifest_directory, bin_address, allow_mass_erase)
         verify_ok_str = "OK" if verify_ok else "FAIL"
         Logger.info(f"Verify Result: {verify_ok_str}")
 
-    def verifySTM32InBootloader(file_name):
+    def verifySTM32InBootloader(file_name, bin_address: Optional[int] = None):
         def callback(finished: bool, is_verify: bool, percent_complete: float):
             stage = "Verify" if is_verify else "Flash"
             print(f"\r {stage} Progress:{percent_complete:3.0f} ", end="\n" if finished else "")
-        verify_ok = STM32_Firmware_Update.flash_and_verify_STM32_FW(file_name, False, True, callback)
+        verify_ok = STM32_Firmware_Update.flash_and_verify_STM32_FW(file_name, False, True, callback, bin_address=bin_address)
         verify_ok_str = "OK" if verify_ok else "FAIL"
         Logger.info(f"Verify Result: {verify_ok_str}")
 
+    def collectStats(self, seconds: float) -> Dict[str, Any]:
+        # Alternates the commands the GUI sends all the time: VERSION_MICRO and reading the whole log.
+        self.setStats(Six15_API_Stats())
+        end_time = time.monotonic() + seconds
+        while (time.monotonic() < end_time):
+            self.queryMicroVersion()
+            self.readLog(lambda line: None, lambda: time.monotonic() >= end_time)
+        stats = self.getStats()
+        self.setStats(None)
+        return stats
+
+    def indexLog(self, seconds: float) -> Log_Index:
+        # Reads the device log into a Log_Index, the same way the GUI logs lines from the device.
+        log_index = Log_Index()
+        end_time = time.monotonic() + seconds
+        timedOut = lambda: time.monotonic() >= end_time
+        drained = False
+        while True:
+            # What the device has buffered is always read, even with seconds 0. Only later reads stop at end_time.
+            for lines, received_ns in self.iter_log_lines(timedOut if drained else None, batch=True):
+                levels = Logger.classifier.levels(lines)
+                log_index.addRecords([Log_Record(line_ns / 1e9, level, f"{Log_Index.DEVICE_PREFIX}{line}") for line_ns, level, line in zip(received_ns, levels, lines)])
+            drained = True
+            if (timedOut()):
+                return log_index
+            time.sleep(Framework_IR.LOG_SEARCH_POLL_SECONDS)
+
+    @staticmethod
+    def defaultStateDirectory() -> str:
+        if (platform.system() == "Windows"):
+            base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+        elif (platform.system() == "Darwin"):
+            base = os.path.expanduser("~/Library/Logs")
+        else:
+            base = os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+        return os.path.join(base, "Framework_IR")
+
+    @staticmethod
+    def defaultLogStoreDirectory() -> str:
+        return os.path.join(Framework_IR.defaultStateDirectory(), "device_logs")
+
+    @staticmethod
+    def defaultFlashManifestDirectory() -> str:
+        return os.path.join(Framework_IR.defaultStateDirectory(), "flash_manifests")
+
+    @staticmethod
+    def logSearchQuery(args) -> Log_Query:
+        levels = None
+        if (args.level != None):
+            min_level = LogLevel[args.level.upper()]
+            levels = frozenset(level for level in LogLevel if level.value >= min_level.value)
+        query = Log_Query(args.text, args.regex, True, levels, module=args.module)
+        # Fail on a bad regex before reading anything.
+        re.compile(query.text if query.regex else "")
+        return query
+
+    def searchLog(self, args) -> int:
+        # Exits like grep: 0 if any line matched, 1 if none did, 2 for a bad regex.
+        if (args.store != None):
+            return Framework_IR.searchStoredLog(args)
+        try:
+            query = Framework_IR.logSearchQuery(args)
+        except re.error as e:
+            Logger.error(f"Bad regex: {e}")
+            return 2
+        log_index = self.indexLog(args.seconds)
+        ids = log_index.search(query)
+        for id in ids:
+            print(log_index.message(id)[len(Log_Index.DEVICE_PREFIX):])
+        return 0 if len(ids) != 0 else 1
+
+    @staticmethod
+    def searchStoredLog(args) -> int:
+        # Searches one segment at a time, so memory use doesn't depend on how much is stored.
+        try:
+            query = Framework_IR.logSearchQuery(args)
+        except re.error as e:
+            Logger.error(f"Bad regex: {e}")
+            return 2
+        file_names = Log_Store.segmentFileNames(args.store)
+        if (len(file_names) == 0):
+            Logger.warn(f"No saved log in {args.store}")
+            return 1
+        # Stored times are time.time(), which works just as well for the index.
+        matches = 0
+        for file_name in file_names:
+            log_index = Log_Index(sys.maxsize)
+            try:
+                log_index.addRecords([Log_Record(line.time, line.level, f"{Log_Index.DEVICE_PREFIX}{line.message}") for line in Log_Store.readLines(file_name)])
+            except (OSError, ValueError, EOFError) as e:
+                Logger.warn(f"Can't read {file_name}: {e}")
+                continue
+            for id in log_index.search(query):
+                record = log_index.record(id)
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.time))}| {record.message[len(Log_Index.DEVICE_PREFIX):]}")
+                matches += 1
+        return 0 if matches != 0 else 1
+
     def send_IR(self, hex_code:int) -> Six15_API.Response_Default:
         return self.sendSimpleCMD(Six15_API.CMD.SEND_SAMSUNG_IR, struct.pack("<I", hex_code))
 
@@ -97,11 +260,13 @@ class Framework_IR(Framework_IR_Six15_API):
             Logger.info(f"GUI/CLI Version: {AppVersion.GIT_VERSION}")
             return 0
         elif (args.sub_command == "flash_stm32_fw"):
-            Framework_IR.flashAndVerifySTM32InBootloader(args.file_name)
+            Framework_IR.flashAndVerifySTM32InBootloader(args.file_name, args.full, args.dry_run, args.address, args.mass_erase)
             return 0
         elif (args.sub_command == "verify_stm32_fw"):
-            Framework_IR.verifySTM32InBootloader(args.file_name)
+            Framework_IR.verifySTM32InBootloader(args.file_name, args.address)
             return 0
+        elif (args.sub_command == "log" and args.log_command == "search" and args.store != None):
+            return Framework_IR.searchStoredLog(args)
         return -1
 
     def handleArgs(self, args) -> int:
@@ -110,6 +275,15 @@ class Framework_IR(Framework_IR_Six15_API):
             version = self.queryMicroVersion()
             Logger.info(f"STM32 Version: {version.major}.{version.minor}")
             Logger.info(f"STM32 Git Version: {version.git_version}")
+        elif (args.sub_command == "stats"):
+            stats = self.collectStats(args.seconds)
+            if (args.json):
+                print(json.dumps(stats, indent=2))
+            else:
+                print(Six15_API_Stats.format(stats))
+        elif (args.sub_command == "log"):
+            if (args.log_command == "search"):
+                return self.searchLog(args)
         elif (args.sub_command == "reboot_bootloader"):
             self.rebootBootloader()
         elif (args.sub_command == "reboot"):
@@ -118,15 +292,44 @@ class Framework_IR(Framework_IR_Six15_API):
             self.rebootBootloader()
             time.sleep(Framework_IR.REBOOT_TO_BOOTLOADER_DELAY_SECONDS)
             Logger.info("")
-            Framework_IR.flashAndVerifySTM32InBootloader(args.file_name)
+            Framework_IR.flashAndVerifySTM32InBootloader(args.file_name, args.full, args.dry_run, args.address, args.mass_erase)
         elif (args.sub_command == "verify_stm32_fw"):
             self.rebootBootloader()
             time.sleep(Framework_IR.REBOOT_TO_BOOTLOADER_DELAY_SECONDS)
             Logger.info("")
-            Framework_IR.verifySTM32InBootloader(args.file_name)
+            Framework_IR.verifySTM32InBootloader(args.file_name, args.address)
         return 0
 
 
+class AsyncFramework_IR(AsyncFramework_IR_Six15_API):
+
+    @staticmethod
+    def fromSync(framework_ir: Framework_IR) -> 'AsyncFramework_IR':
+        # Shares the reactor, so the synchronous Framework_IR can still be used at the same time.
+        return AsyncFramework_IR(Six15_API_Backend_Async_Reactor(framework_ir.reactor), framework_ir)
+
+    async def send_IR(self, hex_code: int, deadline: Optional[float] = None) -> Optional[int]:
+        return await self.sendSimpleCMD(Six15_API.CMD.SEND_SAMSUNG_IR, struct.pack("<I", hex_code), deadline=deadline)
+
+    async def readLog(self, lineFunc: Callable[[str], None]):
+        async for line in self.iter_log_lines():
+            lineFunc(line)
+
+    async def iter_log_lines(self) -> AsyncIterator[str]:
+        # Same as Framework_IR.iter_log_lines(), without batch mode.
+        assembler = Log_Line_Assembler()
+        keepReading = True
+        while keepReading:
+            log_part: Optional[Six15_API.Response.LogPart] = await self.sendCommand(Six15_API.CMD.READ_LOG, None, 100)
+            if (log_part == None):
+                break
+            for line in assembler.feed(log_part.raw):
+                yield line
+            keepReading = not log_part.log_finished
+        if (assembler.hasPartial()):
+            yield Framework_IR.LOG_PARTIAL_LINE_WARNING
+
+
 def main():
     Framework_IR_Gui = __import__("framework_ir_gui")
     sys.exit(Framework_IR_Gui.run_cli())
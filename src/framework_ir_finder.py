@@ -5,6 +5,8 @@ from framework_ir import Framework_IR
 from lib_six15_api.six15_api_backend import Six15_API_Backend
 from lib_six15_api.six15_api_backend_hid import Six15_API_Backend_HID
 import lib_six15_api.pydfu as PyDfu
+from lib_six15_api.hotplug_monitor import Hotplug_Monitor
+from lib_six15_api.six15_api_backend_capture import Six15_API_Backend_Capture
 
 import usb.core
 from typing import Optional, Callable
@@ -15,8 +17,16 @@ hasSleptOnce = False
 
 class Framework_IR_Finder(object):
 
-    def __init__(self) -> None:
+    def __init__(self, capture_file_name: Optional[str] = None) -> None:
         super().__init__()
+        # When set, the traffic of every device found is recorded to this trace file.
+        self.capture_file_name = capture_file_name
+
+    @staticmethod
+    def watchHotplug() -> Hotplug_Monitor:
+        monitor = Hotplug_Monitor.instance()
+        monitor.watch(Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR, lambda: Six15_API_Backend_HID.isPresent(Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR))
+        return monitor
 
     def getFramework_IR(self) -> Optional[Framework_IR]:
         backend = self.getFramework_IR_HID()
@@ -29,6 +39,8 @@ class Framework_IR_Finder(object):
             # For FTDI, finding an FTDI chip doesn't mean we have a connected device
             backend.close()
             return None
+        if (self.capture_file_name != None):
+            backend = Six15_API_Backend_Capture(backend, self.capture_file_name)
         charger = Framework_IR(backend)
         return charger
 
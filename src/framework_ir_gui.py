@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import argparse
 import sys
 import os
 import datetime
@@ -6,11 +7,12 @@ import time
 import struct
 import traceback
 import signal
+import re
 import usb.core
-from typing import Optional
+from typing import List, Optional, Sequence
 from PySide6.QtWidgets import QMainWindow, QApplication, QWidget, QMessageBox, QSizePolicy, QSpacerItem, QGridLayout, QFileDialog, QLabel, QGroupBox, QFrame, QPushButton
 from PySide6.QtCore import QThread, QSettings, QTimer, Qt, Signal
-from PySide6.QtGui import QDragMoveEvent, QDropEvent, QPaintEvent, QCloseEvent, QColor, QIcon, QColorConstants, QCursor
+from PySide6.QtGui import QDragMoveEvent, QDropEvent, QPaintEvent, QCloseEvent, QColor, QIcon, QColorConstants, QCursor, QKeySequence, QShortcut
 from generated import main_window_ui as Main_Window_UI
 from generated import app_version as AppVersion
 from ui_device_watcher import Framework_IR_DeviceListenThread, Framework_IR_DeviceDisconnectThread
@@ -19,13 +21,21 @@ from lib_six15_api.sys_exception_hook import SysExceptionHook
 import part_numbers as PartNumbers
 from framework_ir import Framework_IR
 from framework_ir_finder import Framework_IR_Finder
+from framework_ir_sim import Framework_IR_Sim
+from lib_six15_api.six15_api_backend_capture import Six15_API_Backend_Capture, Six15_API_Backend_Replay
 from lib_six15_api.serial_log_watcher import Serial_LogWatcher
 from framework_ir_log_watcher import Framework_IR_LogWatcher
+from ui_diagnostics_dialog import Diagnostics_Dialog
 import framework_ir_six15_api as Six15_API
-from lib_six15_api.logger import Logger, LogLevel, LoggerImpl
+from lib_six15_api.logger import File_Log_Sink, Logger, LogLevel, Log_Record
+from lib_six15_api.logger_qt import Qt_Log_Sink
+from lib_six15_api.log_index import Log_Index, Log_Query
+from lib_six15_api.log_store import Log_Store_Writer
+from ui_event_log_model import Event_Log_Model, Log_Search_Model
 from firmware_update_thread import FPGA_FirmwareUpdateThread
 from thread_debug import DEBUG_THREADS
 import lib_six15_api.stm32_firmware_updater as STM32_Firmware_Update
+from lib_six15_api.firmware_image import Firmware_Image
 
 APPLICATION_NAME: str = "Framework_IR"
 
@@ -37,11 +47,34 @@ class Window(QMainWindow):
     framework_ir_bootloader: Optional[usb.core.Device] = None
     any_update_state_in_progress: bool = False
 
-    event_log_lines: str = ""
 
     settings: QSettings = QSettings(QSettings.Scope.UserScope, "RepTech", APPLICATION_NAME)
     SETTING_STM32_FW_FILE_NAME: str = "stm32_fw_file_name"
 
+    EVENT_LOG_CAPACITY = 100_000  # Lines kept in the event log, older ones are dropped.
+    LOG_FILTER_DELAY_MS = 150  # Wait for typing to pause before searching.
+
+    # (Text, lowest level shown)
+    LOG_FILTER_LEVELS = [
+        ("Any level", None),
+        ("Info and up", LogLevel.INFO),
+        ("Warnings and up", LogLevel.WARN),
+        ("Errors", LogLevel.ERROR),
+    ]
+    # (Text, Log_Index source)
+    LOG_FILTER_SOURCES = [
+        ("Host and device", None),
+        ("Host", Log_Index.SOURCE_HOST),
+        ("Device", Log_Index.SOURCE_DEVICE),
+    ]
+    # (Text, seconds back)
+    LOG_FILTER_TIMES = [
+        ("Any time", None),
+        ("Last minute", 60),
+        ("Last 10 minutes", 10 * 60),
+        ("Last hour", 60 * 60),
+    ]
+
     ##### Start Class Override Functions #####
 
     def __init__(self):
@@ -55,10 +88,20 @@ class Window(QMainWindow):
         self.setWindowIcon(QIcon(icon_path))
 
         self.isClosing = False
+        self.diagnostics_dialog: Optional[Diagnostics_Dialog] = None
         main_window_content = QWidget(self)
         self.ui = Main_Window_UI.Ui_Form()
-        self.logger = LoggerImpl(self.loggerImpl)
-        self.logger.makeDefault(True)
+        self.event_log_model = Event_Log_Model(Window.EVENT_LOG_CAPACITY, self)
+        # For the filter bar. Like the event log, only the latest EVENT_LOG_CAPACITY lines, so memory stays flat in long sessions.
+        self.log_index = Log_Index(Window.EVENT_LOG_CAPACITY)
+        self.log_search_model = Log_Search_Model(self.log_index, self)
+        self.log_query: Optional[Log_Query] = None
+        self.log_filter_timer = QTimer(self)
+        self.log_filter_timer.setSingleShot(True)
+        # Lines from the device are also saved to disk.
+        self.log_store = Log_Store_Writer(Framework_IR.defaultLogStoreDirectory())
+        self.log_sink = Qt_Log_Sink(self.loggerBatchImpl)
+        Logger.addSink(self.log_sink)
         self.ui.setupUi(main_window_content)
 
         self.center_on_cursor_screen()
@@ -110,7 +153,7 @@ class Window(QMainWindow):
         url_path = url.toLocalFile()
         if (url_path == None):
             return None
-        if not url_path.endswith((".dfu")):
+        if not url_path.lower().endswith(Firmware_Image.EXTENSIONS):
             return None
         return url_path
 
@@ -124,8 +167,7 @@ class Window(QMainWindow):
     def dropEvent(self, event: QDropEvent):
         fileName = Window.validateDragEvent(event)
         if fileName != None:
-            if fileName.endswith(".dfu"):
-                self.ui.lineEdit_stm32_fw_file_name.setText(fileName)
+            self.ui.lineEdit_stm32_fw_file_name.setText(fileName)
             self.updateFlashEnableUiState()
 
     def closeEvent(self, event: QCloseEvent) -> None:
@@ -149,10 +191,14 @@ class Window(QMainWindow):
         self.backgroundDeviceThread = None
         self.backgroundBootloaderThread = None
         self.backgroundLogThread = None
+        self.log_store.close()
 
         if (self.framework_ir):
             self.framework_ir.close()
             self.framework_ir = None
+        # Anything logged from here on is printed instead.
+        Logger.removeSink(self.log_sink)
+        self.log_sink.close()
         return super().closeEvent(event)
 
     ##### End Class Override Functions #####
@@ -161,9 +207,9 @@ class Window(QMainWindow):
 
     def startLogThread(self):
         if False:
-            self.backgroundLogThread: QThread = Serial_LogWatcher(Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR)
+            self.backgroundLogThread: QThread = Serial_LogWatcher(Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR, log_store=self.log_store)
         else:
-            self.backgroundLogThread: QThread = Framework_IR_LogWatcher()
+            self.backgroundLogThread: QThread = Framework_IR_LogWatcher(self.log_store)
         self.backgroundLogThread.start()
 
     def stopLogThread(self):
@@ -199,22 +245,75 @@ class Window(QMainWindow):
 
     def setInitialState(self):
         # Ideally everything here would be set in QT Creator, but some things can't
+        self.ui.listView_event_log.setModel(self.event_log_model)
+        for text, level in Window.LOG_FILTER_LEVELS:
+            self.ui.comboBox_log_filter_level.addItem(text, level)
+        for text, source in Window.LOG_FILTER_SOURCES:
+            self.ui.comboBox_log_filter_source.addItem(text, source)
+        for text, seconds in Window.LOG_FILTER_TIMES:
+            self.ui.comboBox_log_filter_time.addItem(text, seconds)
         self.ui.label_version_gui_version.setText(f"{AppVersion.GIT_VERSION}")
         self.ui.lineEdit_stm32_fw_file_name.setText(self.settings.value(Window.SETTING_STM32_FW_FILE_NAME))
 
         self.clearStateFromDisconnect()
 
-    def loggerImpl(self, level: LogLevel, message: str):
-        self.appendEventLog(self.ui, Logger.LOG_LEVEL_TO_COLOR[level], f"{message}")
-        if (level == LogLevel.CRITICAL_ERROR):
-            self.showErrorDialog(message)
-
-    @staticmethod
-    def appendEventLog(ui: Main_Window_UI.Ui_Form, color: QColor, message: str):
-        time_str: str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S| ")
-        message = time_str + message
-        html = f"<p style=\"color:{color.name()};white-space:pre\">{message}</p>"
-        ui.plainTextEdit_event_log.appendHtml(html)
+    def loggerBatchImpl(self, records: List[Log_Record]):
+        # Only follow new lines if the user hasn't scrolled up to look at older ones.
+        scroll_bar = self.ui.listView_event_log.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+        first_id = self.log_index.addRecords(records)
+        self.event_log_model.appendRecords(records)
+        if (self.log_query != None):
+            # Matches the index has dropped go, rather than searching everything again.
+            self.log_search_model.dropBefore(self.log_index.first_id)
+            self.log_search_model.appendIds(self.log_index.search(self.log_query, first_id))
+            self.ui.label_log_filter_status.setText(f"{self.log_search_model.rowCount()} matches")
+        if (at_bottom):
+            self.ui.listView_event_log.scrollToBottom()
+        for record in records:
+            if (record.level == LogLevel.CRITICAL_ERROR):
+                self.showErrorDialog(record.message)
+
+    def currentLogQuery(self) -> Optional[Log_Query]:
+        # None when nothing is filtered out.
+        text = self.ui.lineEdit_log_filter.text()
+        min_level: Optional[LogLevel] = self.ui.comboBox_log_filter_level.currentData()
+        source: Optional[int] = self.ui.comboBox_log_filter_source.currentData()
+        seconds: Optional[int] = self.ui.comboBox_log_filter_time.currentData()
+        if (text == "" and min_level == None and source == None and seconds == None):
+            return None
+        levels = None if min_level == None else frozenset(level for level in LogLevel if level.value >= min_level.value)
+        start_time = None if seconds == None else time.monotonic() - seconds
+        return Log_Query(text, self.ui.checkBox_log_filter_regex.isChecked(), True, levels, source, start_time)
+
+    def applyLogFilter(self):
+        self.log_filter_timer.stop()
+        query = self.currentLogQuery()
+        list_view = self.ui.listView_event_log
+        if (query == None):
+            self.log_query = None
+            self.log_search_model.setIds([])
+            self.ui.label_log_filter_status.setText("")
+            if (list_view.model() != self.event_log_model):
+                list_view.setModel(self.event_log_model)
+                list_view.scrollToBottom()
+            return
+        start = time.perf_counter()
+        try:
+            ids = self.log_index.search(query)
+        except re.error as e:
+            self.log_query = None
+            self.ui.label_log_filter_status.setText(f"Bad regex: {e.msg}")
+            Window.setLabelTextColor(self.ui.label_log_filter_status, Qt_Log_Sink.LOG_LEVEL_TO_COLOR[LogLevel.ERROR])
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.log_query = query
+        self.log_search_model.setIds(ids)
+        self.ui.label_log_filter_status.setText(f"{len(ids)} matches ({elapsed_ms:.0f}ms)")
+        Window.setLabelTextColor(self.ui.label_log_filter_status, None)
+        if (list_view.model() != self.log_search_model):
+            list_view.setModel(self.log_search_model)
+        list_view.scrollToBottom()
 
     def showErrorDialog(self, message: str, title="Error") -> None:
         print(f"DialogError: {title}: {message}")
@@ -265,6 +364,8 @@ class Window(QMainWindow):
 
         if (isinstance(self.backgroundLogThread, Framework_IR_LogWatcher)):
             self.backgroundLogThread.set_Framework_IR(self.framework_ir)
+        if (self.diagnostics_dialog != None and self.diagnostics_dialog.isVisible()):
+            self.diagnostics_dialog.attach(self.framework_ir)
 
         if (framework_ir == None):
             Logger.info("#### Device Disconnected: Framework IR")
@@ -327,10 +428,11 @@ class Window(QMainWindow):
         self.updateFlashEnableUiState()
         # self.readAndApplyStateToUI(True)
 
-    def openFileNameDialog(self, title: str, name: str, extension: str):
+    def openFileNameDialog(self, title: str, name: str, extensions: Sequence[str]):
         options: QFileDialog.Option = QFileDialog.Option(0)
         # options |= QFileDialog.DontUseNativeDialog
-        fileName, _ = QFileDialog.getOpenFileName(self, title, "", name + " (*."+extension+");;All Files (*)", options=options)
+        patterns = " ".join("*" + extension for extension in extensions)
+        fileName, _ = QFileDialog.getOpenFileName(self, title, "", name + " (" + patterns + ");;All Files (*)", options=options)
         return fileName
 
     def updateFlashEnableUiState(self):
@@ -342,6 +444,15 @@ class Window(QMainWindow):
 
     def hookEvents(self):
         self.ui.pushButton_clear_log.clicked.connect(self.clear_event_log_clicked)
+        QShortcut(QKeySequence.StandardKey.Copy, self.ui.listView_event_log, self.copy_event_log_selection, context=Qt.ShortcutContext.WidgetShortcut)
+        self.log_filter_timer.timeout.connect(self.applyLogFilter)
+        self.ui.lineEdit_log_filter.textChanged.connect(lambda: self.log_filter_timer.start(Window.LOG_FILTER_DELAY_MS))
+        self.ui.lineEdit_log_filter.returnPressed.connect(self.applyLogFilter)
+        self.ui.checkBox_log_filter_regex.toggled.connect(self.applyLogFilter)
+        self.ui.comboBox_log_filter_level.currentIndexChanged.connect(self.applyLogFilter)
+        self.ui.comboBox_log_filter_source.currentIndexChanged.connect(self.applyLogFilter)
+        self.ui.comboBox_log_filter_time.currentIndexChanged.connect(self.applyLogFilter)
+        self.ui.pushButton_diagnostics.clicked.connect(self.diagnostics_clicked)
 
         self.ui.pushButton_browse_stm32.clicked.connect(self.browse_button_stm32_clicked)
         self.ui.pushButton_update_stm32.clicked.connect(self.update_stm32_button_clicked)
@@ -383,13 +494,25 @@ class Window(QMainWindow):
         self.updateFlashEnableUiState()
 
     def clear_event_log_clicked(self):
-        self.event_log_lines = ""
-        self.ui.plainTextEdit_event_log.clear()
+        self.event_log_model.clear()
+        self.log_index.clear()
+        self.applyLogFilter()
+
+    def copy_event_log_selection(self):
+        model = self.ui.listView_event_log.model()
+        rows = sorted(index.row() for index in self.ui.listView_event_log.selectionModel().selectedIndexes())
+        QApplication.clipboard().setText("\n".join(model.message(row) for row in rows))
+
+    def diagnostics_clicked(self):
+        if (self.diagnostics_dialog == None):
+            self.diagnostics_dialog = Diagnostics_Dialog(self, lambda: self.framework_ir, lambda: self.backgroundLogThread, self.event_log_model)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
 
     def browse_button_stm32_clicked(self):
-        fileName = self.openFileNameDialog("Select a STM32 DFU File", "DFU File", "dfu")
+        fileName = self.openFileNameDialog("Select a STM32 Firmware File", "Firmware File", Firmware_Image.EXTENSIONS)
         if fileName:
-            Logger.info(f"Selected DFU file:{fileName}")
+            Logger.info(f"Selected firmware file:{fileName}")
             self.ui.lineEdit_stm32_fw_file_name.setText(fileName)
             self.updateFlashEnableUiState()
 
@@ -438,7 +561,8 @@ class Window(QMainWindow):
                 # This avoids "not responding" in windows.
                 QApplication.processEvents()
 
-            verify_ok = STM32_Firmware_Update.flash_and_verify_STM32_FW(fw_file_name, True, True, stm32_fw_status_callback)
+            verify_ok = STM32_Firmware_Update.flash_and_verify_STM32_FW(fw_file_name, True, True, stm32_fw_status_callback,
+                                                                        Framework_IR.defaultFlashManifestDirectory())
             if (verify_ok):
                 Logger.info("STM32 Firmware Update Success. Verification: OK")
             else:
@@ -497,12 +621,36 @@ class Window(QMainWindow):
 def run_cli() -> int:
     args = Framework_IR.parseForArgs()
 
-    framework_ir_finder = Framework_IR_Finder()
-    device = framework_ir_finder.getFramework_IR()
+    if (args.log_file == None):
+        return run_cli_args(args)
+    # Printed as usual, and written to the file.
+    log_file_sink = File_Log_Sink(args.log_file)
+    Logger.addSink(Logger.console_sink)
+    Logger.addSink(log_file_sink)
+    try:
+        return run_cli_args(args)
+    finally:
+        Logger.removeSink(log_file_sink)
+        Logger.removeSink(Logger.console_sink)
+        log_file_sink.close()
+
+
+def run_cli_args(args: argparse.Namespace) -> int:
+    if (args.sim or args.replay):
+        if (args.replay):
+            backend = Six15_API_Backend_Replay(args.replay, args.replay_realtime)
+        else:
+            backend = Framework_IR_Sim.openBackend(None, args.sim_latency_ms / 1000, args.sim_jitter_ms / 1000, args.sim_loss)
+        if (args.capture):
+            backend = Six15_API_Backend_Capture(backend, args.capture)
+        device = Framework_IR(backend, True)
+    else:
+        framework_ir_finder = Framework_IR_Finder(args.capture)
+        device = framework_ir_finder.getFramework_IR()
 
     if (device == None):
         ret = Framework_IR.handleArgsNoDevice(args)
-        if (ret):
+        if (ret == -1):
             Logger.warn('No Device found, exiting.')
         return ret
 
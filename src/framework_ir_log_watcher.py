@@ -1,20 +1,122 @@
+import math
+import threading
 import time
-from typing import Callable, Optional
+from typing import Callable, Optional, Type
 from PySide6.QtCore import QThread, Signal, Slot
 import thread_debug
 from lib_six15_api.logger import Logger
+from lib_six15_api.log_store import Log_Store_Writer
+from lib_six15_api.six15_api import Base_CMD
 from framework_ir import Framework_IR
+import framework_ir_six15_api as Six15_API
+
+
+class Log_Poll_Scheduler:
+    # Decides how long to wait between draining the device log.
+    # readLog() already reads back to back while the device has more, so this is only the wait once the log is empty.
+    # Any lines, or any other command being sent (which usually makes the device log something), go back to polling fast.
+    # Each poll that finds nothing waits twice as long as the last, up to MAX_INTERVAL_SECONDS.
+    MIN_INTERVAL_SECONDS = 0.02
+    MAX_INTERVAL_SECONDS = 2.0
+    RATE_TIME_CONSTANT_SECONDS = 5.0  # lines per second is averaged over about this long
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.interval = Log_Poll_Scheduler.MIN_INTERVAL_SECONDS
+        self.lines_per_second = 0.0
+        self.last_drain_time: Optional[float] = None
+
+    def onDrained(self, lines: int) -> float:
+        # Returns how long to wait before the next poll.
+        now = time.monotonic()
+        with self.lock:
+            if (self.last_drain_time != None):
+                elapsed = now - self.last_drain_time
+                if (elapsed > 0):
+                    weight = 1 - math.exp(-elapsed / Log_Poll_Scheduler.RATE_TIME_CONSTANT_SECONDS)
+                    self.lines_per_second += (lines / elapsed - self.lines_per_second) * weight
+            self.last_drain_time = now
+            if (lines != 0):
+                self.interval = Log_Poll_Scheduler.MIN_INTERVAL_SECONDS
+            else:
+                self.interval = min(self.interval * 2, Log_Poll_Scheduler.MAX_INTERVAL_SECONDS)
+            return self.interval
+
+    def onActivity(self):
+        with self.lock:
+            self.interval = Log_Poll_Scheduler.MIN_INTERVAL_SECONDS
+
+    def getPollInterval(self) -> float:
+        with self.lock:
+            return self.interval
+
+    def getLinesPerSecond(self) -> float:
+        with self.lock:
+            return self.lines_per_second
 
 
 class Framework_IR_LogWatcher(QThread):
     framework_ir: Optional[Framework_IR]
+    ERROR_RETRY_SECONDS = 0.5
 
-    def __init__(self) -> None:
+    def __init__(self, log_store: Optional[Log_Store_Writer] = None) -> None:
+        # Lines are also saved to log_store, if given.
         super().__init__()
         self.framework_ir = None
+        self.scheduler = Log_Poll_Scheduler()
+        self.wake_event = threading.Event()
+        self.log_store = log_store
+        self.log_store_framework_ir: Optional[Framework_IR] = None
 
     def set_Framework_IR(self, framework_ir: Framework_IR):
+        if (self.framework_ir != None):
+            self.framework_ir.removeCommandListener(self.onCommand)
         self.framework_ir = framework_ir
+        if (framework_ir != None):
+            framework_ir.addCommandListener(self.onCommand)
+        self.wake()
+
+    def onCommand(self, cmd: Type[Base_CMD]):
+        if (cmd != Six15_API.CMD.READ_LOG):
+            self.wake()
+
+    def wake(self):
+        self.scheduler.onActivity()
+        self.wake_event.set()
+
+    def getPollInterval(self) -> float:
+        return self.scheduler.getPollInterval()
+
+    def getLinesPerSecond(self) -> float:
+        return self.scheduler.getLinesPerSecond()
+
+    def waitFor(self, seconds: float):
+        # Sleeps in short slices, so interruption and wake() are noticed quickly.
+        end_time = time.monotonic() + seconds
+        while (not self.isInterruptionRequested()):
+            remaining = end_time - time.monotonic()
+            if (remaining <= 0):
+                return
+            if (self.wake_event.wait(min(remaining, Log_Poll_Scheduler.MIN_INTERVAL_SECONDS * 5))):
+                # Commands are answered before anything they log can be read, give the device a moment to log it.
+                self.wake_event.clear()
+                end_time = min(end_time, time.monotonic() + Log_Poll_Scheduler.MIN_INTERVAL_SECONDS)
+
+    def tagLogStore(self, framework_ir: Framework_IR):
+        # Tells the log store which device the lines that follow are from.
+        self.log_store_framework_ir = framework_ir
+        serial_number = None
+        firmware_version = None
+        try:
+            serial = framework_ir.querySerialNumber()
+            if (serial != None):
+                serial_number = serial.serial_number
+            version = framework_ir.queryMicroVersion()
+            if (version != None):
+                firmware_version = f"{version.major}.{version.minor} ({version.git_version})"
+        except Exception as e:
+            Logger.warn(f"Can't tag the saved log with the device: {e}")
+        self.log_store.setDevice(serial_number, firmware_version)
 
     def run(self):
         thread_debug.debug_this_thread()
@@ -23,14 +125,22 @@ class Framework_IR_LogWatcher(QThread):
             try:
                 local_framework_ir: Optional[Framework_IR] = self.framework_ir
                 if (local_framework_ir == None):
-                    time.sleep(0.5)
+                    self.wake_event.clear()
+                    self.waitFor(Framework_IR_LogWatcher.ERROR_RETRY_SECONDS)
                     continue
                 # local_framework_ir.isConnected()
+                log_store = self.log_store
+                if (log_store != None and local_framework_ir is not self.log_store_framework_ir):
+                    self.tagLogStore(local_framework_ir)
 
-                def lineFunc(line: str):
-                    Logger.log_prefixed(line, "  ")
-                local_framework_ir.readLog(lineFunc, self.isInterruptionRequested)
-                time.sleep(0.5)
+                lines = 0
+                self.wake_event.clear()
+                for batch in local_framework_ir.iter_log_lines(self.isInterruptionRequested, batch=True):
+                    lines += len(batch.lines)
+                    levels = Logger.log_prefixed_batch(batch.lines, "  ", batch.received_ns)
+                    if (log_store != None):
+                        log_store.addMany(levels, batch.lines, batch.received_ns)
+                self.waitFor(self.scheduler.onDrained(lines))
             except Exception as e:
                 Logger.error(f"Log Reading Err:{e}")
-                time.sleep(0.5)
+                self.waitFor(Framework_IR_LogWatcher.ERROR_RETRY_SECONDS)
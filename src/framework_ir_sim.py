@@ -0,0 +1,116 @@
+# Simulated Framework IR firmware, see six15_api.h in the FRAMEWORK_IR_display repository for the real one.
+# Pairs with Six15_API_Backend_Sim to run the GUI, CLI and benchmarks without a device.
+
+import struct
+import threading
+import time
+from typing import List, Optional
+import framework_ir_six15_api as Six15_API
+from framework_ir import Framework_IR
+from lib_six15_api.six15_api_backend_sim import Six15_API_Sim_Firmware, Six15_API_Backend_Sim
+from lib_six15_api.logger import Logger
+
+
+class Framework_IR_Sim(Six15_API_Sim_Firmware):
+    VERSION_MAJOR = 1
+    VERSION_MINOR = 0
+    GIT_VERSION = "sim"
+    SERIAL_NUMBER = "SIM000000001"
+
+    LOG_PART_SIZE = Six15_API.Response.LogPart.compiled_size
+    LOG_BUFFER_SIZE = 4096  # Like the firmware, the oldest log is lost when nobody reads it fast enough.
+    REBOOT_SECONDS = 1.0
+
+    STATUS_OK = 0
+    STATUS_BAD_PAYLOAD = 1
+
+    def __init__(self, log_bytes_per_second: float = 200.0, log_chunk_size: int = LOG_PART_SIZE, reboot_seconds: float = REBOOT_SECONDS) -> None:
+        # log_bytes_per_second: how fast the firmware writes to its log.
+        # log_chunk_size: most log bytes sent per READ_LOG. Only a full LogPart tells the host there is more to read.
+        self.log_bytes_per_second = log_bytes_per_second
+        self.log_chunk_size = min(log_chunk_size, Framework_IR_Sim.LOG_PART_SIZE)
+        self.reboot_seconds = reboot_seconds
+        self.lock = threading.Lock()
+        self.ir_codes_sent: List[int] = []
+        self.log_lines_dropped = 0
+        self.in_bootloader = False
+        self.boot()
+
+    def boot(self):
+        self.boot_time = time.monotonic()
+        self.reconnect_time: Optional[float] = None
+        self.log = bytearray()
+        self.log_generated = 0.0  # Log bytes written since boot, including ones already read.
+        self.log_line_count = 0
+        self.writeLog("I (0) main: Framework IR simulator booted")
+
+    def isConnected(self) -> bool:
+        with self.lock:
+            if (self.in_bootloader):
+                return False
+            if (self.reconnect_time != None):
+                if (time.monotonic() < self.reconnect_time):
+                    return False
+                self.boot()
+            return True
+
+    def uptimeMs(self) -> int:
+        return int((time.monotonic() - self.boot_time) * 1000)
+
+    def writeLog(self, line: str):
+        self.log += (line + "\n").encode()
+        self.log_line_count += 1
+        if (len(self.log) > Framework_IR_Sim.LOG_BUFFER_SIZE):
+            # Drop whole lines, so the host never sees half of one.
+            cut = self.log.find(b"\n", len(self.log) - Framework_IR_Sim.LOG_BUFFER_SIZE) + 1
+            self.log_lines_dropped += self.log.count(b"\n", 0, cut)
+            del self.log[:cut]
+
+    def generateLog(self):
+        # Fill in whatever the firmware would have logged since the last command.
+        target = (time.monotonic() - self.boot_time) * self.log_bytes_per_second
+        if (target - self.log_generated > Framework_IR_Sim.LOG_BUFFER_SIZE):
+            # Most of it would be dropped anyway, skip ahead instead of generating it.
+            self.log_generated = target - Framework_IR_Sim.LOG_BUFFER_SIZE
+        while (self.log_generated < target):
+            line = f"I ({self.uptimeMs()}) sim: line {self.log_line_count}"
+            self.writeLog(line)
+            self.log_generated += len(line) + 1
+
+    def handleCommand(self, cmd: int, payload: bytes) -> Optional[bytes]:
+        with self.lock:
+            if (cmd == Six15_API.CMD.VERSION_MICRO.value):
+                return struct.pack(Six15_API.Response.Micro_Version.format(), Framework_IR_Sim.VERSION_MAJOR, Framework_IR_Sim.VERSION_MINOR, Framework_IR_Sim.GIT_VERSION.encode())
+            elif (cmd == Six15_API.CMD.READ_LOG.value):
+                self.generateLog()
+                part = bytes(self.log[:self.log_chunk_size])
+                del self.log[:len(part)]
+                return part + bytes(Framework_IR_Sim.LOG_PART_SIZE - len(part))
+            elif (cmd == Six15_API.CMD.READ_STM32_SERIAL_NUMBER.value):
+                return struct.pack(Six15_API.Response.SerialNumber.format(), Framework_IR_Sim.SERIAL_NUMBER.encode())
+            elif (cmd == Six15_API.CMD.SEND_SAMSUNG_IR.value):
+                if (len(payload) != 4):
+                    return struct.pack(Six15_API.Response_Default.format(), Framework_IR_Sim.STATUS_BAD_PAYLOAD)
+                hex_code = struct.unpack("<I", payload)[0]
+                self.ir_codes_sent.append(hex_code)
+                self.writeLog(f"I ({self.uptimeMs()}) ir: sent 0x{hex_code:08X}")
+                return struct.pack(Six15_API.Response_Default.format(), Framework_IR_Sim.STATUS_OK)
+            elif (cmd == Six15_API.CMD.REBOOT_TO_FIRMWARE.value):
+                self.reconnect_time = time.monotonic() + self.reboot_seconds
+                return None
+            elif (cmd == Six15_API.CMD.REBOOT_TO_BOOTLOADER.value):
+                self.in_bootloader = True
+                return None
+            # The firmware doesn't answer commands it doesn't know.
+            Logger.verbose("Sim: unknown command: 0x%02x", cmd)
+            return None
+
+    @staticmethod
+    def openBackend(firmware: Optional['Framework_IR_Sim'] = None, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, seed: Optional[int] = None) -> Six15_API_Backend_Sim:
+        if (firmware == None):
+            firmware = Framework_IR_Sim()
+        return Six15_API_Backend_Sim.open(firmware, Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR, latency, jitter, loss, seed)
+
+    @staticmethod
+    def open(firmware: Optional['Framework_IR_Sim'] = None, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, seed: Optional[int] = None) -> Framework_IR:
+        return Framework_IR(Framework_IR_Sim.openBackend(firmware, latency, jitter, loss, seed), True)
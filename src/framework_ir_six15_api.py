@@ -1,7 +1,9 @@
 from enum import Enum
 import struct
+import time
 from typing import Dict, Any, Tuple, Optional, Callable
 from lib_six15_api.six15_api import *
+from lib_six15_api.six15_api_async import AsyncSix15_API
 
 # See six15_api.h in the FRAMEWORK_IR_display repository
 # for the other side of this communication protocol.
@@ -12,12 +14,14 @@ PID_FRAMEWORK_IR = 0x2A  # FRAMEWORK_IR (42)
 class Response:
 
     class Micro_Version(Base_Response):
+        __slots__ = ("major", "minor", "git_version")
+
         @staticmethod
         def format() -> Optional[str]:
             return "<BB56s"
 
         def __init__(self, resp):
-            data = Base_Response.unpack_checked(self.format(), resp, self.__class__.__name__)
+            data = self.unpack(resp)
 
             if (data == None):
                 raise ValueError(f"Device did not respond to: {self.__class__.__name__} as expected.")
@@ -27,37 +31,51 @@ class Response:
             self.git_version = Base_Response.decodeToStr(data[2])
 
     class LogPart(Base_Response):
+        __slots__ = ("raw", "log_finished", "received_ns")
+
         @staticmethod
         def format() -> Optional[str]:
             return f"<58s"
 
         def __init__(self, resp):
-            data = Base_Response.unpack_checked(self.format(), resp, self.__class__.__name__)
+            data = self.unpack(resp)
             if (data == None):
                 raise ValueError(f"Device did not respond with: {self.__class__.__name__} as expected.")
 
-            self.msg = Base_Response.decodeToStr(data[0])
+            # The undecoded log bytes. A UTF-8 character can be split between two parts, so decode them with a Log_Line_Assembler.
+            self.raw = data[0].strip(b"\0")
             self.log_finished = data[0][-1] == 0
+            # Responses are parsed on the reactor thread as soon as they're read, so this is when the part arrived.
+            # The same clock as time.monotonic(), so it can be compared with host events.
+            self.received_ns = time.monotonic_ns()
+
+        @property
+        def msg(self) -> str:
+            return Base_Response.decodeToStr(self.raw)
 
     class SerialNumber(Base_Response):
+        __slots__ = ("serial_number",)
+
         @staticmethod
         def format() -> Optional[str]:
             return f"<58s"
 
         def __init__(self, resp):
-            data = Base_Response.unpack_checked(self.format(), resp, self.__class__.__name__)
+            data = self.unpack(resp)
             if (data == None):
                 raise ValueError(f"Device did not respond with: {self.__class__.__name__} as expected.")
 
             self.serial_number = Base_Response.decodeToStr(data[0])
 
     class Framework_IR_State(Base_Response):
+        __slots__ = ("val1", "val2")
+
         @staticmethod
         def format() -> Optional[str]:
             return f"<BB"
 
         def __init__(self, resp):
-            data = Base_Response.unpack_checked(self.format(), resp, self.__class__.__name__)
+            data = self.unpack(resp)
 
             if (data == None):
                 raise ValueError(f"Device did not respond to: {self.__class__.__name__} as expected.")
@@ -82,6 +100,7 @@ class CMD:
     class READ_LOG(Base_CMD):
         value = 0x04
         response = Response.LogPart
+        priority = Six15_API_Reactor.PRIORITY_BACKGROUND
 
     class READ_STM32_SERIAL_NUMBER(Base_CMD):
         value = 0x05
@@ -101,6 +120,9 @@ class Framework_IR_Six15_API(Six15_API):
     def queryMicroVersion(self) -> Optional[Response.Micro_Version]:
         return self.sendCommand(CMD.VERSION_MICRO)
 
+    def querySerialNumber(self) -> Optional[Response.SerialNumber]:
+        return self.sendCommand(CMD.READ_STM32_SERIAL_NUMBER)
+
     def rebootBootloader(self):
         self.sendCommand(CMD.REBOOT_TO_BOOTLOADER)
         self.close()
@@ -112,3 +134,19 @@ class Framework_IR_Six15_API(Six15_API):
     def queryFramework_IR_State(self) -> Optional[Response.Framework_IR_State]:
         return self.sendCommand(CMD.FRAMEWORK_IR_STATE)
 
+
+class AsyncFramework_IR_Six15_API(AsyncSix15_API):
+
+    async def queryMicroVersion(self) -> Optional[Response.Micro_Version]:
+        return await self.sendCommand(CMD.VERSION_MICRO)
+
+    async def querySerialNumber(self) -> Optional[Response.SerialNumber]:
+        return await self.sendCommand(CMD.READ_STM32_SERIAL_NUMBER)
+
+    async def rebootBootloader(self):
+        await self.sendCommand(CMD.REBOOT_TO_BOOTLOADER)
+        await self.close()
+
+    async def reboot(self):
+        await self.sendCommand(CMD.REBOOT_TO_FIRMWARE)
+        await self.close()
@@ -0,0 +1,252 @@
+# Firmware to flash, loaded from a DfuSe .dfu file, Intel HEX, a raw .bin at a given address, or the load segments of an ELF.
+# Every format becomes the same Firmware_Image, a list of elements: data to write at an address.
+#
+# .dfu, .bin and .elf files are memory mapped, and their elements are memoryview slices of the map, so nothing is copied
+# until it's written. Close the image (or use it in a with block) once done with its elements.
+# Bad files raise ValueError.
+
+import mmap
+import os
+import struct
+import zlib
+from typing import Callable, List, NamedTuple, Optional
+
+
+class Firmware_Element(NamedTuple):
+    num: int  # Its index in its target (.dfu), or in the file.
+    addr: int
+    size: int
+    data: memoryview
+
+
+class Firmware_Image:
+    DFU_PREFIX = struct.Struct("<5sBIB")  # signature, version, size, targets
+    DFU_TARGET_PREFIX = struct.Struct("<6sBI255s2I")  # signature, alternate setting, named, name, size, elements
+    DFU_ELEMENT_PREFIX = struct.Struct("<2I")  # address, size
+    DFU_SUFFIX = struct.Struct("<4H3sBI")  # device, product, vendor, dfu, "UFD", length, crc
+
+    HEX_DATA = 0x00
+    HEX_END_OF_FILE = 0x01
+    HEX_EXTENDED_SEGMENT_ADDRESS = 0x02
+    HEX_EXTENDED_LINEAR_ADDRESS = 0x04
+
+    ELF_MAGIC = b"\x7fELF"
+    ELF_CLASS_64 = 2
+    ELF_DATA_BIG_ENDIAN = 2
+    ELF_PT_LOAD = 1
+
+    DFU_EXTENSIONS = (".dfu",)
+    HEX_EXTENSIONS = (".hex", ".ihex")
+    BIN_EXTENSIONS = (".bin",)
+    ELF_EXTENSIONS = (".elf", ".axf", ".out")
+    # What can be loaded without giving an address.
+    EXTENSIONS = DFU_EXTENSIONS + HEX_EXTENSIONS + ELF_EXTENSIONS
+
+    def __init__(self, file_name: str, format: str, elements: List[Firmware_Element],
+                 file_map: Optional[mmap.mmap] = None, view: Optional[memoryview] = None) -> None:
+        self.file_name = file_name
+        self.format = format
+        self.elements = elements
+        # The mapped file the elements are views of, if any.
+        self.file_map = file_map
+        self.view = view
+
+    def __enter__(self) -> 'Firmware_Image':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def size(self) -> int:
+        return sum(element.size for element in self.elements)
+
+    def close(self):
+        # The elements can't be used after this.
+        for element in self.elements:
+            element.data.release()
+        self.elements = []
+        if (self.view != None):
+            self.view.release()
+            self.view = None
+        if (self.file_map != None):
+            try:
+                self.file_map.close()
+            except BufferError:
+                # Views made from the elements still exist, like in the traceback of an error while flashing.
+                # The map is closed once they're gone.
+                pass
+            self.file_map = None
+
+    @staticmethod
+    def load(file_name: str, bin_address: Optional[int] = None) -> 'Firmware_Image':
+        # Picks the loader by the file's extension. A .bin needs bin_address, where its first byte goes.
+        extension = os.path.splitext(file_name)[1].lower()
+        if (extension in Firmware_Image.DFU_EXTENSIONS):
+            return Firmware_Image.fromDfuFile(file_name)
+        if (extension in Firmware_Image.HEX_EXTENSIONS):
+            return Firmware_Image.fromHexFile(file_name)
+        if (extension in Firmware_Image.ELF_EXTENSIONS):
+            return Firmware_Image.fromElfFile(file_name)
+        if (extension in Firmware_Image.BIN_EXTENSIONS):
+            if (bin_address == None):
+                raise ValueError(f"{file_name}: a .bin file needs an address to load it at")
+            return Firmware_Image.fromBinFile(file_name, bin_address)
+        raise ValueError(f"{file_name}: unknown firmware file type, expected one of {', '.join(Firmware_Image.EXTENSIONS + Firmware_Image.BIN_EXTENSIONS)}")
+
+    @staticmethod
+    def fromMappedFile(file_name: str, format: str, parse: Callable[[memoryview], List[Firmware_Element]]) -> 'Firmware_Image':
+        with open(file_name, "rb") as file:
+            if (os.fstat(file.fileno()).st_size == 0):
+                # Empty files can't be mapped.
+                return Firmware_Image(file_name, format, parse(memoryview(b"")))
+            # The map stays valid after the file is closed.
+            file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(file_map)
+        try:
+            return Firmware_Image(file_name, format, parse(view), file_map, view)
+        except BaseException:
+            Firmware_Image(file_name, format, [], file_map, view).close()
+            raise
+
+    @staticmethod
+    def fromDfuFile(file_name: str) -> 'Firmware_Image':
+        return Firmware_Image.fromMappedFile(file_name, "dfu", lambda view: Firmware_Image.parseDfu(file_name, view))
+
+    @staticmethod
+    def parseDfu(file_name: str, view: memoryview) -> List[Firmware_Element]:
+        # A DfuSe file (ST's UM0391): a prefix, targets holding elements, and a suffix.
+        # The suffix has the CRC of everything before it, checked in one pass over the map.
+        suffix_offset = len(view) - Firmware_Image.DFU_SUFFIX.size
+        if (suffix_offset < Firmware_Image.DFU_PREFIX.size):
+            raise ValueError(f"{file_name}: too short for a DFU file")
+        signature, version, size, targets = Firmware_Image.DFU_PREFIX.unpack_from(view, 0)
+        if (signature != b"DfuSe"):
+            raise ValueError(f"{file_name}: not a DfuSe file")
+        device, product, vendor, dfu, ufd, suffix_len, crc = Firmware_Image.DFU_SUFFIX.unpack_from(view, suffix_offset)
+        if (ufd != b"UFD" or suffix_len != Firmware_Image.DFU_SUFFIX.size):
+            raise ValueError(f"{file_name}: bad DFU suffix")
+        computed_crc = 0xFFFFFFFF & -zlib.crc32(view[:-4]) - 1
+        if (computed_crc != crc):
+            raise ValueError(f"{file_name}: CRC error, computed 0x{computed_crc:08x}, expected 0x{crc:08x}")
+
+        elements: List[Firmware_Element] = []
+        offset = Firmware_Image.DFU_PREFIX.size
+        for target_index in range(targets):
+            if (offset + Firmware_Image.DFU_TARGET_PREFIX.size > suffix_offset):
+                raise ValueError(f"{file_name}: target {target_index} is past the end of the file")
+            signature, alt_setting, named, name, target_size, num_elements = Firmware_Image.DFU_TARGET_PREFIX.unpack_from(view, offset)
+            offset += Firmware_Image.DFU_TARGET_PREFIX.size
+            target_end = offset + target_size
+            if (signature != b"Target" or target_end > suffix_offset):
+                raise ValueError(f"{file_name}: target {target_index} is corrupt")
+            for element_index in range(num_elements):
+                if (offset + Firmware_Image.DFU_ELEMENT_PREFIX.size > target_end):
+                    raise ValueError(f"{file_name}: target {target_index} element {element_index} is past the end of the target")
+                addr, size = Firmware_Image.DFU_ELEMENT_PREFIX.unpack_from(view, offset)
+                offset += Firmware_Image.DFU_ELEMENT_PREFIX.size
+                if (offset + size > target_end):
+                    raise ValueError(f"{file_name}: target {target_index} element {element_index} is past the end of the target")
+                elements.append(Firmware_Element(element_index, addr, size, view[offset:offset + size]))
+                offset += size
+            if (offset != target_end):
+                raise ValueError(f"{file_name}: target {target_index} has data after its elements")
+        if (offset != suffix_offset):
+            raise ValueError(f"{file_name}: data after the last target")
+        return elements
+
+    @staticmethod
+    def fromBinFile(file_name: str, addr: int) -> 'Firmware_Image':
+        # The whole file, to be written starting at addr.
+        return Firmware_Image.fromMappedFile(file_name, "bin", lambda view: [Firmware_Element(0, addr, len(view), view[:])] if len(view) != 0 else [])
+
+    @staticmethod
+    def fromElfFile(file_name: str) -> 'Firmware_Image':
+        return Firmware_Image.fromMappedFile(file_name, "elf", lambda view: Firmware_Image.parseElf(file_name, view))
+
+    @staticmethod
+    def parseElf(file_name: str, view: memoryview) -> List[Firmware_Element]:
+        # The file contents of each PT_LOAD segment, at its physical (load) address. That's where a linker puts
+        # what goes in flash, including the initial values of RAM variables, which run at a different virtual address.
+        if (len(view) < 16 or view[:4] != Firmware_Image.ELF_MAGIC):
+            raise ValueError(f"{file_name}: not an ELF file")
+        is_64 = view[4] == Firmware_Image.ELF_CLASS_64
+        endian = ">" if view[5] == Firmware_Image.ELF_DATA_BIG_ENDIAN else "<"
+        header = struct.Struct(endian + ("HHIQQQIHHHHHH" if is_64 else "HHIIIIIHHHHHH"))
+        program_header = struct.Struct(endian + ("IIQQQQQQ" if is_64 else "IIIIIIII"))
+        if (len(view) < 16 + header.size):
+            raise ValueError(f"{file_name}: ELF header is cut off")
+        e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags, e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx = header.unpack_from(view, 16)
+        if (e_phnum != 0 and (e_phentsize < program_header.size or e_phoff + e_phnum * e_phentsize > len(view))):
+            raise ValueError(f"{file_name}: ELF program headers are corrupt")
+
+        segments = []
+        for index in range(e_phnum):
+            fields = program_header.unpack_from(view, e_phoff + index * e_phentsize)
+            if (is_64):
+                p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_align = fields
+            else:
+                p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align = fields
+            if (p_type != Firmware_Image.ELF_PT_LOAD or p_filesz == 0):
+                continue
+            if (p_offset + p_filesz > len(view)):
+                raise ValueError(f"{file_name}: ELF segment {index} is past the end of the file")
+            segments.append((p_paddr, p_offset, p_filesz))
+        segments.sort()
+        return [Firmware_Element(num, addr, size, view[offset:offset + size]) for num, (addr, offset, size) in enumerate(segments)]
+
+    @staticmethod
+    def fromHexFile(file_name: str) -> 'Firmware_Image':
+        # Intel HEX is text, so unlike the other formats its data is decoded into memory.
+        # Records next to each other are joined into one element.
+        base = 0
+        # [address, bytearray] of each run of records, in file order.
+        runs: List[list] = []
+        run_end = None
+        with open(file_name, "r", encoding="ascii", errors="replace") as file:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if (len(line) == 0):
+                    continue
+                if (not line.startswith(":")):
+                    raise ValueError(f"{file_name}:{line_number}: not an Intel HEX record")
+                try:
+                    record = bytes.fromhex(line[1:])
+                except ValueError:
+                    raise ValueError(f"{file_name}:{line_number}: not hex") from None
+                if (len(record) < 5 or len(record) != record[0] + 5):
+                    raise ValueError(f"{file_name}:{line_number}: wrong record length")
+                if (sum(record) & 0xFF != 0):
+                    raise ValueError(f"{file_name}:{line_number}: checksum error")
+                record_type = record[3]
+                if (record_type == Firmware_Image.HEX_DATA):
+                    addr = base + ((record[1] << 8) | record[2])
+                    if (addr != run_end):
+                        runs.append([addr, bytearray()])
+                    runs[-1][1] += record[4:-1]
+                    run_end = addr + record[0]
+                elif (record_type == Firmware_Image.HEX_END_OF_FILE):
+                    break
+                elif (record_type in (Firmware_Image.HEX_EXTENDED_SEGMENT_ADDRESS, Firmware_Image.HEX_EXTENDED_LINEAR_ADDRESS)):
+                    if (record[0] != 2):
+                        raise ValueError(f"{file_name}:{line_number}: wrong address record length")
+                    upper = (record[4] << 8) | record[5]
+                    base = upper << 4 if record_type == Firmware_Image.HEX_EXTENDED_SEGMENT_ADDRESS else upper << 16
+                # Start address records don't matter for flashing.
+
+        # Some tools write records out of order, so runs are sorted, and joined again where they meet.
+        runs.sort(key=lambda run: run[0])
+        merged: List[list] = []
+        for addr, data in runs:
+            if (len(merged) != 0 and merged[-1][0] + len(merged[-1][1]) == addr):
+                merged[-1][1] += data
+            else:
+                merged.append([addr, data])
+        return Firmware_Image(file_name, "hex", [Firmware_Element(num, addr, len(data), memoryview(data)) for num, (addr, data) in enumerate(merged)])
+
+    def describe(self) -> List[str]:
+        # A line for the file, and one for each element.
+        lines = [f"{self.file_name}: {self.format}, {len(self.elements)} elements, {self.size()} bytes"]
+        for element in self.elements:
+            lines.append(f"    {element.num}, address: 0x{element.addr:08x}, size: {element.size}")
+        return lines
+
@@ -0,0 +1,68 @@
+# Remembers what was last flashed to each STM32, by serial number, so the next update only has to write the pages that changed.
+#
+# Each device gets one JSON file:
+#   {"format": 1, "serial_number": <str>, "file_name": <str or null>, "flashed": <unix time>, "pages": {"<page address in hex>": "<hash>", ...}}
+# The hashes are pydfu.hash_page() of what each page should hold.
+# A manifest is forgotten before flashing starts, and only saved again once the device verified, so an interrupted or failed update
+# never leaves one behind that doesn't match the device.
+
+import json
+import os
+import re
+import time
+from typing import Dict, Optional
+from lib_six15_api.logger import Logger
+
+
+class Flash_Manifest_Store:
+    FORMAT_VERSION = 1
+    FILE_PREFIX = "stm32_"
+    EXTENSION = ".json"
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def fileName(self, serial_number: str) -> str:
+        tag = re.sub(r"[^A-Za-z0-9]+", "-", serial_number)
+        return os.path.join(self.directory, f"{Flash_Manifest_Store.FILE_PREFIX}{tag}{Flash_Manifest_Store.EXTENSION}")
+
+    def load(self, serial_number: str) -> Optional[Dict[int, str]]:
+        # Page hashes by page address, or None if nothing usable was saved for this device.
+        try:
+            with open(self.fileName(serial_number), "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if (manifest.get("format") != Flash_Manifest_Store.FORMAT_VERSION or manifest.get("serial_number") != serial_number):
+                return None
+            return {int(page_addr, 16): page_hash for page_addr, page_hash in manifest["pages"].items()}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            Logger.warn(f"Ignoring flash manifest for {serial_number}: {e}")
+            return None
+
+    def save(self, serial_number: str, page_hashes: Dict[int, str], file_name: Optional[str] = None):
+        manifest = {
+            "format": Flash_Manifest_Store.FORMAT_VERSION,
+            "serial_number": serial_number,
+            "file_name": file_name,
+            "flashed": time.time(),
+            "pages": {f"{page_addr:08X}": page_hash for page_addr, page_hash in sorted(page_hashes.items())},
+        }
+        manifest_file_name = self.fileName(serial_number)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written next to it, then renamed over it, so it's never half written.
+            with open(manifest_file_name + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(manifest, file, indent=1)
+            os.replace(manifest_file_name + ".tmp", manifest_file_name)
+        except OSError as e:
+            # Only costs reading the pages back next time.
+            Logger.warn(f"Couldn't save flash manifest for {serial_number}: {e}")
+
+    def forget(self, serial_number: str):
+        try:
+            os.remove(self.fileName(serial_number))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            Logger.warn(f"Couldn't remove flash manifest for {serial_number}: {e}")
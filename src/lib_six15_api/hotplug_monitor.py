@@ -0,0 +1,216 @@
+# Tracks when USB devices are connected and disconnected.
+# On Linux the kernel's uevents (the same netlink messages udev listens to) tell us when something changed,
+# so devices are only probed when there is a reason to. Everywhere else a single shared thread polls,
+# backing off while nothing is changing.
+
+import select
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from lib_six15_api.logger import Logger
+
+
+class Hotplug_Event(NamedTuple):
+    vid: int
+    pid: int
+    connected: bool
+    timestamp: float  # time.monotonic()
+
+
+class Hotplug_Monitor:
+    NETLINK_KOBJECT_UEVENT = 15
+    UEVENT_GROUP_KERNEL = 1
+    UEVENT_SUBSYSTEMS = (b"usb", b"hidraw", b"tty")
+
+    # After a uevent, drivers (hidraw, cdc_acm, ...) bind a little later than the USB device appears.
+    # Probe again at these delays (seconds) until something changes.
+    UEVENT_PROBE_DELAYS = (0.0, 0.05, 0.1, 0.25, 0.5, 1.0)
+    # Even with uevents, probe occasionally in case a message was dropped.
+    UEVENT_IDLE_PROBE_INTERVAL = 5.0
+
+    POLL_INTERVAL_MIN = 0.1
+    POLL_INTERVAL_MAX = 1.0
+
+    WAIT_SLICE = 0.1
+
+    _instance: Optional['Hotplug_Monitor'] = None
+    _instance_lock = threading.Lock()
+
+    @staticmethod
+    def instance() -> 'Hotplug_Monitor':
+        with Hotplug_Monitor._instance_lock:
+            if (Hotplug_Monitor._instance == None):
+                Hotplug_Monitor._instance = Hotplug_Monitor()
+            return Hotplug_Monitor._instance
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.probes: Dict[Tuple[int, int], Callable[[], bool]] = {}
+        self.states: Dict[Tuple[int, int], Optional[bool]] = {}
+        self.listeners: List[Callable[[Hotplug_Event], None]] = []
+        self.wake_event = threading.Event()
+        self.poll_interval = Hotplug_Monitor.POLL_INTERVAL_MIN
+        self.uevent_socket = Hotplug_Monitor.openUeventSocket()
+        if (self.uevent_socket != None):
+            # Lets wake() interrupt the select() waiting on uevents.
+            self.wake_reader, self.wake_writer = socket.socketpair()
+            self.wake_reader.setblocking(False)
+        self.thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def openUeventSocket() -> Optional[socket.socket]:
+        if (not hasattr(socket, "AF_NETLINK")):
+            return None
+        try:
+            uevent_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, Hotplug_Monitor.NETLINK_KOBJECT_UEVENT)
+            uevent_socket.bind((0, Hotplug_Monitor.UEVENT_GROUP_KERNEL))
+            uevent_socket.setblocking(False)
+            return uevent_socket
+        except OSError as e:
+            Logger.verbose("Hotplug: kernel uevents not available, polling instead: %s", e)
+            return None
+
+    def usingUevents(self) -> bool:
+        return self.uevent_socket != None
+
+    def watch(self, vid: int, pid: int, probe: Callable[[], bool]):
+        # probe() returns if the device is currently present. It only runs on the monitor's thread.
+        key = (vid, pid)
+        with self.condition:
+            if (key in self.probes):
+                return
+            self.probes[key] = probe
+            self.states[key] = None
+            if (self.thread == None):
+                self.thread = threading.Thread(target=self.run, name="Hotplug_Monitor", daemon=True)
+                self.thread.start()
+        self.wake()
+
+    def wake(self):
+        # Probe every device right away, instead of waiting for the next uevent or poll.
+        if (self.uevent_socket != None):
+            self.wake_writer.send(b"\0")
+        else:
+            self.wake_event.set()
+
+    def addListener(self, callback: Callable[[Hotplug_Event], None]):
+        with self.condition:
+            self.listeners.append(callback)
+
+    def removeListener(self, callback: Callable[[Hotplug_Event], None]):
+        with self.condition:
+            if (callback in self.listeners):
+                self.listeners.remove(callback)
+
+    def isConnected(self, vid: int, pid: int) -> Optional[bool]:
+        # None until the device has been probed at least once.
+        with self.condition:
+            return self.states.get((vid, pid))
+
+    def waitForState(self, vid: int, pid: int, connected: bool, timeout: Optional[float] = None, abortFunc: Optional[Callable[[], bool]] = None) -> bool:
+        # Returns True once the device is in the requested state, False on timeout or abort.
+        key = (vid, pid)
+        end_time = None if timeout == None else time.monotonic() + timeout
+        with self.condition:
+            while (self.states.get(key) != connected):
+                if (abortFunc != None and abortFunc()):
+                    return False
+                wait_time = Hotplug_Monitor.WAIT_SLICE
+                if (end_time != None):
+                    remaining = end_time - time.monotonic()
+                    if (remaining <= 0):
+                        return False
+                    wait_time = min(wait_time, remaining)
+                self.condition.wait(wait_time)
+            return True
+
+    def probeAll(self) -> bool:
+        with self.condition:
+            probes = list(self.probes.items())
+        events: List[Hotplug_Event] = []
+        for key, probe in probes:
+            try:
+                connected = bool(probe())
+            except Exception as e:
+                Logger.verbose("Hotplug: probe for %04x:%04x failed: %s", key[0], key[1], e)
+                continue
+            with self.condition:
+                if (self.states.get(key) != connected):
+                    self.states[key] = connected
+                    events.append(Hotplug_Event(key[0], key[1], connected, time.monotonic()))
+        if (len(events) == 0):
+            return False
+        with self.condition:
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        for event in events:
+            for listener in listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    Logger.error(f"Error in hotplug listener: {e}")
+        return True
+
+    def readUevents(self) -> bool:
+        # Drains every pending uevent, returns True if any could be for a device we watch.
+        relevant = False
+        while True:
+            try:
+                message = self.uevent_socket.recv(16384)
+            except (BlockingIOError, InterruptedError):
+                return relevant
+            if (self.isRelevantUevent(message)):
+                relevant = True
+
+    def isRelevantUevent(self, message: bytes) -> bool:
+        fields = message.split(b"\0")
+        props = dict(field.split(b"=", 1) for field in fields[1:] if b"=" in field)
+        if (props.get(b"SUBSYSTEM") not in Hotplug_Monitor.UEVENT_SUBSYSTEMS):
+            return False
+        product = props.get(b"PRODUCT")
+        if (product == None):
+            # hidraw and tty events don't say which USB device they belong to.
+            return True
+        # PRODUCT is "vid/pid/bcdDevice" in hex without leading zeros.
+        try:
+            vid, pid = (int(value, 16) for value in product.split(b"/")[0:2])
+        except ValueError:
+            return False
+        with self.condition:
+            return (vid, pid) in self.probes
+
+    def run(self):
+        if (self.uevent_socket != None):
+            Logger.verbose("Hotplug: using kernel uevents")
+            self.runUevents()
+        else:
+            self.runPolling()
+
+    def runUevents(self):
+        while True:
+            readable, _, _ = select.select([self.uevent_socket, self.wake_reader], [], [], Hotplug_Monitor.UEVENT_IDLE_PROBE_INTERVAL)
+            if (self.wake_reader in readable):
+                try:
+                    self.wake_reader.recv(4096)
+                except BlockingIOError:
+                    pass
+            if (self.uevent_socket not in readable):
+                self.probeAll()
+                continue
+            if (not self.readUevents()):
+                continue
+            for delay in Hotplug_Monitor.UEVENT_PROBE_DELAYS:
+                time.sleep(delay)
+                if (self.probeAll()):
+                    break
+
+    def runPolling(self):
+        while True:
+            self.wake_event.clear()
+            if (self.probeAll()):
+                self.poll_interval = Hotplug_Monitor.POLL_INTERVAL_MIN
+            else:
+                self.poll_interval = min(self.poll_interval * 2, Hotplug_Monitor.POLL_INTERVAL_MAX)
+            if (self.wake_event.wait(self.poll_interval)):
+                self.poll_interval = Hotplug_Monitor.POLL_INTERVAL_MIN
@@ -0,0 +1,43 @@
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# Firmware log lines look like "I (1234) ir: sent 0xE0E006F9" or "Warn: usb: transfer timeout 3".
+# Log_Fields pulls the parts out, so lines can be grouped by module and their numbers tracked, without each user parsing them.
+
+
+class Log_Fields(NamedTuple):
+    # The level word or letter the line starts with ("I", "Warn", "Error"...). Starts with a capital, so a module isn't taken for one.
+    tag: Optional[str]
+    uptime_ms: Optional[int]
+    module: Optional[str]
+    # Every whole number in the text after the header, decimal or 0x hex, including ones with units like "3700mV".
+    values: Tuple[int, ...]
+    text: str
+
+    HEADER_PATTERN = re.compile(r"(?:(?P<tag>[A-Z][A-Za-z]*)(?::[ ]*|[ ]+(?=\()))?(?:\((?P<uptime>\d+)\)[ ]+)?(?:(?P<module>[a-z_][\w.-]*):[ ]+)?")
+    NUMBER_PATTERN = re.compile(r"(?<![\w.])(?:-?0[xX][0-9A-Fa-f]+|-?\d+)(?![\d.])")
+
+    @staticmethod
+    def parse(line: str) -> 'Log_Fields':
+        # Any part that isn't there is None, a line with no header at all is all text.
+        return Log_Fields.parseBatch((line,))[0]
+
+    @staticmethod
+    def parseBatch(lines: Sequence[str]) -> List['Log_Fields']:
+        match_header = Log_Fields.HEADER_PATTERN.match
+        find_numbers = Log_Fields.NUMBER_PATTERN.findall
+        parsed: List[Log_Fields] = []
+        append = parsed.append
+        for line in lines:
+            header = match_header(line)
+            tag, uptime, module = header.groups()
+            text = line[header.end():]
+            numbers = find_numbers(text)
+            # int(number, 0) would refuse decimals with leading zeros, like "007".
+            values = tuple(int(number, 0) if "x" in number or "X" in number else int(number) for number in numbers) if len(numbers) != 0 else ()
+            # Skips the NamedTuple's Python __new__, see new_log_record.
+            append(new_log_fields(Log_Fields, (tag, int(uptime) if uptime != None else None, module, values, text)))
+        return parsed
+
+
+new_log_fields = tuple.__new__
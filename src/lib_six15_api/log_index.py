@@ -0,0 +1,302 @@
+# Searchable copy of the session log, kept up to date as lines are logged.
+# Lines are found by level, source (the host or the device), time range, and text or regex, in milliseconds over millions of lines.
+#
+# Every line gets an id, counting up from 0 in the order lines are added. Per line data is kept in parallel arrays.
+# Text is found through a trigram index: for each 3 character piece of lowercased text, a sorted array of the ids of the lines that contain it.
+# A search only looks at lines that have every trigram of the text it's looking for, then checks those lines for the text itself.
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import partial
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence
+from lib_six15_api.logger import LogLevel, Log_Record
+from lib_six15_api.log_fields import Log_Fields
+
+
+class Log_Query(NamedTuple):
+    text: str = ""  # Empty matches every line.
+    regex: bool = False
+    ignore_case: bool = True
+    levels: Optional[FrozenSet[LogLevel]] = None  # None for any level.
+    source: Optional[int] = None  # Log_Index.SOURCE_HOST, Log_Index.SOURCE_DEVICE, or None for either.
+    start_time: Optional[float] = None  # time.monotonic() range, like Log_Record.time
+    end_time: Optional[float] = None
+    module: Optional[str] = None  # Only device lines from this firmware module (Log_Fields.module), like "ir".
+
+
+class Log_Index:
+    DEFAULT_CAPACITY = 1_000_000
+
+    SOURCE_HOST = 0
+    SOURCE_DEVICE = 1
+    # Logger.log_prefixed() puts this in front of lines from the device.
+    DEVICE_PREFIX = "  "
+
+    LEVELS = list(LogLevel)
+    LEVEL_TO_INDEX = {level: index for index, level in enumerate(LEVELS)}
+
+    # Stop narrowing candidates with more trigrams once there are this few, checking the text is cheaper.
+    FEW_CANDIDATES = 64
+    INTERSECT_MAX_RATIO = 4
+    REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+    # Escapes that are just a backslash and one letter.
+    REGEX_SHORT_ESCAPES = set("dDwWsSbBAZafnrtv")
+    # Once there are more than capacity lines, this fraction of capacity is dropped at once, the oldest lines.
+    DROP_FRACTION = 0.01
+    # Trigram lists trimmed of dropped ids each time lines are dropped, taking turns. Trimming them all at once stalls
+    # the thread adding lines. Searches only look at ids still kept, so dropped ids left in the lists for a while are harmless.
+    TRIM_TRIGRAMS_PER_DROP = 256
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self.first_id = 0  # Id of the oldest line still kept.
+        self.next_id = 0
+        self.times = array('d')
+        self.levels = bytearray()
+        self.sources = bytearray()
+        self.messages: List[str] = []
+        self.level_ids: List[array] = [array('I') for _ in Log_Index.LEVELS]
+        self.device_ids = array('I')
+        self.trigram_ids: Dict[str, array] = defaultdict(partial(array, 'I'))
+        # Trigrams still to be trimmed in this round, see TRIM_TRIGRAMS_PER_DROP.
+        self.untrimmed: List[str] = []
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.next_id - self.first_id
+
+    def addRecords(self, records: Sequence[Log_Record]) -> int:
+        # Returns the id of the first line added.
+        first_new_id = self.next_id
+        next_id = self.next_id
+        last_time = self.times[-1] if len(self.times) != 0 else 0.0
+        times = self.times
+        levels = self.levels
+        sources = self.sources
+        messages = self.messages
+        level_ids = self.level_ids
+        # Appending to lists and extending the arrays once per batch is much faster than appending to the arrays.
+        new_trigram_ids: Dict[str, List[int]] = defaultdict(list)
+        level_to_index = Log_Index.LEVEL_TO_INDEX
+        for record in records:
+            message = record.message
+            level = level_to_index[record.level]
+            # Lines logged by different threads at almost the same time can arrive slightly out of order.
+            # Times are kept sorted so time ranges can be found with a binary search.
+            last_time = max(last_time, record.time)
+            times.append(last_time)
+            levels.append(level)
+            messages.append(message)
+            level_ids[level].append(next_id)
+            if (message.startswith(Log_Index.DEVICE_PREFIX)):
+                sources.append(Log_Index.SOURCE_DEVICE)
+                self.device_ids.append(next_id)
+            else:
+                sources.append(Log_Index.SOURCE_HOST)
+            lower = message.lower()
+            for trigram in {lower[i:i + 3] for i in range(len(lower) - 2)}:
+                new_trigram_ids[trigram].append(next_id)
+            next_id += 1
+        self.next_id = next_id
+        trigram_ids = self.trigram_ids
+        for trigram, ids in new_trigram_ids.items():
+            trigram_ids[trigram].extend(ids)
+        if (len(self) > self.capacity):
+            self.dropOldest(len(self) - self.capacity + max(1, int(self.capacity * Log_Index.DROP_FRACTION)))
+        return first_new_id
+
+    def dropOldest(self, count: int):
+        count = min(count, len(self))
+        del self.times[:count]
+        del self.levels[:count]
+        del self.sources[:count]
+        del self.messages[:count]
+        self.first_id += count
+        self.dropped += count
+        first_id = self.first_id
+        for ids in self.level_ids:
+            del ids[:bisect_left(ids, first_id)]
+        del self.device_ids[:bisect_left(self.device_ids, first_id)]
+        trigram_ids = self.trigram_ids
+        untrimmed = self.untrimmed
+        if (len(untrimmed) == 0):
+            untrimmed.extend(trigram_ids.keys())
+        for _ in range(min(len(untrimmed), Log_Index.TRIM_TRIGRAMS_PER_DROP)):
+            trigram = untrimmed.pop()
+            ids = trigram_ids.get(trigram)
+            if (ids == None):
+                continue
+            del ids[:bisect_left(ids, first_id)]
+            if (len(ids) == 0):
+                del trigram_ids[trigram]
+
+    def record(self, id: int) -> Optional[Log_Record]:
+        # None if the line was dropped.
+        offset = id - self.first_id
+        if (offset < 0 or id >= self.next_id):
+            return None
+        return Log_Record(self.times[offset], Log_Index.LEVELS[self.levels[offset]], self.messages[offset])
+
+    def message(self, id: int) -> Optional[str]:
+        offset = id - self.first_id
+        if (offset < 0 or id >= self.next_id):
+            return None
+        return self.messages[offset]
+
+    @staticmethod
+    def requiredLiterals(query: Log_Query) -> List[str]:
+        # Pieces of text every matching line must contain (ignoring case).
+        if (not query.regex):
+            return [query.text]
+        # Only simple regexes are understood: literal runs, broken up by anything special.
+        # Alternatives and groups might be optional, so with those every line in range gets checked.
+        pattern = query.text
+        if ("|" in pattern or "(" in pattern):
+            return []
+        literals: List[str] = []
+        run: List[str] = []
+        index = 0
+        while index < len(pattern):
+            char = pattern[index]
+            index += 1
+            if (char == "\\" and index < len(pattern)):
+                escaped = pattern[index]
+                index += 1
+                if (not escaped.isalnum()):
+                    run.append(escaped)
+                    continue
+                if (escaped not in Log_Index.REGEX_SHORT_ESCAPES):
+                    # \x41, \u0041, \N{...}, \101 and backreferences go on past the letter. Rather than risk splitting
+                    # the literals in the wrong place and missing lines, every line in range gets checked.
+                    return []
+                # \d, \w, \n and friends aren't worth understanding here.
+            elif (char not in Log_Index.REGEX_SPECIAL):
+                run.append(char)
+                continue
+            elif (char in "?*{" and len(run) != 0):
+                # The character before is optional.
+                run.pop()
+            literals.append("".join(run))
+            run = []
+            if (char == "{"):
+                index = Log_Index.skipPast(pattern, index, "}")
+            elif (char == "["):
+                # Skip the character class. A ] first in the class is part of it.
+                if (pattern.startswith("^", index)):
+                    index += 1
+                index = Log_Index.skipPast(pattern, index + 1, "]")
+        literals.append("".join(run))
+        return literals
+
+    @staticmethod
+    def skipPast(pattern: str, index: int, end: str) -> int:
+        while index < len(pattern) and pattern[index] != end:
+            index += 2 if pattern[index] == "\\" else 1
+        return index + 1
+
+    def search(self, query: Log_Query, first_id: int = 0) -> Sequence[int]:
+        # Ids of the matching lines, oldest first. With first_id, only lines from that id on are checked.
+        # Raises re.error for an invalid regex.
+        matcher = None
+        if (query.regex and query.text != ""):
+            matcher = re.compile(query.text, re.IGNORECASE if query.ignore_case else 0).search
+
+        low = max(first_id, self.first_id)
+        high = self.next_id
+        if (query.start_time != None):
+            low = max(low, self.first_id + bisect_left(self.times, query.start_time))
+        if (query.end_time != None):
+            high = min(high, self.first_id + bisect_right(self.times, query.end_time))
+        if (low >= high):
+            return []
+
+        literals = Log_Index.requiredLiterals(query)
+        module = query.module
+        if (module != None):
+            # Narrows the lines to check with the index, but it could be part of a longer module name, or in the text.
+            literals.append(f"{module}:")
+        candidates = self.textCandidates(literals, low, high)
+        levels = query.levels
+        source = query.source
+        if (candidates == None):
+            if (levels != None and len(levels) != len(Log_Index.LEVELS)):
+                candidates = self.levelCandidates(levels, low, high)
+                levels = None
+            elif (source == Log_Index.SOURCE_DEVICE):
+                candidates = Log_Index.idsInRange(self.device_ids, low, high)
+                source = None
+            else:
+                candidates = range(low, high)
+        if (levels == None and source == None and module == None and query.text == ""):
+            return candidates
+
+        first_id = self.first_id
+        level_indexes = None if levels == None else {Log_Index.LEVEL_TO_INDEX[level] for level in levels}
+        text = query.text
+        if (matcher == None and query.ignore_case):
+            text = text.lower()
+        matches: List[int] = []
+        for id in candidates:
+            offset = id - first_id
+            if (level_indexes != None and self.levels[offset] not in level_indexes):
+                continue
+            if (source != None and self.sources[offset] != source):
+                continue
+            if (module != None and (self.sources[offset] != Log_Index.SOURCE_DEVICE or self.lineModule(offset) != module)):
+                continue
+            if (text != ""):
+                message = self.messages[offset]
+                if (matcher != None):
+                    if (matcher(message) == None):
+                        continue
+                elif (text not in (message.lower() if query.ignore_case else message)):
+                    continue
+            matches.append(id)
+        return matches
+
+    def lineModule(self, offset: int) -> Optional[str]:
+        return Log_Fields.parse(self.messages[offset][len(Log_Index.DEVICE_PREFIX):]).module
+
+    @staticmethod
+    def idsInRange(ids: array, low: int, high: int) -> array:
+        return ids[bisect_left(ids, low):bisect_left(ids, high)]
+
+    def levelCandidates(self, levels: FrozenSet[LogLevel], low: int, high: int) -> Sequence[int]:
+        parts = [Log_Index.idsInRange(self.level_ids[Log_Index.LEVEL_TO_INDEX[level]], low, high) for level in levels]
+        if (len(parts) == 1):
+            return parts[0]
+        merged = array('I')
+        for part in parts:
+            merged.extend(part)
+        return sorted(merged)
+
+    def textCandidates(self, literals: List[str], low: int, high: int) -> Optional[Sequence[int]]:
+        # Lines that have every trigram of literals, or None if they have no trigrams.
+        trigrams = set()
+        for literal in literals:
+            literal = literal.lower()
+            trigrams.update(literal[i:i + 3] for i in range(len(literal) - 2))
+        if (len(trigrams) == 0):
+            return None
+        id_lists = []
+        for trigram in trigrams:
+            ids = self.trigram_ids.get(trigram)
+            if (ids == None):
+                return []
+            id_lists.append(ids)
+        id_lists.sort(key=len)
+        candidates = Log_Index.idsInRange(id_lists[0], low, high)
+        if (len(candidates) <= Log_Index.FEW_CANDIDATES or len(id_lists) == 1):
+            return candidates
+        # Intersecting with a list much longer than the candidates costs more than checking the text of each candidate.
+        candidate_set = set(candidates)
+        for ids in id_lists[1:]:
+            if (len(candidate_set) <= Log_Index.FEW_CANDIDATES or len(ids) > Log_Index.INTERSECT_MAX_RATIO * len(candidate_set)):
+                break
+            candidate_set.intersection_update(Log_Index.idsInRange(ids, low, high))
+        return sorted(candidate_set)
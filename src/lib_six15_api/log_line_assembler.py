@@ -0,0 +1,51 @@
+# Turns a stream of log bytes, arriving in chunks of any size, into complete lines.
+# UTF-8 characters split between two chunks are decoded correctly, instead of becoming replacement characters.
+
+import codecs
+from typing import List, NamedTuple, Optional
+
+
+class Log_Line_Batch(NamedTuple):
+    lines: List[str]
+    # For each line, time.monotonic_ns() when the part of the log that ended it was read.
+    received_ns: List[int]
+
+
+class Log_Line_Assembler:
+
+    def __init__(self) -> None:
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.decode = self.decoder.decode
+        # Text of the line that hasn't ended yet, in pieces. Only joined once the line ends.
+        self.partial: List[str] = []
+
+    def feed(self, data: bytes) -> List[str]:
+        # Returns the lines completed by data, without their line endings.
+        text = self.decode(data)
+        if ("\n" not in text):
+            if (text != ""):
+                self.partial.append(text)
+            return []
+        lines = text.split("\n")
+        if (len(self.partial) != 0):
+            self.partial.append(lines[0])
+            lines[0] = "".join(self.partial)
+            self.partial.clear()
+        last = lines.pop()
+        if (last != ""):
+            self.partial.append(last)
+        # A CRLF can be split between chunks, leaving the "\r" at the end of the first line's earlier part.
+        if ("\r" in text or lines[0].endswith("\r")):
+            return [line[:-1] if line.endswith("\r") else line for line in lines]
+        return lines
+
+    def hasPartial(self) -> bool:
+        # Includes the start of a character that hasn't finished decoding.
+        return len(self.partial) != 0 or self.decoder.getstate()[0] != b""
+
+    def finish(self) -> Optional[str]:
+        # Returns whatever is left of an unfinished line (None if there isn't one), and starts over.
+        text = "".join(self.partial) + self.decoder.decode(b"", final=True)
+        self.partial.clear()
+        self.decoder.reset()
+        return text if text != "" else None
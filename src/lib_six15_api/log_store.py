@@ -0,0 +1,457 @@
+# Keeps device log lines on disk in rotating segment files, so they're still there after the GUI closes.
+#
+# A segment is a JSON lines file. Its first line describes it:
+#   {"type": "segment", "format": 1, "started": <unix time>, "serial_number": <str or null>, "firmware_version": <str or null>}
+# Every line after that is one log line: {"t": <unix time>, "l": "<LogLevel name>", "m": "<text>"}
+# or a note that the writer fell behind and dropped lines: {"t": <unix time>, "dropped": <count>}
+#
+# A new segment is started when the current one gets too big or too old, or when a different device connects.
+# Closed segments can be compressed with gzip, or zstd if the zstandard package is installed.
+# Segment file names start with the time they were started, so sorting them by name sorts them by time.
+# Several GUIs can share a directory. A segment is locked (see Log_Segment_Lock) while it's written and compressed,
+# so the others leave it alone.
+
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Sequence, TextIO
+from lib_six15_api.logger import Logger, LogLevel
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class Stored_Log_Line(NamedTuple):
+    time: float  # time.time() when it was logged
+    level: LogLevel
+    message: str
+
+
+class Log_Store:
+    FORMAT_VERSION = 1
+    FILE_PREFIX = "device_log_"
+    EXTENSION = ".jsonl"
+    # Compression name to the extension added to closed segments.
+    COMPRESSION_EXTENSIONS: Dict[Optional[str], str] = {
+        None: "",
+        "gzip": ".gz",
+        "zstd": ".zst",
+    }
+
+    @staticmethod
+    def segmentFileNames(directory: str) -> List[str]:
+        # Oldest first, including the segment being written.
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        extensions = tuple(Log_Store.EXTENSION + extension for extension in Log_Store.COMPRESSION_EXTENSIONS.values())
+        return [os.path.join(directory, name) for name in sorted(names) if name.startswith(Log_Store.FILE_PREFIX) and name.endswith(extensions)]
+
+    @staticmethod
+    def openSegment(file_name: str) -> TextIO:
+        if (file_name.endswith(Log_Store.COMPRESSION_EXTENSIONS["gzip"])):
+            return gzip.open(file_name, "rt", encoding="utf-8", errors="replace")
+        if (file_name.endswith(Log_Store.COMPRESSION_EXTENSIONS["zstd"])):
+            if (zstandard == None):
+                raise ValueError(f"Reading {file_name} needs the zstandard package")
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(file_name, "rb"), closefd=True), encoding="utf-8", errors="replace")
+        return open(file_name, "rt", encoding="utf-8", errors="replace")
+
+    @staticmethod
+    def readHeader(file_name: str) -> Optional[Dict[str, Any]]:
+        with Log_Store.openSegment(file_name) as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+        if (not isinstance(header, dict) or header.get("type") != "segment"):
+            return None
+        return header
+
+    @staticmethod
+    def readLines(file_name: str) -> Iterator[Stored_Log_Line]:
+        with Log_Store.openSegment(file_name) as f:
+            f.readline()  # Header
+            for text in f:
+                try:
+                    entry = json.loads(text)
+                    if ("dropped" in entry):
+                        yield Stored_Log_Line(entry["t"], LogLevel.WARN, f"<Log store dropped {entry['dropped']} lines>")
+                    else:
+                        yield Stored_Log_Line(entry["t"], LogLevel[entry["l"]], entry["m"])
+                except (ValueError, KeyError, TypeError):
+                    # The segment being written can end part way through a line.
+                    continue
+
+
+class Log_Segment_Lock:
+    # An OS lock on "<segment>.lock", held by the writer that owns the segment, from opening it until it's compressed.
+    # The OS releases it if that process dies, so a lock file left behind by a crash doesn't count.
+    EXTENSION = ".lock"
+
+    def __init__(self, file: BinaryIO, file_name: str) -> None:
+        self.file = file
+        self.file_name = file_name
+
+    @staticmethod
+    def acquire(segment_file_name: str) -> Optional['Log_Segment_Lock']:
+        # None if another process (or another writer in this one) holds it.
+        file_name = segment_file_name + Log_Segment_Lock.EXTENSION
+        file = open(file_name, "a+b")
+        try:
+            if (fcntl != None):
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            file.close()
+            return None
+        return Log_Segment_Lock(file, file_name)
+
+    @staticmethod
+    def isHeld(segment_file_name: str) -> bool:
+        if (not os.path.exists(segment_file_name + Log_Segment_Lock.EXTENSION)):
+            return False
+        try:
+            lock = Log_Segment_Lock.acquire(segment_file_name)
+        except OSError:
+            # Can't tell, so it's left alone.
+            return True
+        if (lock == None):
+            return True
+        lock.release()
+        return False
+
+    def release(self):
+        if (fcntl != None):
+            # Deleted while still locked, so no one else can lock a file that's about to go away.
+            self.removeFile()
+            self.file.close()
+        else:
+            # Windows can't delete an open file.
+            self.file.close()
+            self.removeFile()
+
+    def removeFile(self):
+        try:
+            os.remove(self.file_name)
+        except OSError:
+            # Someone else has it open, checking if it's held.
+            pass
+
+
+class Log_Store_Writer:
+    # Writes log lines to a Log_Store directory from its own thread, in batches.
+    # add() never blocks, so the threads reading the device log never wait on the disk.
+    # If the writer falls MAX_PENDING_LINES behind, new lines are dropped and counted, and the count is written to the segment.
+    MAX_PENDING_LINES = 10_000
+    WRITE_INTERVAL_SECONDS = 0.05
+    FLUSH_INTERVAL_SECONDS = 1.0
+
+    DEFAULT_MAX_SEGMENT_BYTES = 8 * 1024 * 1024
+    DEFAULT_MAX_SEGMENT_SECONDS = 60 * 60
+    DEFAULT_MAX_TOTAL_BYTES = 256 * 1024 * 1024
+
+    DEVICE_CHANGE = object()
+
+    def __init__(self, directory: str, compression: Optional[str] = "gzip",
+                 max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES,
+                 max_segment_seconds: float = DEFAULT_MAX_SEGMENT_SECONDS,
+                 max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES) -> None:
+        # Once all segments together take more than max_total_bytes, the oldest are deleted.
+        if (compression not in Log_Store.COMPRESSION_EXTENSIONS):
+            raise ValueError(f"Unknown compression: {compression}")
+        if (compression == "zstd" and zstandard == None):
+            raise ValueError("zstd compression needs the zstandard package")
+        self.directory = directory
+        self.compression = compression
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.max_total_bytes = max_total_bytes
+
+        # Like Queued_Log_Sink, deque's append() and popleft() are atomic, so adding a line never waits on a lock.
+        self.pending: deque = deque()
+        self.drop_lock = threading.Lock()
+        self.dropped = 0
+        self.unwritten_drops = 0
+        self.written = 0
+
+        self.serial_number: Optional[str] = None
+        self.firmware_version: Optional[str] = None
+        self.file = None
+        self.file_name: Optional[str] = None
+        self.segment_lock: Optional[Log_Segment_Lock] = None
+        self.segment_bytes = 0
+        self.segment_start = 0.0
+        self.last_flush = 0.0
+        self.error_reported = False
+
+        self.compress_lock = threading.Lock()
+        self.compressing: Dict[str, threading.Thread] = {}
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="Log_Store_Writer", daemon=True)
+        self.thread.start()
+
+    def add(self, level: LogLevel, message: str, monotonic_time: Optional[float] = None):
+        # Can be called from any thread.
+        if (len(self.pending) >= Log_Store_Writer.MAX_PENDING_LINES):
+            self.countDropped(1)
+            return
+        self.pending.append((time.monotonic() if monotonic_time == None else monotonic_time, level, message))
+
+    def addMany(self, levels: Sequence[LogLevel], messages: Sequence[str], received_ns: Optional[Sequence[int]] = None):
+        # Adds lines read together. received_ns is time.monotonic_ns() when each was read, otherwise they are all added as now.
+        # Can be called from any thread.
+        room = Log_Store_Writer.MAX_PENDING_LINES - len(self.pending)
+        if (room < len(messages)):
+            self.countDropped(len(messages) - max(0, room))
+            if (room <= 0):
+                return
+            levels = levels[:room]
+            messages = messages[:room]
+        if (received_ns == None):
+            now = time.monotonic()
+            self.pending.extend((now, level, message) for level, message in zip(levels, messages))
+        else:
+            self.pending.extend((line_ns / 1e9, level, message) for line_ns, level, message in zip(received_ns, levels, messages))
+
+    def setDevice(self, serial_number: Optional[str], firmware_version: Optional[str]):
+        # Lines added after this go to a new segment, tagged with this device.
+        # Never dropped, even when lines are.
+        self.pending.append((Log_Store_Writer.DEVICE_CHANGE, serial_number, firmware_version))
+
+    def countDropped(self, count: int):
+        with self.drop_lock:
+            self.dropped += count
+            self.unwritten_drops += count
+
+    def close(self):
+        # Writes everything added so far, and waits for closed segments to finish compressing.
+        self.stop_event.set()
+        self.thread.join()
+        with self.compress_lock:
+            threads = list(self.compressing.values())
+        for thread in threads:
+            thread.join()
+
+    def run(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            self.reportError(e)
+        # Compress anything left uncompressed by a GUI that didn't close cleanly.
+        # Segments another running GUI is still writing or compressing are locked.
+        if (self.compression != None):
+            for file_name in Log_Store.segmentFileNames(self.directory):
+                if (not file_name.endswith(Log_Store.EXTENSION)):
+                    continue
+                try:
+                    lock = Log_Segment_Lock.acquire(file_name)
+                except OSError as e:
+                    self.reportError(e)
+                    break
+                if (lock == None):
+                    continue
+                if (not os.path.exists(file_name)):
+                    # Finished compressing after it was listed.
+                    lock.release()
+                    continue
+                self.startCompress(file_name, lock)
+        while True:
+            stopping = self.stop_event.wait(Log_Store_Writer.WRITE_INTERVAL_SECONDS)
+            try:
+                self.writePending()
+            except OSError as e:
+                self.reportError(e)
+                self.closeFile()
+            if (stopping):
+                break
+        try:
+            self.closeSegment()
+        except OSError as e:
+            self.reportError(e)
+
+    def reportError(self, e: OSError):
+        # Only once, a full disk would otherwise report an error for every batch.
+        if (not self.error_reported):
+            self.error_reported = True
+            Logger.error(f"Can't save the device log to {self.directory}: {e}")
+
+    def writePending(self):
+        pending = self.pending
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        wall_offset = time.time() - time.monotonic()
+        chunk: List[str] = []
+        while True:
+            try:
+                item = pending.popleft()
+            except IndexError:
+                break
+            if (item[0] is Log_Store_Writer.DEVICE_CHANGE):
+                self.writeChunk(chunk, wall_offset)
+                chunk = []
+                if ((item[1], item[2]) != (self.serial_number, self.firmware_version)):
+                    self.closeSegment()
+                    self.serial_number = item[1]
+                    self.firmware_version = item[2]
+                continue
+            monotonic_time, level, message = item
+            chunk.append(f"{{\"t\":{monotonic_time + wall_offset:.3f},\"l\":\"{level.name}\",\"m\":{encode(message)}}}\n")
+        self.writeChunk(chunk, wall_offset)
+        if (self.file != None and time.monotonic() - self.last_flush >= Log_Store_Writer.FLUSH_INTERVAL_SECONDS):
+            self.file.flush()
+            self.last_flush = time.monotonic()
+
+    def writeChunk(self, chunk: List[str], wall_offset: float):
+        if (len(chunk) == 0):
+            return
+        with self.drop_lock:
+            drops = self.unwritten_drops
+            self.unwritten_drops = 0
+        if (drops != 0):
+            chunk.append(f"{{\"t\":{time.monotonic() + wall_offset:.3f},\"dropped\":{drops}}}\n")
+        if (self.file != None and (self.segment_bytes >= self.max_segment_bytes or time.monotonic() - self.segment_start >= self.max_segment_seconds)):
+            self.closeSegment()
+        data = "".join(chunk).encode("utf-8", errors="replace")
+        try:
+            if (self.file == None):
+                self.openSegment()
+            self.file.write(data)
+        except OSError:
+            # Lines that can't be written are dropped, and counted.
+            self.countDropped(len(chunk) - (1 if drops != 0 else 0))
+            raise
+        self.segment_bytes += len(data)
+        self.written += len(chunk)
+
+    def openSegment(self):
+        tag = re.sub(r"[^A-Za-z0-9]+", "-", self.serial_number) if self.serial_number != None else "unknown"
+        base_name = os.path.join(self.directory, f"{Log_Store.FILE_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}_{tag}")
+        file_name = base_name + Log_Store.EXTENSION
+        count = 1
+        while True:
+            if (not os.path.exists(file_name) and not os.path.exists(file_name + Log_Store.COMPRESSION_EXTENSIONS[self.compression])):
+                # Locked before the segment exists, so no one else ever sees it unlocked.
+                lock = Log_Segment_Lock.acquire(file_name)
+                if (lock != None):
+                    break
+            file_name = f"{base_name}-{count}{Log_Store.EXTENSION}"
+            count += 1
+        header = {
+            "type": "segment",
+            "format": Log_Store.FORMAT_VERSION,
+            "started": time.time(),
+            "serial_number": self.serial_number,
+            "firmware_version": self.firmware_version,
+        }
+        try:
+            self.file = open(file_name, "wb")
+        except OSError:
+            lock.release()
+            raise
+        self.file_name = file_name
+        self.segment_lock = lock
+        data = (json.dumps(header) + "\n").encode("utf-8")
+        self.file.write(data)
+        self.segment_bytes = len(data)
+        self.segment_start = time.monotonic()
+        self.last_flush = self.segment_start
+        self.error_reported = False
+
+    def closeFile(self):
+        if (self.file != None):
+            try:
+                self.file.close()
+            except OSError:
+                pass
+        self.file = None
+        if (self.segment_lock != None):
+            self.segment_lock.release()
+            self.segment_lock = None
+
+    def closeSegment(self):
+        if (self.file == None):
+            return
+        file_name = self.file_name
+        lock = self.segment_lock
+        try:
+            self.file.close()
+        finally:
+            self.file = None
+            self.file_name = None
+            self.segment_lock = None
+        if (self.compression != None):
+            self.startCompress(file_name, lock)
+        else:
+            lock.release()
+        self.deleteOldSegments()
+
+    def startCompress(self, file_name: str, lock: Log_Segment_Lock):
+        # On another thread, so a big segment compressing doesn't hold up writing new lines.
+        # lock is released once it's done.
+        thread = threading.Thread(target=self.compress, args=(file_name, lock), name="Log_Store_Compress", daemon=True)
+        with self.compress_lock:
+            self.compressing[file_name] = thread
+        thread.start()
+
+    def compress(self, file_name: str, lock: Log_Segment_Lock):
+        compressed_name = file_name + Log_Store.COMPRESSION_EXTENSIONS[self.compression]
+        temp_name = compressed_name + ".tmp"
+        try:
+            with open(file_name, "rb") as src:
+                if (self.compression == "zstd"):
+                    with open(temp_name, "wb") as dst:
+                        zstandard.ZstdCompressor().copy_stream(src, dst)
+                else:
+                    with gzip.open(temp_name, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+            os.replace(temp_name, compressed_name)
+            os.remove(file_name)
+        except OSError as e:
+            Logger.warn(f"Can't compress {file_name}: {e}")
+        finally:
+            lock.release()
+            with self.compress_lock:
+                self.compressing.pop(file_name, None)
+
+    def deleteOldSegments(self):
+        with self.compress_lock:
+            busy = set(self.compressing.keys())
+        sizes = []
+        for file_name in Log_Store.segmentFileNames(self.directory):
+            if (file_name == self.file_name or file_name in busy):
+                continue
+            if (file_name.endswith(Log_Store.EXTENSION) and Log_Segment_Lock.isHeld(file_name)):
+                # Another GUI is writing or compressing it.
+                continue
+            try:
+                sizes.append((file_name, os.path.getsize(file_name)))
+            except OSError:
+                pass
+        total = sum(size for _, size in sizes)
+        for file_name, size in sizes:
+            if (total <= self.max_total_bytes):
+                break
+            try:
+                os.remove(file_name)
+                total -= size
+            except OSError:
+                pass
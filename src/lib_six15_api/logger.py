@@ -1,8 +1,14 @@
 
-from typing import Callable, Optional, Dict, Any
-from PySide6.QtCore import Signal, QObject
-from PySide6.QtGui import QColor
+from typing import Optional, Dict, Any, List, NamedTuple, Sequence, TextIO, Tuple
+from collections import deque
 from enum import Enum
+import datetime
+import threading
+import time
+import sys
+
+# Logging without Qt. Records go to whichever sinks are attached with Logger.addSink(), or are printed if there are none.
+# Qt_Log_Sink in logger_qt.py shows them in a GUI, and is the only part that needs Qt.
 
 
 class LogLevel(Enum):
@@ -13,29 +19,172 @@ class LogLevel(Enum):
     CRITICAL_ERROR = 4
 
 
-class LoggerImpl(QObject):
+class Log_Record(NamedTuple):
+    time: float  # time.monotonic() when it was logged
+    level: LogLevel
+    message: str
 
-    # Single quotes on type for a forward referenced type
-    default_logger_impl: Optional['LoggerImpl'] = None
-    impl_signal = Signal(LogLevel, str)
 
-    def __init__(self, callback: Callable[[LogLevel, str], None]):
-        super().__init__()
-        self.impl_signal.connect(callback)
+# Makes a Log_Record without going through the NamedTuple's Python __new__, which is most of what a record costs to make.
+new_log_record = tuple.__new__
 
-    def makeDefault(self, isDefault: bool):
-        LoggerImpl.default_logger_impl = self if isDefault else None
 
-    @staticmethod
-    def defaultImpl(level: LogLevel, msg: str):
-        prefix = Logger.LOG_LEVEL_TO_PREFIX[level]
+class Log_Timestamp_Cache:
+    # Formatting a timestamp is slow compared to everything else done per line, and lines come many per second.
+    # Takes time.monotonic() times, and shows them as wall clock time.
+    def __init__(self, format: str) -> None:
+        self.format = format
+        self.wall_offset = time.time() - time.monotonic()
+        self.second: Optional[int] = None
+        self.text = ""
+
+    def get(self, monotonic_time: float) -> str:
+        second = int(monotonic_time + self.wall_offset)
+        if (second != self.second):
+            # Follow changes to the wall clock (or a suspend) at most once a second.
+            self.wall_offset = time.time() - time.monotonic()
+            second = int(monotonic_time + self.wall_offset)
+            self.second = second
+            self.text = datetime.datetime.fromtimestamp(second).strftime(self.format)
+        return self.text
+
+
+class Log_Hex:
+    # A log format argument that shows bytes as hex, only once the message is actually formatted.
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def __str__(self) -> str:
+        return bytes(self.data).hex()
+
+
+class Log_Sink:
+    # Receives every record that gets past Logger's level checks, on the thread that logged it.
+    # post() is called while logging, so it should only hand the record off.
+    def post(self, record: Log_Record):
+        pass
+
+    def postMany(self, records: List[Log_Record]):
+        for record in records:
+            self.post(record)
+
+    def close(self):
+        pass
+
+
+class Queued_Log_Sink(Log_Sink):
+    # Queues records for another thread to drain in batches.
+    # deque's append() and popleft() are atomic, so threads logging never wait on a lock, a signal, or the consumer.
+
+    def __init__(self) -> None:
+        self.pending: deque = deque()
+        self.post = self.pending.append
+        self.postMany = self.pending.extend
+
+    def drain(self, max_records: int) -> List[Log_Record]:
+        records: List[Log_Record] = []
+        popleft = self.pending.popleft
+        try:
+            for _ in range(max_records):
+                records.append(popleft())
+        except IndexError:
+            pass
+        return records
+
+
+class Console_Log_Sink(Log_Sink):
+    # Prints each record right away, so it stays in order with anything else printed.
+    def __init__(self, file: Optional[TextIO] = None) -> None:
+        self.file = file
+
+    def post(self, record: Log_Record):
+        prefix = Logger.LOG_LEVEL_TO_PREFIX[record.level]
         divider = ": " if prefix != "" else ""
-        print(f"{prefix}{divider}{msg}")
+        print(f"{prefix}{divider}{record.message}", file=self.file if self.file != None else sys.stdout)
+
+
+class File_Log_Sink(Queued_Log_Sink):
+    # Appends records to a text file from its own thread.
+    WRITE_INTERVAL_SECONDS = 0.1
+    MAX_BATCH_LINES = 1000
+
+    def __init__(self, file_name: str) -> None:
+        super().__init__()
+        self.file = open(file_name, "a", encoding="utf-8", errors="replace")
+        self.timestamps = Log_Timestamp_Cache("%Y-%m-%d %H:%M:%S")
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="File_Log_Sink", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            stopping = self.stop_event.wait(File_Log_Sink.WRITE_INTERVAL_SECONDS)
+            while True:
+                records = self.drain(File_Log_Sink.MAX_BATCH_LINES)
+                if (len(records) == 0):
+                    break
+                self.file.write("".join(f"{self.timestamps.get(record.time)} {record.level.name:<7}| {record.message}\n" for record in records))
+            self.file.flush()
+            if (stopping):
+                break
+
+    def close(self):
+        # Writes everything logged so far.
+        self.stop_event.set()
+        self.thread.join()
+        self.file.close()
 
 
-class Logger(QObject):
+class Log_Line_Classifier:
+    # Finds the level of a line from its prefix, like "Error:", with a table built once from the prefixes.
+    # Lines are looked up by their first character, so most lines (which have no prefix) cost one dict lookup.
+
+    def __init__(self, prefix_to_level: Dict[str, LogLevel], default_level: LogLevel) -> None:
+        self.default_level = default_level
+        # Longest first, in case one prefix starts another.
+        self.first_char_to_prefixes: Dict[str, Tuple[Tuple[str, LogLevel], ...]] = {}
+        for prefix, level in sorted(prefix_to_level.items(), key=lambda item: len(item[0]), reverse=True):
+            self.first_char_to_prefixes[prefix[0]] = self.first_char_to_prefixes.get(prefix[0], ()) + ((prefix, level),)
+
+    def level(self, line: str) -> LogLevel:
+        prefixes = self.first_char_to_prefixes.get(line[:1])
+        if (prefixes != None):
+            for prefix, level in prefixes:
+                if (line.startswith(prefix)):
+                    return level
+        return self.default_level
+
+    def levels(self, lines: Sequence[str]) -> List[LogLevel]:
+        # The level of each line, the same as level() but without a call per line.
+        get_prefixes = self.first_char_to_prefixes.get
+        default_level = self.default_level
+        levels: List[LogLevel] = []
+        append = levels.append
+        for line in lines:
+            prefixes = get_prefixes(line[:1])
+            if (prefixes == None):
+                append(default_level)
+                continue
+            for prefix, level in prefixes:
+                if (line.startswith(prefix)):
+                    append(level)
+                    break
+            else:
+                append(default_level)
+        return levels
+
+
+class Logger:
     enableVerbose: bool = True
 
+    # Attached sinks. Replaced instead of changed, so logging never needs a lock to read it.
+    sinks: Tuple[Log_Sink, ...] = ()
+    sinks_lock = threading.Lock()
+    # Used while no sinks are attached.
+    console_sink = Console_Log_Sink()
+
     LOG_LEVEL_TO_PREFIX: Dict[LogLevel, str] = {
         LogLevel.VERBOSE: "",
         LogLevel.INFO: "",
@@ -51,15 +200,19 @@ class Logger(QObject):
 
     }
 
-    LOG_LEVEL_TO_COLOR: Dict[LogLevel, QColor] = {
-        LogLevel.VERBOSE: QColor.fromRgb(0x444444),
-        LogLevel.INFO:  QColor('black'),
-        LogLevel.WARN: QColor.fromRgb(0x808000),
-        LogLevel.ERROR: QColor('red'),
-        LogLevel.CRITICAL_ERROR: QColor('red'),
+    # As "#rrggbb", so they can be used without Qt. Qt_Log_Sink has them as QColors.
+    LOG_LEVEL_TO_COLOR_NAME: Dict[LogLevel, str] = {
+        LogLevel.VERBOSE: "#444444",
+        LogLevel.INFO: "#000000",
+        LogLevel.WARN: "#808000",
+        LogLevel.ERROR: "#ff0000",
+        LogLevel.CRITICAL_ERROR: "#ff0000",
     }
 
 
+    classifier = Log_Line_Classifier(PREFIX_TO_LOG_LEVEL, LogLevel.INFO)
+
+
 ### Static functions for easy access ###
 
     @staticmethod
@@ -67,45 +220,84 @@ class Logger(QObject):
         Logger.enableVerbose = enabled
 
     @staticmethod
-    def log(level: LogLevel, msg: Any):
-        msg = str(msg)
-        if (level == LogLevel.VERBOSE and not Logger.enableVerbose):
+    def addSink(sink: Log_Sink):
+        with Logger.sinks_lock:
+            Logger.sinks = Logger.sinks + (sink,)
+
+    @staticmethod
+    def removeSink(sink: Log_Sink):
+        with Logger.sinks_lock:
+            Logger.sinks = tuple(attached for attached in Logger.sinks if attached is not sink)
+
+    @staticmethod
+    def log(level: LogLevel, msg: Any, *args):
+        # With args, msg is a %-style format string, only formatted if the record is going to be kept.
+        if (level is LogLevel.VERBOSE and not Logger.enableVerbose):
             return
-        if (LoggerImpl.default_logger_impl is None):
-            LoggerImpl.defaultImpl(level, msg)
+        if (len(args) != 0):
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f"{msg} {args}"
         else:
-            LoggerImpl.default_logger_impl.impl_signal.emit(level, msg)
+            msg = str(msg)
+        record = new_log_record(Log_Record, (time.monotonic(), level, msg))
+        sinks = Logger.sinks
+        if (len(sinks) == 0):
+            Logger.console_sink.post(record)
+            return
+        for sink in sinks:
+            sink.post(record)
 
     @staticmethod
-    def verbose(msg: Any):
-        msg = str(msg)
-        Logger.log(LogLevel.VERBOSE, msg)
+    def verbose(msg: Any, *args):
+        if (not Logger.enableVerbose):
+            return
+        Logger.log(LogLevel.VERBOSE, msg, *args)
 
     @staticmethod
-    def info(msg: Any):
-        msg = str(msg)
-        Logger.log(LogLevel.INFO, msg)
+    def info(msg: Any, *args):
+        Logger.log(LogLevel.INFO, msg, *args)
 
     @staticmethod
-    def warn(msg: Any):
-        msg = str(msg)
-        Logger.log(LogLevel.WARN, msg)
+    def warn(msg: Any, *args):
+        Logger.log(LogLevel.WARN, msg, *args)
 
     @staticmethod
-    def error(msg: Any):
-        msg = str(msg)
-        Logger.log(LogLevel.ERROR, msg)
+    def error(msg: Any, *args):
+        Logger.log(LogLevel.ERROR, msg, *args)
 
     @staticmethod
-    def critical_error(msg: Any):
-        msg = str(msg)
-        Logger.log(LogLevel.CRITICAL_ERROR, msg)
+    def critical_error(msg: Any, *args):
+        Logger.log(LogLevel.CRITICAL_ERROR, msg, *args)
+
+    @staticmethod
+    def prefixedLevel(msg: str) -> LogLevel:
+        # The level a line from the device is logged at, from its prefix.
+        return Logger.classifier.level(msg)
 
     @staticmethod
     def log_prefixed(msg: Any, extra_prefix: str = ""):
         msg = str(msg)
-        for prefix, level in Logger.PREFIX_TO_LOG_LEVEL.items():
-            if (msg.startswith(prefix)):
-                Logger.log(level, f"{extra_prefix}{msg}")
-                return
-        Logger.info(f"{extra_prefix}{msg}")
+        Logger.log(Logger.prefixedLevel(msg), "%s%s", extra_prefix, msg)
+
+    @staticmethod
+    def log_prefixed_batch(lines: Sequence[str], extra_prefix: str = "", received_ns: Optional[Sequence[int]] = None) -> List[LogLevel]:
+        # Logs lines read together, each at the level from its prefix, and returns those levels.
+        # received_ns is time.monotonic_ns() when each line was read, otherwise they are all logged as now.
+        # They are handed to each sink all at once.
+        levels = Logger.classifier.levels(lines)
+        if (received_ns == None):
+            now = time.monotonic()
+            records = [new_log_record(Log_Record, (now, level, extra_prefix + line)) for level, line in zip(levels, lines)]
+        else:
+            records = [new_log_record(Log_Record, (line_ns / 1e9, level, extra_prefix + line)) for line_ns, level, line in zip(received_ns, levels, lines)]
+        if (not Logger.enableVerbose and LogLevel.VERBOSE in levels):
+            records = [record for record in records if record.level is not LogLevel.VERBOSE]
+        sinks = Logger.sinks
+        if (len(sinks) == 0):
+            Logger.console_sink.postMany(records)
+            return levels
+        for sink in sinks:
+            sink.postMany(records)
+        return levels
@@ -0,0 +1,41 @@
+import time
+from typing import Callable, Dict, List
+from PySide6.QtCore import QTimer
+from PySide6.QtGui import QColor
+from lib_six15_api.logger import Logger, LogLevel, Log_Record, Queued_Log_Sink
+
+
+class Qt_Log_Sink(Queued_Log_Sink):
+    # Hands records from any thread to batch_callback in batches, on the thread that created the sink (normally the GUI thread).
+    # Nothing crosses threads as a Qt signal, a QTimer on the receiving thread picks the records up.
+
+    # How often buffered lines are handed to batch_callback.
+    FLUSH_INTERVAL_MS = 33
+    FLUSH_BUDGET_SECONDS = 0.012
+    MAX_BATCH_LINES = 500
+
+    LOG_LEVEL_TO_COLOR: Dict[LogLevel, QColor] = {level: QColor(name) for level, name in Logger.LOG_LEVEL_TO_COLOR_NAME.items()}
+
+    def __init__(self, batch_callback: Callable[[List[Log_Record]], None]) -> None:
+        super().__init__()
+        self.batch_callback = batch_callback
+        self.flush_timer = QTimer()
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(Qt_Log_Sink.FLUSH_INTERVAL_MS)
+
+    def flush(self):
+        if (len(self.pending) == 0):
+            return
+        # A flood of lines is shown a batch at a time, for at most FLUSH_BUDGET_SECONDS per flush, so the GUI keeps responding.
+        # Whatever is left waits for the next flush.
+        end_time = time.perf_counter() + Qt_Log_Sink.FLUSH_BUDGET_SECONDS
+        while (len(self.pending) != 0):
+            self.batch_callback(self.drain(Qt_Log_Sink.MAX_BATCH_LINES))
+            if (time.perf_counter() >= end_time):
+                return
+
+    def close(self):
+        # Hands over everything still queued, however long it takes, so no lines are lost.
+        self.flush_timer.stop()
+        while (len(self.pending) != 0):
+            self.batch_callback(self.drain(Qt_Log_Sink.MAX_BATCH_LINES))
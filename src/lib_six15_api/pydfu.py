@@ -16,16 +16,18 @@ See document UM0391 for a dscription of the DFuse file.
 from __future__ import print_function
 
 import argparse
+import bisect
 import collections
+import hashlib
 import inspect
 import re
 import struct
 import sys
 import usb.core
 import usb.util
-import zlib
 import time
 from usb.backend import libusb1
+from lib_six15_api.firmware_image import Firmware_Image
 
 
 # USB request __TIMEOUT
@@ -55,6 +57,17 @@ __DFU_STATE_DFU_ERROR = 0x0A
 
 _DFU_DESCRIPTOR_TYPE = 0x21
 
+# DfuSe data blocks start at block number 2, blocks 0 and 1 are for commands.
+__DFU_FIRST_DATA_BLOCK = 2
+__DFU_MAX_BLOCK = 0xFFFF
+
+# Control transfers of each DNLOAD command: the DNLOAD, and two GETSTATUS requests.
+__COMMAND_TRANSFERS = 3
+
+# Writes covering this much of the flash mass erase it, instead of erasing page by page. Only when the image covers
+# every page, or the caller allows losing the pages outside it (settings, calibration...).
+__MASS_ERASE_FRACTION = 0.9
+
 __DFU_STATUS_STR = {
     __DFU_STATE_APP_IDLE: "STATE_APP_IDLE",
     __DFU_STATE_APP_DETACH: "STATE_APP_DETACH",
@@ -69,6 +82,30 @@ __DFU_STATUS_STR = {
     __DFU_STATE_DFU_ERROR: "STATE_DFU_ERROR",
 }
 
+# DFU status codes (bStatus)
+__DFU_STATUS_OK = 0x00
+
+__DFU_ERROR_STR = {
+    0x01: "errTARGET",
+    0x02: "errFILE",
+    0x03: "errWRITE",
+    0x04: "errERASE",
+    0x05: "errCHECK_ERASED",
+    0x06: "errPROG",
+    0x07: "errVERIFY",
+    0x08: "errADDRESS",
+    0x09: "errNOTDONE",
+    0x0A: "errFIRMWARE",
+    0x0B: "errVENDOR",
+    0x0C: "errUSBR",
+    0x0D: "errPOR",
+    0x0E: "errUNKNOWN",
+    0x0F: "errSTALLEDPKT",
+}
+
+# The 6 byte GETSTATUS response. bwPollTimeout is in milliseconds.
+DfuStatus = collections.namedtuple("DfuStatus", ["bStatus", "bwPollTimeout", "bState", "iString"])
+
 # USB device handle
 __dev = None
 
@@ -80,6 +117,19 @@ __verbose = None
 # USB DFU interface
 __DFU_INTERFACE = 0
 
+# The device asked not to be sent another GETSTATUS before this time.monotonic()
+__next_status_time = 0.0
+
+# Status strings already read from the device, by iString
+__status_strings = {}
+
+# Seconds spent waiting for bwPollTimeout, and GETSTATUS requests sent, in total
+__busy_seconds = 0.0
+__status_requests = 0
+
+# Time spent in DNLOAD commands, by stage, see get_timing()
+__timing = {}
+
 if "length" in inspect.getfullargspec(usb.util.get_string).args:
     # PyUSB 1.0.0.b1 has the length argument
     def get_string(dev, index):
@@ -111,13 +161,15 @@ def find_dfu_cfg_descr(descr):
 
 def init(**kwargs):
     """Initializes the found DFU device so that we can program it."""
-    global __dev, __cfg_descr
+    global __dev, __cfg_descr, __next_status_time, __status_strings
     devices = get_dfu_devices(**kwargs)
     if not devices:
         raise ValueError("No DFU device found")
     if len(devices) > 1:
         raise ValueError("Multiple DFU devices found")
     __dev = devices[0]
+    __next_status_time = 0.0
+    __status_strings = {}
     __dev.set_configuration()
 
     # Claim DFU interface
@@ -145,6 +197,13 @@ def init(**kwargs):
             clr_status()
 
 
+def get_serial_number():
+    """Returns the device's serial number string, or None if it has none."""
+    if not __dev.iSerialNumber:
+        return None
+    return get_string(__dev, __dev.iSerialNumber)
+
+
 def abort_request():
     """Sends an abort request."""
     __dev.ctrl_transfer(0x21, __DFU_ABORT, 0, __DFU_INTERFACE, None, __TIMEOUT)
@@ -155,11 +214,22 @@ def clr_status():
     __dev.ctrl_transfer(0x21, __DFU_CLRSTATUS, 0, __DFU_INTERFACE, None, __TIMEOUT)
 
 
-def get_status(retry: int = 3, print_errors: bool = True):
-    """Get the status of the last operation."""
+def get_dfu_status(retry: int = 3, print_errors: bool = True):
+    """Gets the status of the last operation, as a DfuStatus.
+
+    If the previous status had a bwPollTimeout, sleeps until it's over
+    first, instead of asking a busy device again and again.
+    """
+    global __next_status_time, __busy_seconds, __status_requests
+    wait = __next_status_time - time.monotonic()
+    if wait > 0:
+        time.sleep(wait)
+        __busy_seconds += wait
+
     stat = None
     while (stat == None):
         try:
+            __status_requests += 1
             stat = __dev.ctrl_transfer(0xA1, __DFU_GETSTATUS, 0, __DFU_INTERFACE, 6, 20000)
         except usb.USBError as err:
             if print_errors:
@@ -170,29 +240,55 @@ def get_status(retry: int = 3, print_errors: bool = True):
                 raise err
             retry = retry - 1
 
+    status = DfuStatus(stat[0], stat[1] | (stat[2] << 8) | (stat[3] << 16), stat[4], stat[5])
+    if status.bwPollTimeout:
+        __next_status_time = time.monotonic() + status.bwPollTimeout / 1000
+    else:
+        __next_status_time = 0.0
+
     # firmware can provide an optional string for any error
-    if stat[5]:
-        message = get_string(__dev, stat[5])
+    if status.iString and status.bStatus != __DFU_STATUS_OK:
+        message = get_status_string(status.iString)
         if message:
             print(message)
 
-    return stat[4]
+    return status
+
+
+def get_status_string(index):
+    """Gets a status string, only reading it from the device the first time."""
+    if index not in __status_strings:
+        __status_strings[index] = get_string(__dev, index)
+    return __status_strings[index]
+
+
+def get_status(retry: int = 3, print_errors: bool = True):
+    """Get the state after the last operation."""
+    return get_dfu_status(retry, print_errors).bState
 
 
 def check_status(stage, expected):
+    """Waits for the device to reach the expected state, and returns its
+    DfuStatus. Raises ValueError if it doesn't.
+    """
     num_trys = 3
 
     start_time = time.monotonic()
     timeout = False
 
     while not timeout:
-        status = get_status()
+        status = get_dfu_status()
         timeout = (time.monotonic() - start_time) > 5
-        if status == expected:
-            return
-        if (status == __DFU_STATE_DFU_DOWNLOAD_BUSY and expected == __DFU_STATE_DFU_DOWNLOAD_IDLE):
+        if status.bState == expected:
+            return status
+        if (status.bState == __DFU_STATE_DFU_DOWNLOAD_BUSY and expected == __DFU_STATE_DFU_DOWNLOAD_IDLE):
             continue
-        msg = "DFU: %s failed (got %s expected %s)" % (stage, __DFU_STATUS_STR.get(status, status), __DFU_STATUS_STR.get(expected, expected))
+        msg = "DFU: %s failed (got %s %s expected %s)" % (
+            stage,
+            __DFU_STATUS_STR.get(status.bState, status.bState),
+            __DFU_ERROR_STR.get(status.bStatus, "OK"),
+            __DFU_STATUS_STR.get(expected, expected),
+        )
         print(msg)
         if (num_trys < 0):
             raise ValueError(msg)
@@ -203,16 +299,52 @@ def check_status(stage, expected):
     raise ValueError(msg)
 
 
-def mass_erase():
-    """Performs a MASS erase (i.e. erases the entire device)."""
-    # Send DNLOAD with first byte=0x41
-    __dev.ctrl_transfer(0x21, __DFU_DNLOAD, 0, __DFU_INTERFACE, "\x41", __TIMEOUT)
+def run_command(stage, block, buf):
+    """Sends a DNLOAD of buf as block, and waits for the device to finish
+    running it. The time it took is added to the stage's timing.
+    """
+    start_time = time.monotonic()
+    start_busy = __busy_seconds
+    start_requests = __status_requests
+
+    __dev.ctrl_transfer(0x21, __DFU_DNLOAD, block, __DFU_INTERFACE, buf, __TIMEOUT)
 
     # Execute last command
-    check_status("erase", __DFU_STATE_DFU_DOWNLOAD_BUSY)
+    check_status(stage, __DFU_STATE_DFU_DOWNLOAD_BUSY)
 
     # Check command state
-    check_status("erase", __DFU_STATE_DFU_DOWNLOAD_IDLE)
+    check_status(stage, __DFU_STATE_DFU_DOWNLOAD_IDLE)
+
+    timing = __timing.setdefault(stage, {"count": 0, "seconds": 0.0, "busy_seconds": 0.0, "status_requests": 0})
+    timing["count"] += 1
+    timing["seconds"] += time.monotonic() - start_time
+    timing["busy_seconds"] += __busy_seconds - start_busy
+    timing["status_requests"] += __status_requests - start_requests
+
+
+def get_timing():
+    """Returns where the time of each stage ("erase", "set address",
+    "write memory") went, since the last reset_timing(). Each stage is a
+    dictionary with the following keys:
+        count           - Number of commands run.
+        seconds         - Total time, from sending each DNLOAD until the
+                          device was idle again.
+        busy_seconds    - Part of seconds spent waiting because the device
+                          said it was busy. The rest is host and USB overhead.
+        status_requests - Number of GETSTATUS requests sent.
+    """
+    return {stage: dict(timing) for stage, timing in __timing.items()}
+
+
+def reset_timing():
+    """Clears the timing returned by get_timing()."""
+    __timing.clear()
+
+
+def mass_erase():
+    """Performs a MASS erase (i.e. erases the entire device)."""
+    # Send DNLOAD with first byte=0x41
+    run_command("erase", 0, "\x41")
 
 
 def page_erase(addr):
@@ -222,26 +354,14 @@ def page_erase(addr):
 
     # Send DNLOAD with first byte=0x41 and page address
     buf = struct.pack("<BI", 0x41, addr)
-    __dev.ctrl_transfer(0x21, __DFU_DNLOAD, 0, __DFU_INTERFACE, buf, __TIMEOUT)
-
-    # Execute last command
-    check_status("erase", __DFU_STATE_DFU_DOWNLOAD_BUSY)
-
-    # Check command state
-    check_status("erase", __DFU_STATE_DFU_DOWNLOAD_IDLE)
+    run_command("erase", 0, buf)
 
 
 def set_address(addr):
     """Sets the address for the next operation."""
     # Send DNLOAD with first byte=0x21 and page address
     buf = struct.pack("<BI", 0x21, addr)
-    __dev.ctrl_transfer(0x21, __DFU_DNLOAD, 0, __DFU_INTERFACE, buf, __TIMEOUT)
-
-    # Execute last command
-    check_status("set address", __DFU_STATE_DFU_DOWNLOAD_BUSY)
-
-    # Check command state
-    check_status("set address", __DFU_STATE_DFU_DOWNLOAD_IDLE)
+    run_command("set address", 0, buf)
 
 
 def read_memory(addr, xfer_total, progress=None, progress_addr=0, progress_size=0):
@@ -297,15 +417,23 @@ def read_memory(addr, xfer_total, progress=None, progress_addr=0, progress_size=
     return result
 
 
-def write_memory(addr, buf, progress=None, progress_addr=0, progress_size=0):
+def write_memory(addr, buf, progress=None, progress_addr=0, progress_size=0, skip_blank=False):
     """Writes a buffer into memory. This routine assumes that memory has
     already been erased.
+
+    The address is only set once. Each chunk after that is sent with the next
+    block number, and the device writes it at
+    addr + (block - 2) * wTransferSize, the same way read_memory() reads.
+    With skip_blank, chunks that are all 0xFF aren't sent at all, their
+    block number is just skipped.
     """
 
     xfer_count = 0
     xfer_bytes = 0
     xfer_total = len(buf)
     xfer_base = addr
+    block = __DFU_MAX_BLOCK + 1
+    blank = b"\xFF" * __cfg_descr.wTransferSize if skip_blank else None
 
     while xfer_bytes < xfer_total:
         if __verbose and xfer_count % 512 == 0:
@@ -316,20 +444,17 @@ def write_memory(addr, buf, progress=None, progress_addr=0, progress_size=0):
         if progress and xfer_count % 2 == 0:
             progress(progress_addr, xfer_base + xfer_bytes - progress_addr, progress_size)
 
-        # Set mem write address
-        set_address(xfer_base + xfer_bytes)
-
-        # Send DNLOAD with fw data
         chunk = min(__cfg_descr.wTransferSize, xfer_total - xfer_bytes)
-        __dev.ctrl_transfer(
-            0x21, __DFU_DNLOAD, 2, __DFU_INTERFACE, buf[xfer_bytes: xfer_bytes + chunk], __TIMEOUT
-        )
-
-        # Execute last command
-        check_status("write memory", __DFU_STATE_DFU_DOWNLOAD_BUSY)
+        data = buf[xfer_bytes: xfer_bytes + chunk]
+        if blank is None or data != blank[:chunk]:
+            if block > __DFU_MAX_BLOCK:
+                # Set mem write address, again if the block number would overflow
+                set_address(xfer_base + xfer_bytes)
+                block = __DFU_FIRST_DATA_BLOCK
 
-        # Check command state
-        check_status("write memory", __DFU_STATE_DFU_DOWNLOAD_IDLE)
+            # Send DNLOAD with fw data
+            run_command("write memory", block, data)
+        block += 1
 
         xfer_count += 1
         xfer_bytes += chunk
@@ -346,13 +471,7 @@ def write_page(buf, xfer_offset):
     set_address(xfer_base + xfer_offset)
 
     # Send DNLOAD with fw data
-    __dev.ctrl_transfer(0x21, __DFU_DNLOAD, 2, __DFU_INTERFACE, buf, __TIMEOUT)
-
-    # Execute last command
-    check_status("write memory", __DFU_STATE_DFU_DOWNLOAD_BUSY)
-
-    # Check command state
-    check_status("write memory", __DFU_STATE_DFU_DOWNLOAD_IDLE)
+    run_command("write memory", __DFU_FIRST_DATA_BLOCK, buf)
 
     if __verbose:
         print("Write: 0x%x " % (xfer_base + xfer_offset))
@@ -396,128 +515,25 @@ def named(values, names):
     return dict(zip(names.split(), values))
 
 
-def consume(fmt, data, names):
-    """Parses the struct defined by `fmt` from `data`, stores the parsed fields
-    into a named tuple using `names`. Returns the named tuple, and the data
-    with the struct stripped off."""
-
-    size = struct.calcsize(fmt)
-    return named(struct.unpack(fmt, data[:size]), names), data[size:]
-
-
-def cstring(string):
-    """Extracts a null-terminated string from a byte array."""
-    return string.decode("utf-8").split("\0", 1)[0]
-
-
-def compute_crc(data):
-    """Computes the CRC32 value for the data passed in."""
-    return 0xFFFFFFFF & -zlib.crc32(data) - 1
-
-
 def read_dfu_file(filename):
-    """Reads a DFU file, and parses the individual elements from the file.
-    Returns an array of elements. Each element is a dictionary with the
-    following keys:
+    """Reads a DFU file, and returns it as a Firmware_Image, whose elements
+    (Firmware_Element) have these fields:
         num     - The element index.
-        address - The address that the element data should be written to.
+        addr    - The address that the element data should be written to.
         size    - The size of the element data.
-        data    - The element data.
+        data    - The element data, a memoryview of the memory mapped file.
     If an error occurs while parsing the file, then None is returned.
+    See Firmware_Image.load() for other file formats.
     """
 
-    print("File: {}".format(filename))
-    with open(filename, "rb") as fin:
-        data = fin.read()
-    crc = compute_crc(data[:-4])
-    elements = []
-
-    # Decode the DFU Prefix
-    #
-    # <5sBIB
-    #   <   little endian           Endianness
-    #   5s  char[5]     signature   "DfuSe"
-    #   B   uint8_t     version     1
-    #   I   uint32_t    size        Size of the DFU file (without suffix)
-    #   B   uint8_t     targets     Number of targets
-    dfu_prefix, data = consume("<5sBIB", data, "signature version size targets")
-    print(
-        "    %(signature)s v%(version)d, image size: %(size)d, "
-        "targets: %(targets)d" % dfu_prefix
-    )
-    for target_idx in range(dfu_prefix["targets"]):
-        # Decode the Image Prefix
-        #
-        # <6sBI255s2I
-        #   <       little endian           Endianness
-        #   6s      char[6]     signature   "Target"
-        #   B       uint8_t     altsetting
-        #   I       uint32_t    named       Bool indicating if a name was used
-        #   255s    char[255]   name        Name of the target
-        #   I       uint32_t    size        Size of image (without prefix)
-        #   I       uint32_t    elements    Number of elements in the image
-        img_prefix, data = consume(
-            "<6sBI255s2I", data, "signature altsetting named name " "size elements"
-        )
-        img_prefix["num"] = target_idx
-        if img_prefix["named"]:
-            img_prefix["name"] = cstring(img_prefix["name"])
-        else:
-            img_prefix["name"] = ""
-        print(
-            "    %(signature)s %(num)d, alt setting: %(altsetting)s, "
-            'name: "%(name)s", size: %(size)d, elements: %(elements)d' % img_prefix
-        )
-
-        target_size = img_prefix["size"]
-        target_data = data[:target_size]
-        data = data[target_size:]
-        for elem_idx in range(img_prefix["elements"]):
-            # Decode target prefix
-            #
-            # <2I
-            #   <   little endian           Endianness
-            #   I   uint32_t    element     Address
-            #   I   uint32_t    element     Size
-            elem_prefix, target_data = consume("<2I", target_data, "addr size")
-            elem_prefix["num"] = elem_idx
-            print("      %(num)d, address: 0x%(addr)08x, size: %(size)d" % elem_prefix)
-            elem_size = elem_prefix["size"]
-            elem_data = target_data[:elem_size]
-            target_data = target_data[elem_size:]
-            elem_prefix["data"] = elem_data
-            elements.append(elem_prefix)
-
-        if len(target_data):
-            print("target %d PARSE ERROR" % target_idx)
-
-    # Decode DFU Suffix
-    #
-    # <4H3sBI
-    #   <   little endian           Endianness
-    #   H   uint16_t    device      Firmware version
-    #   H   uint16_t    product
-    #   H   uint16_t    vendor
-    #   H   uint16_t    dfu         0x11a   (DFU file format version)
-    #   3s  char[3]     ufd         "UFD"
-    #   B   uint8_t     len         16
-    #   I   uint32_t    crc32       Checksum
-    dfu_suffix = named(
-        struct.unpack("<4H3sBI", data[:16]), "device product vendor dfu ufd len crc"
-    )
-    print(
-        "    usb: %(vendor)04x:%(product)04x, device: 0x%(device)04x, "
-        "dfu: 0x%(dfu)04x, %(ufd)s, %(len)d, 0x%(crc)08x" % dfu_suffix
-    )
-    if crc != dfu_suffix["crc"]:
-        print("CRC ERROR: computed crc32 is 0x%08x" % crc)
-        return
-    data = data[16:]
-    if data:
-        print("PARSE ERROR")
-        return
-
-    return elements
+    try:
+        image = Firmware_Image.fromDfuFile(filename)
+    except ValueError as err:
+        print(err)
+        return None
+    for line in image.describe():
+        print(line)
+    return image
 
 
 class FilterDFU(object):
@@ -611,9 +627,9 @@ def verify_elements(elements, progress=None) -> bool:
     """Read from memory and compares with the indicated elements.
     """
     for elem in elements:
-        addr = elem["addr"]
-        size = elem["size"]
-        data = elem["data"]
+        addr = elem.addr
+        size = elem.size
+        data = elem.data
         elem_size = size
         elem_addr = addr
         if progress and elem_size:
@@ -632,39 +648,236 @@ def verify_elements(elements, progress=None) -> bool:
     return True
 
 
-def write_elements(elements, mass_erase_used, progress=None):
-    """Writes the indicated elements into the target memory,
-    erasing as needed.
+def segment_table(mem_layout):
+    """Returns the segments of mem_layout sorted by address, and a list of
+    their addresses, for find_segment() to search.
     """
+    segments = sorted(mem_layout, key=lambda segment: segment["addr"])
+    return segments, [segment["addr"] for segment in segments]
 
-    mem_layout = get_memory_layout(__dev)
+
+def find_segment(table, addr):
+    """Returns the segment of a segment_table() holding addr, or None."""
+    segments, segment_addrs = table
+    index = bisect.bisect_right(segment_addrs, addr) - 1
+    if index >= 0 and addr <= segments[index]["last_addr"]:
+        return segments[index]
+    return None
+
+
+def get_pages(mem_layout, elements):
+    """Returns what each page holding part of elements should contain once
+    they're written, as a dictionary of page address to bytearray. Parts of
+    a page that aren't in any element are 0xFF, like erased flash. Where
+    elements overlap, the later one wins.
+    """
+    table = segment_table(mem_layout)
+    pages = {}
     for elem in elements:
-        addr = elem["addr"]
-        size = elem["size"]
-        data = elem["data"]
-        elem_size = size
-        elem_addr = addr
-        if progress and elem_size:
-            progress(elem_addr, 0, elem_size)
-        while size > 0:
-            write_size = size
-            if not mass_erase_used:
-                for segment in mem_layout:
-                    if addr >= segment["addr"] and addr <= segment["last_addr"]:
-                        # We found the page containing the address we want to
-                        # write, erase it
-                        page_size = segment["page_size"]
-                        page_addr = addr & ~(page_size - 1)
-                        if addr + write_size > page_addr + page_size:
-                            write_size = page_addr + page_size - addr
-                        page_erase(page_addr)
-                        break
-            write_memory(addr, data[:write_size], progress, elem_addr, elem_size)
-            data = data[write_size:]
-            addr += write_size
-            size -= write_size
-            if progress:
-                progress(elem_addr, addr - elem_addr, elem_size)
+        addr = elem.addr
+        end_addr = addr + elem.size
+        data = elem.data
+        while addr < end_addr:
+            segment = find_segment(table, addr)
+            if segment is None:
+                raise ValueError("DFU: 0x%x is outside of the memory layout" % addr)
+            page_size = segment["page_size"]
+            page_addr = addr & ~(page_size - 1)
+            page = pages.get(page_addr)
+            if page is None:
+                page = pages[page_addr] = bytearray(b"\xFF" * page_size)
+            count = min(end_addr, page_addr + page_size) - addr
+            offset = addr - elem.addr
+            page[addr - page_addr: addr - page_addr + count] = data[offset: offset + count]
+            addr += count
+    return pages
+
+
+def hash_page(data):
+    """Returns the hash differential writes compare pages by."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def page_runs(pages, page_addrs):
+    """Groups page_addrs (sorted) into runs of pages next to each other.
+    Returns a list of (address, list of page addresses) for each run.
+    """
+    runs = []
+    run_end = None
+    for page_addr in page_addrs:
+        if page_addr != run_end:
+            runs.append((page_addr, []))
+        runs[-1][1].append(page_addr)
+        run_end = page_addr + len(pages[page_addr])
+    return runs
+
+
+def read_page_hashes(pages):
+    """Reads pages back from the device, and returns the hash of each, by
+    page address. Pages next to each other are read together.
+    """
+    hashes = {}
+    for run_addr, run_pages in page_runs(pages, sorted(pages)):
+        data = read_memory(run_addr, sum(len(pages[page_addr]) for page_addr in run_pages))
+        offset = 0
+        for page_addr in run_pages:
+            page_size = len(pages[page_addr])
+            hashes[page_addr] = hash_page(data[offset: offset + page_size])
+            offset += page_size
+    return hashes
+
+
+def plan_write(mem_layout, pages, transfer_size, erase=True, changed=None, mass_erase_fraction=__MASS_ERASE_FRACTION,
+               allow_mass_erase=False):
+    """Works out the commands that write pages (from get_pages()) with the
+    fewest transfers. Pages next to each other become one run, written
+    after setting the address once. Chunks of a run that are all 0xFF are
+    left out, since erased flash already holds them.
+
+    Only the pages in changed are written, if it isn't None. They're
+    erased first, unless erase is False, with one mass_erase() if they
+    cover at least mass_erase_fraction of the flash (every page is written
+    after a mass erase). A mass erase also wipes any page that isn't in
+    pages, so it's only used when pages cover the whole layout, or if
+    allow_mass_erase is True. A mass_erase_fraction of None never mass
+    erases.
+
+    Returns the plan, a dictionary with the following keys:
+        mass_erase   - True to start with a mass_erase().
+        runs         - The runs, in address order. Each is a dictionary
+                       with the following keys:
+            addr         - Address of the run.
+            data         - What to write there.
+            erase        - Addresses of the pages to page_erase() first.
+            blocks       - Number of chunks to write.
+            blank_blocks - Number of chunks left out for being all 0xFF.
+        pages        - Number of pages written.
+        total_pages  - Number of pages in pages.
+        transfers    - Estimated number of control transfers.
+    """
+    page_addrs = sorted(pages) if changed is None else sorted(changed)
+    flash_size = sum(segment["size"] for segment in mem_layout)
+    write_size = sum(len(pages[page_addr]) for page_addr in page_addrs)
+    layout_pages = sum(segment["num_pages"] for segment in mem_layout)
+    use_mass_erase = (
+        erase
+        and mass_erase_fraction is not None
+        and write_size > 0
+        and write_size >= mass_erase_fraction * flash_size
+        and (allow_mass_erase or len(pages) == layout_pages)
+    )
+    if use_mass_erase:
+        page_addrs = sorted(pages)
+
+    blank = b"\xFF" * transfer_size
+    blocks_per_address = __DFU_MAX_BLOCK - __DFU_FIRST_DATA_BLOCK + 1
+    # Every command is a DNLOAD, and two GETSTATUS requests.
+    transfers = __COMMAND_TRANSFERS if use_mass_erase else 0
+    runs = []
+    for run_addr, run_pages in page_runs(pages, page_addrs):
+        data = b"".join(pages[page_addr] for page_addr in run_pages)
+        num_blocks = (len(data) + transfer_size - 1) // transfer_size
+        blank_blocks = sum(
+            1 for offset in range(0, len(data), transfer_size)
+            if data[offset: offset + transfer_size] == blank[: len(data) - offset]
+        )
+        run_erase = run_pages if erase and not use_mass_erase else []
+        runs.append(
+            named(
+                (run_addr, data, run_erase, num_blocks - blank_blocks, blank_blocks),
+                "addr data erase blocks blank_blocks",
+            )
+        )
+        # Roughly, the address is set again when the block number overflows.
+        set_addresses = (num_blocks - 1) // blocks_per_address + 1 if num_blocks > blank_blocks else 0
+        transfers += __COMMAND_TRANSFERS * (len(run_erase) + set_addresses + num_blocks - blank_blocks)
+    return {
+        "mass_erase": use_mass_erase,
+        "runs": runs,
+        "pages": len(page_addrs),
+        "total_pages": len(pages),
+        "transfers": transfers,
+    }
+
+
+def plan_elements(elements, mass_erase_used=False, allow_mass_erase=False):
+    """Plans writing every page of elements, see plan_write()."""
+    mem_layout = get_memory_layout(__dev)
+    pages = get_pages(mem_layout, elements)
+    return plan_write(mem_layout, pages, __cfg_descr.wTransferSize, erase=not mass_erase_used, allow_mass_erase=allow_mass_erase)
+
+
+def plan_differential(elements, old_hashes=None, allow_mass_erase=False):
+    """Plans writing only the pages of elements that changed, see
+    plan_write().
+
+    old_hashes are the page hashes of what's on the device, as returned by
+    a previous call. If they're None, the pages are read back and hashed.
+
+    Returns the plan, and the page hashes of elements.
+    """
+    mem_layout = get_memory_layout(__dev)
+    pages = get_pages(mem_layout, elements)
+    new_hashes = {page_addr: hash_page(page) for page_addr, page in pages.items()}
+    if old_hashes is None:
+        old_hashes = read_page_hashes(pages)
+    changed = [page_addr for page_addr in pages if old_hashes.get(page_addr) != new_hashes[page_addr]]
+    return plan_write(mem_layout, pages, __cfg_descr.wTransferSize, changed=changed, allow_mass_erase=allow_mass_erase), new_hashes
+
+
+def write_plan(plan, progress=None):
+    """Runs a plan from plan_write(). The pages of each run are erased just
+    before it's written.
+    """
+    if plan["mass_erase"]:
+        mass_erase()
+    total = sum(len(run["data"]) for run in plan["runs"])
+    written = 0
+    for run in plan["runs"]:
+        for page_addr in run["erase"]:
+            page_erase(page_addr)
+
+        def run_progress(addr, offset, size):
+            progress(addr, written + offset, total)
+
+        write_memory(run["addr"], run["data"], run_progress if progress else None, run["addr"], len(run["data"]), skip_blank=True)
+        written += len(run["data"])
+    if progress and total:
+        progress(0, total, total)
+
+
+def print_plan(plan):
+    """Prints a plan from plan_write()."""
+    blocks = sum(run["blocks"] for run in plan["runs"])
+    blank_blocks = sum(run["blank_blocks"] for run in plan["runs"])
+    print(
+        "Plan: %s%d of %d pages in %d runs, %d blocks (%d blank blocks left out), about %d control transfers"
+        % ("mass erase, " if plan["mass_erase"] else "", plan["pages"], plan["total_pages"], len(plan["runs"]),
+           blocks, blank_blocks, plan["transfers"])
+    )
+    for run in plan["runs"]:
+        print(
+            "    0x%08x %7d bytes, %3d pages erased, %4d blocks, %4d blank"
+            % (run["addr"], len(run["data"]), len(run["erase"]), run["blocks"], run["blank_blocks"])
+        )
+
+
+def write_elements(elements, mass_erase_used, progress=None, allow_mass_erase=False):
+    """Writes the indicated elements into the target memory,
+    erasing as needed, see plan_write().
+    """
+    write_plan(plan_elements(elements, mass_erase_used, allow_mass_erase), progress)
+
+
+def write_elements_differential(elements, old_hashes=None, progress=None, allow_mass_erase=False):
+    """Writes the indicated elements into the target memory, only erasing
+    and writing the pages that changed, see plan_differential().
+
+    Returns the page hashes of elements, and the plan that was run.
+    """
+    plan, new_hashes = plan_differential(elements, old_hashes, allow_mass_erase)
+    write_plan(plan, progress)
+    return new_hashes, plan
 
 
 def cli_progress(addr, offset, size):
@@ -702,6 +915,9 @@ def main():
         "-u", "--upload", help="read file from DFU device", dest="path", default=False
     )
     parser.add_argument("-x", "--exit", help="Exit DFU", action="store_true", default=False)
+    parser.add_argument(
+        "-n", "--dry-run", help="print the write plan for --upload, without writing", action="store_true", default=False
+    )
     parser.add_argument(
         "-v", "--verbose", help="increase output verbosity", action="store_true", default=False
     )
@@ -723,16 +939,20 @@ def main():
     init(**kwargs)
 
     command_run = False
-    if args.mass_erase:
+    if args.mass_erase and not args.dry_run:
         print("Mass erase...")
         mass_erase()
         command_run = True
 
     if args.path:
-        elements = read_dfu_file(args.path)
-        if not elements:
+        image = read_dfu_file(args.path)
+        if not image or not image.elements:
             print("No data in dfu file")
             return
+        elements = image.elements
+        if args.dry_run:
+            print_plan(plan_elements(elements, args.mass_erase))
+            return
         print("Writing memory...")
         write_elements(elements, args.mass_erase, progress=cli_progress)
 
@@ -0,0 +1,248 @@
+# A simulated STM32 in its DFU bootloader, so pydfu can be tried (and timed) without hardware.
+# It answers control transfers the way ST's DfuSe bootloader does (AN3156): commands and data are sent with DNLOAD,
+# and only run when the host asks for the status afterwards. Flash acts like flash, so writing a page that wasn't erased corrupts it.
+
+import array
+import struct
+import time
+from typing import Dict, Optional
+import usb.core
+import lib_six15_api.pydfu as PyDfu
+
+
+class Sim_DFU_Interface:
+    def __init__(self, iInterface: int, extra_descriptors: bytes) -> None:
+        self.iInterface = iInterface
+        self.extra_descriptors = extra_descriptors
+
+
+class Sim_DFU_Configuration:
+    def __init__(self, interface: Sim_DFU_Interface) -> None:
+        self.interface = interface
+        self.extra_descriptors = b""
+
+    def __getitem__(self, key) -> Sim_DFU_Interface:
+        # Like cfg[(0, 0)], there is only one interface.
+        return self.interface
+
+    def interfaces(self):
+        return [self.interface]
+
+
+class Sim_DFU_Device:
+    # Stands in for the usb.core.Device that pydfu finds.
+
+    # Requests
+    DNLOAD = 1
+    UPLOAD = 2
+    GETSTATUS = 3
+    CLRSTATUS = 4
+    GETSTATE = 5
+    ABORT = 6
+    GET_DESCRIPTOR = 6
+    # States
+    STATE_IDLE = 0x02
+    STATE_DNLOAD_SYNC = 0x03
+    STATE_DNBUSY = 0x04
+    STATE_DNLOAD_IDLE = 0x05
+    STATE_MANIFEST_SYNC = 0x06
+    STATE_MANIFEST = 0x07
+    STATE_UPLOAD_IDLE = 0x09
+    STATE_ERROR = 0x0A
+    # Statuses
+    STATUS_OK = 0x00
+    STATUS_ERR_TARGET = 0x01
+    STATUS_ERR_ADDRESS = 0x08
+    STATUS_ERR_STALLED_PKT = 0x0F
+    # DfuSe commands, the first byte of block 0
+    CMD_SET_ADDRESS = 0x21
+    CMD_ERASE = 0x41
+
+    SERIAL_NUMBER_STRING_INDEX = 3
+    LAYOUT_STRING_INDEX = 4
+
+    def __init__(self, flash_address: int = 0x08000000, page_size: int = 2048, num_pages: int = 128, transfer_size: int = 2048,
+                 transfer_seconds: float = 0.0, erase_seconds: float = 0.0, program_seconds: float = 0.0, answer_while_busy: bool = True,
+                 serial_number: str = "205F39835734", mass_erase_seconds: Optional[float] = None) -> None:
+        # transfer_seconds: how long each control transfer takes.
+        # erase_seconds, program_seconds: how long erasing a page, and writing one block, keep the device busy.
+        # mass_erase_seconds: how long a mass erase does, erase_seconds for every page if None.
+        # answer_while_busy: a GETSTATUS sent before the device is done gets DNBUSY back straight away, with the time left as bwPollTimeout.
+        # Otherwise the device doesn't answer until it's done.
+        self.flash_address = flash_address
+        self.page_size = page_size
+        self.transfer_size = transfer_size
+        self.transfer_seconds = transfer_seconds
+        self.erase_seconds = erase_seconds
+        self.program_seconds = program_seconds
+        self.mass_erase_seconds = mass_erase_seconds
+        self.answer_while_busy = answer_while_busy
+        # Starts with old firmware in it, not erased.
+        self.flash = bytearray(page_size * num_pages)
+        self.state = Sim_DFU_Device.STATE_IDLE
+        self.status = Sim_DFU_Device.STATUS_OK
+        self.address = flash_address
+        self.pending_block: Optional[int] = None
+        self.pending_data = b""
+        self.busy_until = 0.0
+        self.poll_timeout_ms = 0
+        self.manifested = False
+        self.langids = (0x0409,)
+        self.iSerialNumber = Sim_DFU_Device.SERIAL_NUMBER_STRING_INDEX
+        self.strings: Dict[int, str] = {
+            Sim_DFU_Device.SERIAL_NUMBER_STRING_INDEX: serial_number,
+            Sim_DFU_Device.LAYOUT_STRING_INDEX: f"@Internal Flash  /0x{flash_address:08X}/{num_pages:02d}*{page_size // 1024:03d}Kg",
+        }
+        functional_descriptor = struct.pack("<BBBHHH", 9, PyDfu._DFU_DESCRIPTOR_TYPE, 0x0B, 255, transfer_size, 0x011A)
+        self.configuration = Sim_DFU_Configuration(Sim_DFU_Interface(Sim_DFU_Device.LAYOUT_STRING_INDEX, functional_descriptor))
+        # Counters
+        self.control_transfers = 0
+        self.requests: Dict[int, int] = {}
+        self.erased_pages = 0
+        self.mass_erases = 0
+
+    def attach(self):
+        # Makes pydfu use this device, like PyDfu.init() does with a real one.
+        # setattr() because "PyDfu.__dev" would be name mangled in here.
+        setattr(PyDfu, "__dev", self)
+        setattr(PyDfu, "__cfg_descr", PyDfu.find_dfu_cfg_descr(self.configuration.interface.extra_descriptors))
+        setattr(PyDfu, "__next_status_time", 0.0)
+        setattr(PyDfu, "__status_strings", {})
+
+    def __getitem__(self, index: int) -> Sim_DFU_Configuration:
+        return self.configuration
+
+    def configurations(self):
+        return [self.configuration]
+
+    def set_configuration(self):
+        pass
+
+    def ctrl_transfer(self, bmRequestType: int, bRequest: int, wValue: int = 0, wIndex: int = 0, data_or_wLength=None, timeout=None):
+        if (self.manifested):
+            raise usb.core.USBError("Device has reset", errno=19)
+        self.control_transfers += 1
+        self.requests[bRequest] = self.requests.get(bRequest, 0) + 1
+        if (self.transfer_seconds != 0):
+            time.sleep(self.transfer_seconds)
+        if (bmRequestType == 0x80 and bRequest == Sim_DFU_Device.GET_DESCRIPTOR):
+            return self.stringDescriptor(wValue & 0xFF)
+        if (bmRequestType == 0x21):
+            self.handleOut(bRequest, wValue, b"" if data_or_wLength == None else bytes(data_or_wLength, "latin-1") if isinstance(data_or_wLength, str) else bytes(data_or_wLength))
+            return len(data_or_wLength) if data_or_wLength != None else 0
+        if (bmRequestType == 0xA1):
+            return self.handleIn(bRequest, wValue, data_or_wLength)
+        raise usb.core.USBError("Pipe error", errno=32)
+
+    def stringDescriptor(self, index: int) -> array.array:
+        if (index == 0):
+            data = struct.pack("<H", self.langids[0])
+        else:
+            data = self.strings.get(index, "").encode("utf-16-le")
+        return array.array("B", bytes([len(data) + 2, 3]) + data)
+
+    def stall(self, status: int):
+        self.state = Sim_DFU_Device.STATE_ERROR
+        self.status = status
+        raise usb.core.USBError("Pipe error", errno=32)
+
+    def handleOut(self, bRequest: int, wValue: int, data: bytes):
+        if (bRequest == Sim_DFU_Device.DNLOAD):
+            if (self.state not in (Sim_DFU_Device.STATE_IDLE, Sim_DFU_Device.STATE_DNLOAD_IDLE)):
+                self.stall(Sim_DFU_Device.STATUS_ERR_STALLED_PKT)
+            if (len(data) == 0):
+                self.state = Sim_DFU_Device.STATE_MANIFEST_SYNC
+                return
+            self.pending_block = wValue
+            self.pending_data = data
+            self.state = Sim_DFU_Device.STATE_DNLOAD_SYNC
+        elif (bRequest == Sim_DFU_Device.CLRSTATUS):
+            self.state = Sim_DFU_Device.STATE_IDLE
+            self.status = Sim_DFU_Device.STATUS_OK
+        elif (bRequest == Sim_DFU_Device.ABORT):
+            if (self.state != Sim_DFU_Device.STATE_ERROR):
+                self.state = Sim_DFU_Device.STATE_IDLE
+        else:
+            self.stall(Sim_DFU_Device.STATUS_ERR_STALLED_PKT)
+
+    def handleIn(self, bRequest: int, wValue: int, wLength: int) -> array.array:
+        if (bRequest == Sim_DFU_Device.GETSTATUS):
+            return self.getStatus()
+        if (bRequest == Sim_DFU_Device.GETSTATE):
+            return array.array("B", [self.state])
+        if (bRequest == Sim_DFU_Device.UPLOAD):
+            if (self.state not in (Sim_DFU_Device.STATE_IDLE, Sim_DFU_Device.STATE_UPLOAD_IDLE) or wValue < 2):
+                self.stall(Sim_DFU_Device.STATUS_ERR_STALLED_PKT)
+            offset = self.address + (wValue - 2) * self.transfer_size - self.flash_address
+            if (offset < 0 or offset + wLength > len(self.flash)):
+                self.stall(Sim_DFU_Device.STATUS_ERR_ADDRESS)
+            self.state = Sim_DFU_Device.STATE_UPLOAD_IDLE
+            return array.array("B", self.flash[offset:offset + wLength])
+        self.stall(Sim_DFU_Device.STATUS_ERR_STALLED_PKT)
+
+    def getStatus(self) -> array.array:
+        if (self.state == Sim_DFU_Device.STATE_DNLOAD_SYNC):
+            # Asking for the status is what starts the command.
+            busy_seconds = self.execute()
+            self.busy_until = time.monotonic() + busy_seconds
+            self.poll_timeout_ms = int(busy_seconds * 1000 + 0.999)
+            if (self.state != Sim_DFU_Device.STATE_ERROR):
+                self.state = Sim_DFU_Device.STATE_DNBUSY
+        elif (self.state == Sim_DFU_Device.STATE_DNBUSY):
+            remaining = self.busy_until - time.monotonic()
+            if (remaining > 0 and self.answer_while_busy):
+                self.poll_timeout_ms = int(remaining * 1000 + 0.999)
+            else:
+                if (remaining > 0):
+                    time.sleep(remaining)
+                self.state = Sim_DFU_Device.STATE_DNLOAD_IDLE
+                self.poll_timeout_ms = 0
+        elif (self.state == Sim_DFU_Device.STATE_MANIFEST_SYNC):
+            self.state = Sim_DFU_Device.STATE_MANIFEST
+        elif (self.state == Sim_DFU_Device.STATE_MANIFEST):
+            # Leaves the bootloader, and disappears from the bus.
+            self.manifested = True
+        poll = self.poll_timeout_ms
+        return array.array("B", [self.status, poll & 0xFF, (poll >> 8) & 0xFF, (poll >> 16) & 0xFF, self.state, 0])
+
+    def execute(self) -> float:
+        # Runs the DNLOADed command or block. Returns how long it keeps the device busy.
+        block = self.pending_block
+        data = self.pending_data
+        if (block == 0):
+            command = data[0]
+            if (command == Sim_DFU_Device.CMD_SET_ADDRESS and len(data) == 5):
+                self.address = struct.unpack_from("<I", data, 1)[0]
+                return 0.0
+            if (command == Sim_DFU_Device.CMD_ERASE):
+                if (len(data) == 1):
+                    self.flash[:] = b"\xFF" * len(self.flash)
+                    self.erased_pages += len(self.flash) // self.page_size
+                    self.mass_erases += 1
+                    if (self.mass_erase_seconds != None):
+                        return self.mass_erase_seconds
+                    return self.erase_seconds * len(self.flash) // self.page_size
+                offset = struct.unpack_from("<I", data, 1)[0] - self.flash_address
+                if (offset < 0 or offset >= len(self.flash) or offset % self.page_size != 0):
+                    self.state = Sim_DFU_Device.STATE_ERROR
+                    self.status = Sim_DFU_Device.STATUS_ERR_ADDRESS
+                    return 0.0
+                self.flash[offset:offset + self.page_size] = b"\xFF" * self.page_size
+                self.erased_pages += 1
+                return self.erase_seconds
+            self.state = Sim_DFU_Device.STATE_ERROR
+            self.status = Sim_DFU_Device.STATUS_ERR_TARGET
+            return 0.0
+        if (block < 2):
+            self.state = Sim_DFU_Device.STATE_ERROR
+            self.status = Sim_DFU_Device.STATUS_ERR_TARGET
+            return 0.0
+        offset = self.address + (block - 2) * self.transfer_size - self.flash_address
+        if (offset < 0 or offset + len(data) > len(self.flash)):
+            self.state = Sim_DFU_Device.STATE_ERROR
+            self.status = Sim_DFU_Device.STATUS_ERR_ADDRESS
+            return 0.0
+        # Flash can only clear bits, a byte written without erasing it first ends up as old AND new.
+        old = int.from_bytes(self.flash[offset:offset + len(data)], "little")
+        self.flash[offset:offset + len(data)] = (old & int.from_bytes(data, "little")).to_bytes(len(data), "little")
+        return self.program_seconds
@@ -2,58 +2,98 @@ import time
 from PySide6.QtCore import QThread
 import serial
 import serial.tools.list_ports
+from serial.tools.list_ports_common import ListPortInfo
 import platform
+import sys
+from typing import Callable, List, Optional
+from lib_six15_api.hotplug_monitor import Hotplug_Monitor
 from lib_six15_api.logger import Logger
+from lib_six15_api.log_line_assembler import Log_Line_Assembler
+from lib_six15_api.log_store import Log_Store_Writer
 
 
 class Serial_LogWatcher(QThread):
+    # How long a read waits for data, before checking if it should stop.
+    READ_TIMEOUT_SECONDS = 0.1
+    # Everything received is read at once, up to this much.
+    MAX_READ_SIZE = 64 * 1024
+    # How often to double check for the port, even if the hotplug monitor hasn't reported anything.
+    RECHECK_INTERVAL_SECONDS = 5.0
 
-    def __init__(self, vid: int, pid: int, prefix:str = "  ") -> None:
+    def __init__(self, vid: int, pid: int, prefix: str = "  ", log_store: Optional[Log_Store_Writer] = None, baud_rate: int = 115200) -> None:
+        # Lines are also saved to log_store, if given.
         super().__init__()
         self.vid = vid
         self.pid = pid
         self.prefix = prefix
+        self.log_store = log_store
+        self.baud_rate = baud_rate
+
+    def findPort(self) -> Optional[ListPortInfo]:
+        for port in serial.tools.list_ports.comports(include_links=False):
+            if (port.vid == self.vid and port.pid == self.pid):
+                return port
+        return None
 
     def run(self):
-        if (self != None):
-            interruptFunc = self.isInterruptionRequested
-        else:
-            def noInterrupt():
-                return False
-            interruptFunc = noInterrupt
-        while (not interruptFunc()):
+        monitor = Hotplug_Monitor.instance()
+        # If the device's HID interface is already being watched, its probe is used instead.
+        # Either way, the port is only looked for once the device is connected.
+        monitor.watch(self.vid, self.pid, lambda: self.findPort() != None)
+        while (not self.isInterruptionRequested()):
             try:
-                serial_device = None
-                for port in serial.tools.list_ports.comports(include_links=False):
-                    if (port.vid == self.vid and port.pid == self.pid):
-                        serial_device = port
-                        break
+                monitor.waitForState(self.vid, self.pid, True, Serial_LogWatcher.RECHECK_INTERVAL_SECONDS, self.isInterruptionRequested)
+                if (self.isInterruptionRequested()):
+                    break
+                # A timeout probes too, in case the hotplug monitor missed the port showing up.
+                serial_device = self.findPort()
                 if serial_device == None:
-                    time.sleep(0.1)
+                    # The CDC driver can take a little longer than the device to show up.
+                    time.sleep(0.5)
                     continue
                 if platform.system() == 'Windows':
                     # Logger.verbose("Delaying connection on Windows")
                     time.sleep(1)  # Windows takes forever at starting the CDC driver.
                 time.sleep(0.5)  # To let rest of the GUI update first. This tends to make the log look nicer
 
-                with serial.Serial(serial_device.device, 115200, timeout=0.1) as dev:
-                    data = bytearray(0)
-                    while (not interruptFunc()):
-                        data += dev.readline()
-                        if (len(data) == 0):
-                            time.sleep(0.1)
-                            continue
-                        line = data.decode(errors='replace')
-                        if (not line.endswith("\n")):
-                            continue
-                        data = bytearray(0)
-                        Logger.log_prefixed(line.rstrip(), self.prefix)
+                if (self.log_store != None):
+                    # The firmware version isn't known without the HID interface.
+                    self.log_store.setDevice(serial_device.serial_number, None)
+                with serial.Serial(serial_device.device, self.baud_rate, timeout=Serial_LogWatcher.READ_TIMEOUT_SECONDS) as dev:
+                    self.readPort(dev, self.isInterruptionRequested)
             except serial.SerialException as e:
                 # We sort of expect serial errors, since it will go away when the device disconnects.
                 # Print them to the console, just because they might be interesting.
                 print(f"Serial Err:{e}")
                 time.sleep(0.5)
 
+    def readPort(self, dev: serial.Serial, abortFunc: Callable[[], bool]):
+        # Logs lines from dev until abortFunc() returns True, or the port goes away (raising SerialException).
+        assembler = Log_Line_Assembler()
+        read = dev.read
+        try:
+            while (not abortFunc()):
+                # Whatever has arrived, in one read. With nothing waiting, waits up to READ_TIMEOUT_SECONDS for the first byte.
+                data = read(min(max(1, dev.in_waiting), Serial_LogWatcher.MAX_READ_SIZE))
+                received_ns = time.monotonic_ns()
+                if (len(data) == 0):
+                    continue
+                lines = assembler.feed(data)
+                if (len(lines) != 0):
+                    self.logLines(lines, received_ns)
+        finally:
+            partial = assembler.finish()
+            if (partial != None):
+                self.logLines([partial], time.monotonic_ns())
+
+    def logLines(self, lines: List[str], received_ns: int):
+        received = [received_ns] * len(lines)
+        levels = Logger.log_prefixed_batch(lines, self.prefix, received)
+        if (self.log_store != None):
+            self.log_store.addMany(levels, lines, received)
+
 
 if __name__ == '__main__':
-    logWatcher = Serial_LogWatcher.run(None)
+    # Usage: serial_log_watcher.py VID PID (in hex)
+    logWatcher = Serial_LogWatcher(int(sys.argv[1], 16), int(sys.argv[2], 16))
+    logWatcher.run()
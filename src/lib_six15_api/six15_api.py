@@ -1,47 +1,83 @@
-from typing import Optional, Callable, Tuple, Dict, Any, Type
+from typing import Optional, Callable, Tuple, Dict, Any, List, Type
 from abc import ABC, abstractmethod
 from lib_six15_api.six15_api_backend import Six15_API_Backend
+from lib_six15_api.six15_api_reactor import Six15_API_Reactor
+from lib_six15_api.six15_api_stats import Six15_API_Stats
+from concurrent.futures import Future
 import struct
+import time
 from lib_six15_api.logger import Logger
-from threading import Lock
 
 
 class Base_Response(ABC):
+    # Responses are created for every command (many per second while reading the log), so they don't get a __dict__.
+    __slots__ = ()
+
+    # Every response type with a format is compiled once, when its class is created.
+    compiled: Optional[struct.Struct] = None
+    compiled_size: int = 0
+
+    # Size mismatches are usually the same on every response, only warn about them every so often.
+    SIZE_WARNING_INTERVAL_SECONDS = 10.0
+    last_size_warning_time: Optional[float] = None
+    suppressed_size_warnings: int = 0
+
     @staticmethod
     @abstractmethod
     def format() -> Optional[str]:
         pass
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.last_size_warning_time = None
+        cls.suppressed_size_warnings = 0
+        if (getattr(cls.format, "__isabstractmethod__", False)):
+            return
+        format = cls.format()
+        if (format == None):
+            return
+        cls.compiled = struct.Struct(format)
+        cls.compiled_size = cls.compiled.size
+
     @staticmethod
     def decodeToStr(data: bytes) -> str:
         return data.decode('utf-8', errors='replace').strip('\0')
 
-    @staticmethod
-    def unpack_checked(format: str, buffer: bytes, resp_name: str) -> Tuple[Any, ...]:
-        format_size = struct.calcsize(format)
+    @classmethod
+    def unpack(cls, buffer: bytes) -> Optional[Tuple[Any, ...]]:
+        compiled = cls.compiled
         buffer_size = len(buffer)
-        # raise RuntimeError(f"Response was size:{buffer_size} expected size:{format_size}")
-        if (buffer_size < format_size):
-            # This response isn't large enough for what we expect. Give up and hope the specific response type will try older versions.
-            Logger.warn(f"Response \"{resp_name}\" size too small. Got size:{buffer_size} expected size:{format_size}")
-            # raise RuntimeError("Too small")
-            return None
-        if (buffer_size > format_size):
-            # Automatically remove any unexpected bytes.
+        if (buffer_size != compiled.size):
+            if (buffer_size < compiled.size):
+                # This response isn't large enough for what we expect. Give up and hope the specific response type will try older versions.
+                cls.warnSize("small", buffer_size)
+                return None
+            # unpack_from() ignores any unexpected bytes at the end.
             # This allows any future version of the response to be larger than the current currently expected value.
-            Logger.warn(f"Response \"{resp_name}\" size too big. Got size:{buffer_size} expected size:{format_size}")
-            buffer = buffer[0:format_size]
-            # raise RuntimeError("Too big")
-        return struct.unpack(format, buffer)
+            cls.warnSize("big", buffer_size)
+        return compiled.unpack_from(buffer)
+
+    @classmethod
+    def warnSize(cls, problem: str, buffer_size: int):
+        now = time.monotonic()
+        if (cls.last_size_warning_time != None and now - cls.last_size_warning_time < Base_Response.SIZE_WARNING_INTERVAL_SECONDS):
+            cls.suppressed_size_warnings += 1
+            return
+        suppressed = f" ({cls.suppressed_size_warnings} similar warnings suppressed)" if cls.suppressed_size_warnings != 0 else ""
+        cls.last_size_warning_time = now
+        cls.suppressed_size_warnings = 0
+        Logger.warn(f"Response \"{cls.__name__}\" size too {problem}. Got size:{buffer_size} expected size:{cls.compiled_size}{suppressed}")
 
 
 class Response_Default(Base_Response):
+    __slots__ = ("status",)
+
     @staticmethod
     def format() -> Optional[str]:
         return "<B"
 
     def __init__(self, resp):
-        data = Base_Response.unpack_checked(self.format(), resp, self.__class__.__name__)
+        data = self.unpack(resp)
 
         if (data == None):
             raise ValueError(f"Device did not respond to: {self.__class__.__name__} as expected.")
@@ -52,6 +88,9 @@ class Response_Default(Base_Response):
 class Base_CMD(ABC):
     value: int
     response: Type[Base_Response]
+    # Commands sent often in the background (like reading the log) should use PRIORITY_BACKGROUND,
+    # so they don't delay commands the user is waiting on.
+    priority: int = Six15_API_Reactor.PRIORITY_INTERACTIVE
 
 
 class Six15_API:
@@ -60,13 +99,37 @@ class Six15_API:
         super().__init__(*args)
         self.backend = backend
         self.fake = fake
-        self.comms_mutex = Lock()
+        # The reactor owns the backend, every command goes through it.
+        self.reactor = Six15_API_Reactor(backend)
+        self.stats: Optional[Six15_API_Stats] = None
+        self.command_listeners: List[Callable[[Type[Base_CMD]], None]] = []
 
     def isConnected(self) -> bool:
         return self.backend.isConnected()
 
     def close(self):
-        self.backend.close()
+        self.reactor.close()
+
+    def addCommandListener(self, callback: Callable[[Type[Base_CMD]], None]):
+        # callback(cmd) is called on the submitting thread whenever a command is submitted.
+        # The list is replaced rather than changed, so submitCommand() never has to lock it.
+        self.command_listeners = self.command_listeners + [callback]
+
+    def removeCommandListener(self, callback: Callable[[Type[Base_CMD]], None]):
+        self.command_listeners = [listener for listener in self.command_listeners if listener != callback]
+
+    def setStats(self, stats: Optional[Six15_API_Stats] = None):
+        # Start (or with None, stop) recording command latencies and backend counters into stats.
+        # The same stats can be given to the next device after a reconnect, to keep counting.
+        self.stats = stats
+        self.backend.setStats(None if stats == None else stats.backend)
+
+    def getStats(self) -> Optional[Dict[str, Any]]:
+        if (self.stats == None):
+            return None
+        snapshot = self.stats.snapshot()
+        snapshot["reactor"] = self.reactor.getStats()
+        return snapshot
 
     def sendSimpleCMD(self, cmd: Base_CMD, payload: Optional[bytes] = None, timeout: int = 1000) -> Optional[int]:
         resp: Response_Default = self.sendCommand(cmd, payload, timeout)
@@ -75,20 +138,38 @@ class Six15_API:
         return resp.status
 
     def sendCommand(self, cmd: Base_CMD, payload: Optional[bytes] = None, timeout: int = 1000) -> Optional[Base_Response]:
-        with self.comms_mutex:
-            cmdBuffer = bytearray(1)
-            cmdBuffer[0] = cmd.value
-            if (payload != None):
-                cmdBuffer += payload
-            # Use the backend to to the write
-            if cmd.response == None:
-                response_size = 0
-            else:
-                response_size = struct.calcsize(cmd.response.format())
-
-            resp = self.backend.sendCommand(cmdBuffer, response_size, timeout)
-            if (resp == None):
-                return None
-            # Parse the response into the response type
-            resp = cmd.response(resp)
-            return resp
+        return self.submitCommand(cmd, payload, timeout).result()
+
+    def submitCommand(self, cmd: Base_CMD, payload: Optional[bytes] = None, timeout: int = 1000) -> Future:
+        # Queues the command without waiting for it. The future's result is the parsed response.
+        cmdBuffer, response_size = Six15_API.buildCommand(cmd, payload)
+        finished = self.startCommand(cmd)
+        # Parse the response into the response type
+        future = self.reactor.submit(cmdBuffer, response_size, timeout, cmd.priority, cmd.response)
+        if (finished != None):
+            future.add_done_callback(lambda done: finished(None if done.cancelled() else done.exception()))
+        return future
+
+    def startCommand(self, cmd: Base_CMD) -> Optional[Callable[[Optional[BaseException]], None]]:
+        # Tells the command listeners about cmd, just before it's submitted. With stats attached, returns what to call
+        # once it's done (with its exception, or None) to record it. AsyncSix15_API.fromSync() sends through here too.
+        for listener in self.command_listeners:
+            listener(cmd)
+        stats = self.stats
+        if (stats == None):
+            return None
+        # Latency includes the time spent queued behind other commands, since that's what the caller waits for.
+        start_time = time.perf_counter_ns()
+        return lambda error: stats.recordCommand(cmd.__name__, time.perf_counter_ns() - start_time, error)
+
+    @staticmethod
+    def buildCommand(cmd: Base_CMD, payload: Optional[bytes] = None) -> Tuple[bytearray, int]:
+        cmdBuffer = bytearray(1)
+        cmdBuffer[0] = cmd.value
+        if (payload != None):
+            cmdBuffer += payload
+        if cmd.response == None:
+            response_size = 0
+        else:
+            response_size = cmd.response.compiled_size
+        return cmdBuffer, response_size
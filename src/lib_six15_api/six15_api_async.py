@@ -0,0 +1,92 @@
+# asyncio versions of Six15_API and the backend interface.
+# Awaiting a command doesn't need a thread per caller, so one event loop can drive many devices and log streams at once.
+# The synchronous Six15_API keeps working next to this, both can share the same reactor.
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Optional
+from lib_six15_api.six15_api import Six15_API, Base_CMD, Base_Response, Response_Default
+from lib_six15_api.six15_api_reactor import Six15_API_Reactor
+
+
+class Six15_API_Backend_Async(ABC):
+
+    @abstractmethod
+    async def sendCommand(self, write_buff: bytes, read_size: int, timeout: int = 1000, priority: int = Six15_API_Reactor.PRIORITY_INTERACTIVE,
+                          parse: Optional[Callable[[bytes], Any]] = None) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def isConnected(self) -> bool:
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class Six15_API_Backend_Async_Reactor(Six15_API_Backend_Async):
+    # Adapts any blocking backend. The blocking calls (hidapi, ...) run on the reactor thread that owns the backend,
+    # so there is exactly one executor thread per device no matter how many tasks are waiting on it.
+
+    def __init__(self, reactor: Six15_API_Reactor):
+        self.reactor = reactor
+
+    async def sendCommand(self, write_buff: bytes, read_size: int, timeout: int = 1000, priority: int = Six15_API_Reactor.PRIORITY_INTERACTIVE,
+                          parse: Optional[Callable[[bytes], Any]] = None) -> Optional[Any]:
+        future = self.reactor.submit(write_buff, read_size, timeout, priority, parse)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # If the command hasn't been sent yet it never will be. One already on the wire finishes, and its response is dropped.
+            future.cancel()
+            raise
+
+    async def isConnected(self) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(None, self.reactor.backend.isConnected)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.reactor.close)
+
+
+class AsyncSix15_API:
+
+    def __init__(self, backend: Six15_API_Backend_Async, sync_api: Optional[Six15_API] = None):
+        # With sync_api, commands are also given to its command listeners and recorded in its stats.
+        self.backend = backend
+        self.sync_api = sync_api
+
+    @staticmethod
+    def fromSync(api: Six15_API) -> 'AsyncSix15_API':
+        # Shares the reactor, so the synchronous api can still be used at the same time.
+        return AsyncSix15_API(Six15_API_Backend_Async_Reactor(api.reactor), api)
+
+    async def isConnected(self) -> bool:
+        return await self.backend.isConnected()
+
+    async def close(self):
+        await self.backend.close()
+
+    async def sendSimpleCMD(self, cmd: Base_CMD, payload: Optional[bytes] = None, timeout: int = 1000, deadline: Optional[float] = None) -> Optional[int]:
+        resp: Response_Default = await self.sendCommand(cmd, payload, timeout, deadline)
+        if resp == None:
+            return None
+        return resp.status
+
+    async def sendCommand(self, cmd: Base_CMD, payload: Optional[bytes] = None, timeout: int = 1000, deadline: Optional[float] = None) -> Optional[Base_Response]:
+        # timeout (ms) is how long the device gets to respond.
+        # deadline (seconds) limits the whole call, including time spent queued behind other commands. Raises asyncio.TimeoutError.
+        cmdBuffer, response_size = Six15_API.buildCommand(cmd, payload)
+        finished = self.sync_api.startCommand(cmd) if self.sync_api != None else None
+        send = self.backend.sendCommand(cmdBuffer, response_size, timeout, cmd.priority, cmd.response)
+        if (deadline != None):
+            send = asyncio.wait_for(send, deadline)
+        if (finished == None):
+            return await send
+        try:
+            response = await send
+        except BaseException as e:
+            finished(None if isinstance(e, asyncio.CancelledError) else e)
+            raise
+        finished(None)
+        return response
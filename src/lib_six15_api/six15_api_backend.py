@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Callable
+from lib_six15_api.six15_api_stats import Six15_API_Backend_Stats
 
 
 class Six15_API_Backend(ABC):
@@ -7,15 +8,22 @@ class Six15_API_Backend(ABC):
     MAX_TX_SIZE = 448  # Currently limited by the HID backend to (512-64)
     HEADER_SIZE = 4  # 1 byte for version, 1 byte status, 2 bytes for size.
 
-    verboseCallback: Optional[Callable[[str], None]] = None
+    # Called like Logger.verbose(): a %-style format string and its arguments, so Logger.verbose can be the listener,
+    # and nothing is formatted while verbose logging is off.
+    verboseCallback: Optional[Callable[..., None]] = None
+    stats: Optional[Six15_API_Backend_Stats] = None
 
-    def sendVerboseCallback(self, message: str):
+    def sendVerboseCallback(self, message: str, *args):
         if (self.verboseCallback):
-            self.verboseCallback(message)
+            self.verboseCallback(message, *args)
 
-    def setVerboseListener(self, callback: Optional[Callable[[str], None]] = None):
+    def setVerboseListener(self, callback: Optional[Callable[..., None]] = None):
         self.verboseCallback = callback
 
+    def setStats(self, stats: Optional[Six15_API_Backend_Stats] = None):
+        # Backends that support it count their traffic into stats. None turns counting off.
+        self.stats = stats
+
     @abstractmethod
     def sendCommand(self, write_buff: bytes, read_size: int, timeout: int = 1000) -> Optional[bytes]:
         pass
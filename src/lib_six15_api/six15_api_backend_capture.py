@@ -0,0 +1,207 @@
+# Records the traffic of any backend to a binary trace file, and plays a trace back as a backend.
+# Traces let field issues be reproduced, and parsing/log handling be benchmarked with real device traffic.
+#
+# File format (little endian):
+#   Header: magic b"S15TRACE", u16 format version, u16 Six15 API version
+#   Records: u8 direction, u64 time (ns since the capture started, from time.monotonic_ns()), u32 length, then length bytes.
+# A WRITE record holds a command as passed to sendCommand(). It's followed by a READ record holding the response,
+# an ERROR record holding "ExceptionName:message", or nothing if the command had no response.
+
+import queue
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+from lib_six15_api.six15_api_backend import Six15_API_Backend
+from lib_six15_api.logger import Logger
+
+
+class Trace_Record(NamedTuple):
+    direction: int
+    time_ns: int
+    data: bytes
+
+
+class Six15_API_Trace:
+    MAGIC = b"S15TRACE"
+    FORMAT_VERSION = 1
+    FILE_HEADER = struct.Struct("<8sHH")
+    RECORD_HEADER = struct.Struct("<BQI")
+
+    DIRECTION_WRITE = 0
+    DIRECTION_READ = 1
+    DIRECTION_ERROR = 2
+
+    @staticmethod
+    def read(file_name: str) -> Iterator[Trace_Record]:
+        with open(file_name, "rb") as f:
+            magic, format_version, api_version = Six15_API_Trace.FILE_HEADER.unpack(f.read(Six15_API_Trace.FILE_HEADER.size))
+            if (magic != Six15_API_Trace.MAGIC):
+                raise ValueError(f"Not a trace file: {file_name}")
+            if (format_version != Six15_API_Trace.FORMAT_VERSION):
+                raise ValueError(f"Unsupported trace format version: {format_version}")
+            if (api_version != Six15_API_Backend.API_VERSION):
+                Logger.warn(f"Trace was captured with API version {api_version}, expected {Six15_API_Backend.API_VERSION}")
+            header_size = Six15_API_Trace.RECORD_HEADER.size
+            while True:
+                header = f.read(header_size)
+                if (len(header) < header_size):
+                    # A capture that didn't close cleanly can end part way through a record.
+                    return
+                direction, time_ns, length = Six15_API_Trace.RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if (len(data) < length):
+                    return
+                yield Trace_Record(direction, time_ns, data)
+
+
+class Trace_Writer:
+    # Writes records on its own thread, so capturing never blocks the thread talking to the device on disk I/O.
+    FLUSH_INTERVAL_SECONDS = 1.0
+
+    def __init__(self, file_name: str) -> None:
+        self.file: BinaryIO = open(file_name, "wb")
+        self.file.write(Six15_API_Trace.FILE_HEADER.pack(Six15_API_Trace.MAGIC, Six15_API_Trace.FORMAT_VERSION, Six15_API_Backend.API_VERSION))
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.start_ns = time.monotonic_ns()
+        self.thread = threading.Thread(target=self.run, name="Trace_Writer", daemon=True)
+        self.thread.start()
+
+    def add(self, direction: int, data: bytes):
+        self.queue.put(Six15_API_Trace.RECORD_HEADER.pack(direction, time.monotonic_ns() - self.start_ns, len(data)) + data)
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=Trace_Writer.FLUSH_INTERVAL_SECONDS)
+            except queue.Empty:
+                self.file.flush()
+                continue
+            # Write everything that's waiting in one go.
+            records = [record]
+            try:
+                while True:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            closing = records[-1] == None
+            if (closing):
+                del records[-1]
+            self.file.write(b"".join(records))
+            if (closing):
+                self.file.close()
+                return
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class Six15_API_Backend_Capture(Six15_API_Backend):
+
+    def __init__(self, backend: Six15_API_Backend, file_name: str) -> None:
+        self.backend = backend
+        self.writer = Trace_Writer(file_name)
+
+    def setVerboseListener(self, callback=None):
+        self.backend.setVerboseListener(callback)
+
+    def setStats(self, stats=None):
+        self.backend.setStats(stats)
+
+    def sendCommand(self, write_buff: bytes, read_size: int, timeout: int = 1000) -> Optional[bytes]:
+        self.writer.add(Six15_API_Trace.DIRECTION_WRITE, bytes(write_buff))
+        try:
+            resp = self.backend.sendCommand(write_buff, read_size, timeout)
+        except Exception as e:
+            self.writer.add(Six15_API_Trace.DIRECTION_ERROR, f"{e.__class__.__name__}:{e}".encode(errors="replace"))
+            raise
+        if (resp != None):
+            self.writer.add(Six15_API_Trace.DIRECTION_READ, bytes(resp))
+        return resp
+
+    def isConnected(self) -> bool:
+        return self.backend.isConnected()
+
+    def close(self):
+        self.backend.close()
+        self.writer.close()
+
+
+class Replay_Exchange(NamedTuple):
+    write: bytes
+    time_ns: int  # When the response (or error) was captured
+    response: Optional[bytes]
+    error: Optional[str]
+
+
+class Six15_API_Backend_Replay(Six15_API_Backend):
+    # Answers commands with the responses from a trace, in order.
+    # Commands that weren't captured (or were captured in a different order) are matched with the next exchange that has the same command.
+    MATCH_WINDOW = 64
+
+    def __init__(self, file_name: str, realtime: bool = False) -> None:
+        # realtime: Deliver each response no sooner than it was captured, relative to the first command.
+        # Otherwise responses come back as fast as possible.
+        self.exchanges = Six15_API_Backend_Replay.loadExchanges(file_name)
+        self.position = 0
+        self.realtime = realtime
+        self.start_time_ns: Optional[int] = None
+        self.skipped = 0
+        self.unmatched = 0
+        self.closed = False
+
+    @staticmethod
+    def loadExchanges(file_name: str) -> List[Replay_Exchange]:
+        exchanges: List[Replay_Exchange] = []
+        write: Optional[Trace_Record] = None
+        for record in Six15_API_Trace.read(file_name):
+            if (record.direction == Six15_API_Trace.DIRECTION_WRITE):
+                if (write != None):
+                    exchanges.append(Replay_Exchange(write.data, write.time_ns, None, None))
+                write = record
+            elif (write != None):
+                if (record.direction == Six15_API_Trace.DIRECTION_READ):
+                    exchanges.append(Replay_Exchange(write.data, record.time_ns, record.data, None))
+                else:
+                    exchanges.append(Replay_Exchange(write.data, record.time_ns, None, record.data.decode(errors="replace")))
+                write = None
+        if (write != None):
+            exchanges.append(Replay_Exchange(write.data, write.time_ns, None, None))
+        return exchanges
+
+    def sendCommand(self, write_buff: bytes, read_size: int, timeout: int = 1000) -> Optional[bytes]:
+        if (self.closed or self.position >= len(self.exchanges)):
+            raise OSError("End of replay")
+        write_buff = bytes(write_buff)
+        end = min(self.position + Six15_API_Backend_Replay.MATCH_WINDOW, len(self.exchanges))
+        for index in range(self.position, end):
+            if (self.exchanges[index].write == write_buff):
+                break
+        else:
+            # Like a device that didn't answer.
+            self.unmatched += 1
+            raise TimeoutError(f"Replay has no response for command: 0x{write_buff.hex()}")
+        self.skipped += index - self.position
+        exchange = self.exchanges[index]
+        self.position = index + 1
+
+        if (self.realtime):
+            if (self.start_time_ns == None):
+                self.start_time_ns = time.monotonic_ns() - exchange.time_ns
+            delay_ns = self.start_time_ns + exchange.time_ns - time.monotonic_ns()
+            if (delay_ns > 0):
+                time.sleep(delay_ns / 1e9)
+
+        if (exchange.error != None):
+            name, _, message = exchange.error.partition(":")
+            if (name == "TimeoutError"):
+                raise TimeoutError(message)
+            raise OSError(message)
+        return exchange.response
+
+    def isConnected(self) -> bool:
+        return not self.closed and self.position < len(self.exchanges)
+
+    def close(self):
+        self.closed = True
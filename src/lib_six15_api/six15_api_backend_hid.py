@@ -3,11 +3,14 @@
 # Compatible with Windows and Linux.
 
 import hid
+import os
 import platform
 import struct
+import time
+from collections import OrderedDict
 from lib_six15_api.six15_api_backend import Six15_API_Backend
 from typing import Callable, Optional, Tuple
-from lib_six15_api.logger import Logger
+from lib_six15_api.logger import Logger, Log_Hex
 
 
 class Six15_API_Backend_HID(Six15_API_Backend):
@@ -18,15 +21,83 @@ class Six15_API_Backend_HID(Six15_API_Backend):
 
     HID_API_HEADER_SIZE = 2 + Six15_API_Backend.HEADER_SIZE  # 2 extra bytes for the HID header
 
-    def __init__(self, usb_device: hid.device, hid_path: str, vid: str, pid: str):
+    IN_HEADER = struct.Struct('<HHH')  # Report ID, API version, total size
+    OUT_HEADER_FIRST = struct.Struct('<HHH')  # Report ID, API version, total size
+    OUT_HEADER_NEXT = struct.pack('<HH', REPORT_ID_OUT, Six15_API_Backend.API_VERSION)  # Report ID, API version
+    # The first report carries the total size, so it has 2 fewer bytes of payload than the rest.
+    MAX_OUT_REPORTS = 1 + -(-(Six15_API_Backend.MAX_TX_SIZE - (HID_REPORT_SIZE - OUT_HEADER_FIRST.size)) // (HID_REPORT_SIZE - len(OUT_HEADER_NEXT)))
+    ZERO_REPORT = memoryview(bytes(HID_REPORT_SIZE))
+    CACHEABLE_SIZE = HID_REPORT_SIZE - OUT_HEADER_FIRST.size  # Anything that fits in a single report
+    REPORT_CACHE_SIZE = 32
+
+    # How isConnected() decides if the device is still there.
+    LIVENESS_AUTO = 0  # DEVNODE when the HID path is a device node (Linux hidraw), otherwise ENUMERATE
+    LIVENESS_ENUMERATE = 1  # Enumerate all matching HID devices and compare paths
+    LIVENESS_DEVNODE = 2  # stat() the device node opened, and make sure it's still the same node
+    DEFAULT_LIVENESS_TTL = 0.25  # Seconds that an isConnected() result is reused for
+
+    def __init__(self, usb_device: hid.device, hid_path: str, vid: str, pid: str, liveness_mode: int = LIVENESS_AUTO, liveness_ttl: float = DEFAULT_LIVENESS_TTL):
         self.dev = usb_device
         self.hid_path = hid_path
         self.vid = vid
         self.pid = pid
+        self.liveness_ttl = liveness_ttl
+        self.liveness_time: Optional[float] = None
+        self.liveness_result = False
+        self.devnode = Six15_API_Backend_HID.devnodeFromPath(hid_path)
+        self.devnode_id = Six15_API_Backend_HID.devnodeId(self.devnode) if liveness_mode != Six15_API_Backend_HID.LIVENESS_ENUMERATE else None
+        if (liveness_mode == Six15_API_Backend_HID.LIVENESS_AUTO):
+            liveness_mode = Six15_API_Backend_HID.LIVENESS_DEVNODE if self.devnode_id != None else Six15_API_Backend_HID.LIVENESS_ENUMERATE
+        self.liveness_mode = liveness_mode
+        self.tx_buffer = bytearray(Six15_API_Backend_HID.HID_REPORT_SIZE * Six15_API_Backend_HID.MAX_OUT_REPORTS)
+        for offset in range(Six15_API_Backend_HID.HID_REPORT_SIZE, len(self.tx_buffer), Six15_API_Backend_HID.HID_REPORT_SIZE):
+            self.tx_buffer[offset:offset + len(Six15_API_Backend_HID.OUT_HEADER_NEXT)] = Six15_API_Backend_HID.OUT_HEADER_NEXT
+        # One view per report, so sending a report never needs to allocate or copy.
+        tx_view = memoryview(self.tx_buffer)
+        self.tx_reports = [tx_view[offset:offset + Six15_API_Backend_HID.HID_REPORT_SIZE] for offset in range(0, len(self.tx_buffer), Six15_API_Backend_HID.HID_REPORT_SIZE)]
+        self.report_cache: OrderedDict[bytes, bytes] = OrderedDict()
+        self.rx_report = bytearray(Six15_API_Backend_HID.HID_REPORT_SIZE)
+        self.rx_report_view = memoryview(self.rx_report)
+
+    @staticmethod
+    def devnodeFromPath(hid_path) -> Optional[str]:
+        # On Linux (hidraw) the HID path is the device node, like b"/dev/hidraw3". Other platforms and backends use other formats.
+        if (isinstance(hid_path, bytes)):
+            hid_path = hid_path.decode(errors='replace')
+        if (not isinstance(hid_path, str) or not hid_path.startswith("/")):
+            return None
+        return hid_path
+
+    @staticmethod
+    def devnodeId(devnode: Optional[str]) -> Optional[Tuple[int, int]]:
+        # The inode changes when the node is removed and created again, even if it gets the same name.
+        if (devnode == None):
+            return None
+        try:
+            stat = os.stat(devnode)
+        except OSError:
+            return None
+        return (stat.st_rdev, stat.st_ino)
 
     def isConnected(self) -> bool:
         if self.dev == None or self.hid_path == None:
             return False
+        # Many threads ask about the same device at about the same time, share a recent answer between them.
+        now = time.monotonic()
+        if (self.liveness_time != None and now - self.liveness_time < self.liveness_ttl):
+            return self.liveness_result
+        if (self.liveness_mode == Six15_API_Backend_HID.LIVENESS_DEVNODE):
+            connected = self.isDevnodeConnected()
+        else:
+            connected = self.isEnumerateConnected()
+        self.liveness_result = connected
+        self.liveness_time = now
+        return connected
+
+    def isDevnodeConnected(self) -> bool:
+        return self.devnode_id != None and Six15_API_Backend_HID.devnodeId(self.devnode) == self.devnode_id
+
+    def isEnumerateConnected(self) -> bool:
         device_dict = hid.enumerate(self.vid, self.pid)
         if (device_dict is None or len(device_dict) != 1):
             return False
@@ -41,69 +112,116 @@ class Six15_API_Backend_HID(Six15_API_Backend):
         if buf_len > Six15_API_Backend.MAX_TX_SIZE:
             raise ValueError("Write too large")
 
-        num_bytes_sent = 0
+        if (self.verboseCallback):
+            self.sendVerboseCallback("Write:0x%s", Log_Hex(buf))
+
+        if (buf_len > Six15_API_Backend_HID.CACHEABLE_SIZE):
+            write = self.dev.write
+            num_reports = self.frameReports(buf)
+            for report in self.tx_reports[:num_reports]:
+                write(report)
+            if (self.stats != None):
+                self.stats.bytes_out += buf_len
+                self.stats.reports_out += num_reports
+            return
+
+        # Short commands (READ_LOG polls, IR codes) repeat constantly, so keep their framed report around.
+        key = bytes(buf)
+        report = self.report_cache.get(key)
+        if (report == None):
+            self.frameReports(key)
+            report = bytes(self.tx_reports[0])
+            self.report_cache[key] = report
+            if (len(self.report_cache) > Six15_API_Backend_HID.REPORT_CACHE_SIZE):
+                self.report_cache.popitem(last=False)
+        else:
+            self.report_cache.move_to_end(key)
+        self.dev.write(report)
+        if (self.stats != None):
+            self.stats.bytes_out += buf_len
+            self.stats.reports_out += 1
+
+    def frameReports(self, buf: bytes) -> int:
+        # Packs buf into the reusable tx buffer and returns the number of reports used.
+        buf_len = len(buf)
+        buf_view = memoryview(buf)
+        tx_buffer = self.tx_buffer
+        report_size = Six15_API_Backend_HID.HID_REPORT_SIZE
+        first_header_size = Six15_API_Backend_HID.OUT_HEADER_FIRST.size
+        next_header_size = len(Six15_API_Backend_HID.OUT_HEADER_NEXT)
+
+        # The first report holds the total size. The rest only have the constant header, which was written when the buffer was created.
+        Six15_API_Backend_HID.OUT_HEADER_FIRST.pack_into(tx_buffer, 0, Six15_API_Backend_HID.REPORT_ID_OUT, Six15_API_Backend.API_VERSION, buf_len)
+        num_bytes_sent = min(buf_len, report_size - first_header_size)
+        payload_end = first_header_size + num_bytes_sent
+        tx_buffer[first_header_size:payload_end] = buf_view[:num_bytes_sent]
+        report_end = report_size
         while (num_bytes_sent < buf_len):
-            num_byes_remaining = buf_len - num_bytes_sent
-            if (num_bytes_sent == 0):
-                header_bytes = struct.pack('<HHH', Six15_API_Backend_HID.REPORT_ID_OUT, Six15_API_Backend.API_VERSION, buf_len)
-            else:
-                header_bytes = struct.pack('<HH', Six15_API_Backend_HID.REPORT_ID_OUT, Six15_API_Backend.API_VERSION)
-            header_len = len(header_bytes)
-            max_payload_len = Six15_API_Backend_HID.HID_REPORT_SIZE - header_len
-            if (num_byes_remaining < max_payload_len):
-                payload_len = num_byes_remaining
-                padding_len = max_payload_len - num_byes_remaining
-            else:
-                payload_len = max_payload_len
-                padding_len = 0
-            padding_bytes = bytearray(padding_len)
-            final_buf = header_bytes + buf[num_bytes_sent:num_bytes_sent+payload_len] + padding_bytes
-            if len(final_buf) != 64:
-                Logger.error(len(final_buf))
-                raise AssertionError('Paul is bad a math')
-            self.sendVerboseCallback("Write:0x" + buf.hex())
-            self.dev.write(final_buf)
-            num_bytes_sent = num_bytes_sent+payload_len
+            payload_len = min(buf_len - num_bytes_sent, report_size - next_header_size)
+            payload_end = report_end + next_header_size + payload_len
+            tx_buffer[report_end + next_header_size:payload_end] = buf_view[num_bytes_sent:num_bytes_sent + payload_len]
+            num_bytes_sent += payload_len
+            report_end += report_size
+        # Only the last report has padding. The buffer is reused, so it has to be cleared.
+        tx_buffer[payload_end:report_end] = Six15_API_Backend_HID.ZERO_REPORT[:report_end - payload_end]
+        return report_end // report_size
 
     def readPacket(self, timeout=1000, retries=3) -> bytes:
         if (self.dev == None):
             return None
         # time.sleep(0.025)
+        report_size = Six15_API_Backend_HID.HID_REPORT_SIZE
+        header_size = Six15_API_Backend_HID.HID_API_HEADER_SIZE
+        report = self.rx_report
+        report_fill = 0
         tries = 0
-        buffer = bytearray(0)
-        expectedReadSize = Six15_API_Backend_HID.HID_REPORT_SIZE
+        bytes_read = 0
+        payload = None
         payload_len = 0
-        while (len(buffer) < expectedReadSize):
-            readLen = Six15_API_Backend_HID.HID_REPORT_SIZE - (len(buffer) % Six15_API_Backend_HID.HID_REPORT_SIZE)
-            new_buffer = bytes(self.dev.read(readLen, timeout))
-            buffer = buffer + new_buffer
-            if (len(new_buffer) == 0):
+        payload_fill = 0
+        reports_read = 0
+        while (payload == None or payload_fill < payload_len):
+            new_buffer = self.dev.read(report_size - report_fill, timeout)
+            new_len = len(new_buffer)
+            if (new_len == 0):
                 tries = tries + 1
-            else:
-                tries = 0
-            if (tries > retries):
-                raise TimeoutError(f"Timeout waiting for payload report. Read:{len(buffer)} bytes out of {expectedReadSize}")
-            if (len(buffer) > Six15_API_Backend_HID.HID_API_HEADER_SIZE):
-                # We have enough data to read the header.
-                [hid_header, version, payload_len] = struct.unpack_from('<HHH', buffer)
+                if (self.stats != None):
+                    self.stats.read_retries += 1
+                if (tries > retries):
+                    if (self.stats != None):
+                        self.stats.read_timeouts += 1
+                    expectedReadSize = report_size if payload == None else header_size + payload_len + (report_size - header_size - payload_len) % report_size
+                    raise TimeoutError(f"Timeout waiting for payload report. Read:{bytes_read} bytes out of {expectedReadSize}")
+                continue
+            tries = 0
+            bytes_read += new_len
+            report[report_fill:report_fill + new_len] = new_buffer
+            report_fill += new_len
+            if (report_fill < report_size):
+                continue
+            report_fill = 0
+            reports_read += 1
+
+            if (payload == None):
+                # The header is only parsed once, it tells us the exact size to allocate for the whole payload.
+                [hid_header, version, payload_len] = Six15_API_Backend_HID.IN_HEADER.unpack_from(report)
                 if (hid_header != Six15_API_Backend_HID.REPORT_ID_IN):
                     raise ValueError(f"Unexpected HID Header value: {hid_header}")
                 if (version != Six15_API_Backend.API_VERSION):
                     raise ValueError(f"Unexpected API Version value: {version}")
+                payload = bytearray(payload_len)
+                payload_view = memoryview(payload)
+
+            # Every IN report has a header, copy just the payload part directly into place.
+            size = min(report_size - header_size, payload_len - payload_fill)
+            payload_view[payload_fill:payload_fill + size] = self.rx_report_view[header_size:header_size + size]
+            payload_fill += size
 
-                pkt_size = payload_len + Six15_API_Backend_HID.HID_API_HEADER_SIZE
-                expectedReadSize = pkt_size + (Six15_API_Backend_HID.HID_REPORT_SIZE - pkt_size) % Six15_API_Backend_HID.HID_REPORT_SIZE
-                pass
-        payload = bytearray()
-        index = 0
-        while index + Six15_API_Backend_HID.HID_REPORT_SIZE <= len(buffer):
-            size = Six15_API_Backend_HID.HID_REPORT_SIZE - Six15_API_Backend_HID.HID_API_HEADER_SIZE
-            if (size + len(payload) > payload_len):
-                size = payload_len - len(payload)
-            payload.extend(buffer[index + Six15_API_Backend_HID.HID_API_HEADER_SIZE: index + Six15_API_Backend_HID.HID_API_HEADER_SIZE + size])
-            index += Six15_API_Backend_HID.HID_REPORT_SIZE
-        # payload = buffer[Six15_API.HID_API_HEADER_SIZE:(Six15_API.HID_API_HEADER_SIZE+payload_len)]
-        self.sendVerboseCallback("Read:0x" + payload.hex())
+        if (self.stats != None):
+            self.stats.bytes_in += payload_len
+            self.stats.reports_in += reports_read
+        if (self.verboseCallback):
+            self.sendVerboseCallback("Read:0x%s", Log_Hex(payload))
         return payload
 
     def sendCommand(self, write_buff: bytes, read_size: int, timeout: int = 1000) -> Optional[bytes]:
@@ -117,6 +235,11 @@ class Six15_API_Backend_HID(Six15_API_Backend):
             self.dev.close()
         self.dev = None
         self.hid_path = None
+        self.liveness_time = None
+
+    @staticmethod
+    def isPresent(vid: int, pid: int) -> bool:
+        return len(hid.enumerate(vid, pid)) != 0
 
     @staticmethod
     def findDevice(vid: int, pid: int) -> Tuple[Optional[hid.device], Optional[str]]:
@@ -0,0 +1,139 @@
+# This backend talks to simulated firmware running in this process, instead of a real device.
+# It's the real HID backend with the device swapped out, so commands go through the same 64 byte report framing as real hardware.
+# Useful for trying the whole stack (GUI, CLI, benchmarks, soak tests) without a device plugged in.
+
+import random
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Optional, Tuple
+from lib_six15_api.six15_api_backend import Six15_API_Backend
+from lib_six15_api.six15_api_backend_hid import Six15_API_Backend_HID
+from lib_six15_api.logger import Logger
+
+
+class Six15_API_Sim_Firmware(ABC):
+    # The device side of the protocol. A command buffer goes in, a response buffer (or None for no response) comes out.
+
+    @abstractmethod
+    def handleCommand(self, cmd: int, payload: bytes) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def isConnected(self) -> bool:
+        pass
+
+
+class Sim_HID_Device:
+    # Stands in for a hid.device that's been opened.
+
+    def __init__(self, firmware: Six15_API_Sim_Firmware, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, seed: Optional[int] = None) -> None:
+        # latency: seconds from a command being written to its response being readable.
+        # jitter: up to this many extra seconds are added to each response's latency.
+        # loss: chance (0 to 1) that a response is never sent, like a dropped USB transfer.
+        self.firmware = firmware
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.condition = threading.Condition()
+        self.rx_queue: Deque[Tuple[float, bytes]] = deque()  # (time readable, report)
+        self.partial_cmd: Optional[bytearray] = None
+        self.partial_cmd_len = 0
+        self.closed = False
+        self.lost_responses = 0
+
+    def write(self, report) -> int:
+        if (self.closed or not self.firmware.isConnected()):
+            raise OSError("write error")
+        report = bytes(report)
+        if (len(report) != Six15_API_Backend_HID.HID_REPORT_SIZE):
+            raise OSError(f"Bad report size: {len(report)}")
+        if (self.partial_cmd == None):
+            report_id, version, total = Six15_API_Backend_HID.OUT_HEADER_FIRST.unpack_from(report)
+            header_size = Six15_API_Backend_HID.OUT_HEADER_FIRST.size
+            self.partial_cmd = bytearray()
+            self.partial_cmd_len = total
+        else:
+            report_id, version = struct.unpack_from('<HH', report)
+            header_size = len(Six15_API_Backend_HID.OUT_HEADER_NEXT)
+        if (report_id != Six15_API_Backend_HID.REPORT_ID_OUT or version != Six15_API_Backend.API_VERSION):
+            # Real firmware ignores reports it doesn't understand.
+            Logger.verbose("Sim: ignoring report with id:%s version:%s", report_id, version)
+            self.partial_cmd = None
+            return len(report)
+        remaining = self.partial_cmd_len - len(self.partial_cmd)
+        self.partial_cmd += report[header_size:header_size + remaining]
+        if (len(self.partial_cmd) == self.partial_cmd_len):
+            cmd = self.partial_cmd
+            self.partial_cmd = None
+            self.handleCommand(bytes(cmd))
+        return len(report)
+
+    def handleCommand(self, cmd: bytes):
+        if (len(cmd) == 0):
+            return
+        resp = self.firmware.handleCommand(cmd[0], cmd[1:])
+        if (resp == None):
+            return
+        if (self.loss > 0 and self.random.random() < self.loss):
+            self.lost_responses += 1
+            return
+        ready_time = time.monotonic() + self.latency
+        if (self.jitter > 0):
+            ready_time += self.random.uniform(0, self.jitter)
+        reports = Sim_HID_Device.frameResponse(resp)
+        with self.condition:
+            for report in reports:
+                self.rx_queue.append((ready_time, report))
+            self.condition.notify_all()
+
+    @staticmethod
+    def frameResponse(resp: bytes):
+        # Every IN report has the full header, followed by up to 58 bytes of the response.
+        header = Six15_API_Backend_HID.IN_HEADER.pack(Six15_API_Backend_HID.REPORT_ID_IN, Six15_API_Backend.API_VERSION, len(resp))
+        payload_size = Six15_API_Backend_HID.HID_REPORT_SIZE - len(header)
+        reports = []
+        offset = 0
+        while (offset < len(resp) or offset == 0):
+            chunk = resp[offset:offset + payload_size]
+            reports.append(header + chunk + bytes(payload_size - len(chunk)))
+            offset += payload_size
+        return reports
+
+    def read(self, max_length: int, timeout_ms: int = 0) -> bytes:
+        # Like hidapi, returns nothing if no report shows up before the timeout.
+        end_time = time.monotonic() + timeout_ms / 1000
+        with self.condition:
+            while True:
+                if (self.closed or not self.firmware.isConnected()):
+                    raise OSError("read error")
+                now = time.monotonic()
+                if (len(self.rx_queue) != 0 and self.rx_queue[0][0] <= now):
+                    return self.rx_queue.popleft()[1][0:max_length]
+                if (now >= end_time):
+                    return b""
+                wait_until = end_time if len(self.rx_queue) == 0 else min(end_time, self.rx_queue[0][0])
+                self.condition.wait(wait_until - now)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.rx_queue.clear()
+            self.condition.notify_all()
+
+
+class Six15_API_Backend_Sim(Six15_API_Backend_HID):
+
+    def __init__(self, device: Sim_HID_Device, vid: int, pid: int):
+        # There is no device node or anything to enumerate, ask the firmware if it's still there.
+        super().__init__(device, f"sim:{vid:04x}:{pid:04x}", vid, pid, Six15_API_Backend_HID.LIVENESS_ENUMERATE, 0)
+
+    def isEnumerateConnected(self) -> bool:
+        return self.dev.firmware.isConnected()
+
+    @staticmethod
+    def open(firmware: Six15_API_Sim_Firmware, vid: int, pid: int, latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, seed: Optional[int] = None) -> 'Six15_API_Backend_Sim':
+        return Six15_API_Backend_Sim(Sim_HID_Device(firmware, latency, jitter, loss, seed), vid, pid)
@@ -0,0 +1,104 @@
+# Runs every command for one device on a single thread, which is the only thing that touches the backend.
+# Requests wait in a priority queue, so an interactive command (like an IR button press)
+# never has to wait behind background work (like draining the device log).
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+from lib_six15_api.six15_api_backend import Six15_API_Backend
+
+
+class Reactor_Wait_Stats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, wait_time: float):
+        self.count += 1
+        self.total += wait_time
+        self.last = wait_time
+        if (wait_time > self.max):
+            self.max = wait_time
+
+    def average(self) -> float:
+        return self.total / self.count if self.count != 0 else 0.0
+
+
+class Six15_API_Reactor:
+    # Lower values run first.
+    PRIORITY_CLOSE = -1
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BACKGROUND = 10
+
+    def __init__(self, backend: Six15_API_Backend) -> None:
+        self.backend = backend
+        self.queue: queue.PriorityQueue = queue.PriorityQueue()
+        # Keeps requests with the same priority in order, and means the rest of the tuple is never compared.
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.wait_stats: Dict[int, Reactor_Wait_Stats] = {}
+        self.thread = threading.Thread(target=self.run, name="Six15_API_Reactor", daemon=True)
+        self.thread.start()
+
+    def submit(self, write_buff: bytes, read_size: int, timeout: int = 1000, priority: int = PRIORITY_INTERACTIVE, parse: Optional[Callable[[bytes], Any]] = None) -> Future:
+        # The future's result is the backend's response, passed through parse() when there is one.
+        future: Future = Future()
+        with self.lock:
+            if (self.closed):
+                future.set_exception(ConnectionError("Device is closed"))
+                return future
+            self.queue.put((priority, next(self.sequence), time.monotonic(), future, write_buff, read_size, timeout, parse))
+        return future
+
+    def queueDepth(self) -> int:
+        return self.queue.qsize()
+
+    def getStats(self) -> Dict[str, Any]:
+        with self.lock:
+            waits = {priority: {"count": stats.count, "average": stats.average(), "max": stats.max, "last": stats.last} for priority, stats in self.wait_stats.items()}
+        return {"queue_depth": self.queueDepth(), "wait_seconds": waits}
+
+    def run(self):
+        while True:
+            priority, _, queued_time, future, write_buff, read_size, timeout, parse = self.queue.get()
+            if (priority == Six15_API_Reactor.PRIORITY_CLOSE):
+                break
+            if (not future.set_running_or_notify_cancel()):
+                continue
+            wait_time = time.monotonic() - queued_time
+            with self.lock:
+                stats = self.wait_stats.get(priority)
+                if (stats == None):
+                    stats = Reactor_Wait_Stats()
+                    self.wait_stats[priority] = stats
+                stats.add(wait_time)
+            try:
+                resp = self.backend.sendCommand(write_buff, read_size, timeout)
+                if (resp != None and parse != None):
+                    resp = parse(resp)
+                future.set_result(resp)
+            except BaseException as e:
+                future.set_exception(e)
+
+        # Anything still waiting will never be sent.
+        with self.lock:
+            while not self.queue.empty():
+                future = self.queue.get_nowait()[3]
+                if (future != None and future.set_running_or_notify_cancel()):
+                    future.set_exception(ConnectionError("Device is closed"))
+
+    def close(self):
+        with self.lock:
+            if (self.closed):
+                return
+            self.closed = True
+            self.queue.put((Six15_API_Reactor.PRIORITY_CLOSE, next(self.sequence), 0.0, None, None, 0, 0, None))
+        if (threading.current_thread() != self.thread):
+            self.thread.join()
+        self.backend.close()
@@ -0,0 +1,139 @@
+# Optional instrumentation for Six15_API and its backends.
+# Nothing is recorded unless a Six15_API_Stats is attached with Six15_API.setStats(), so the cost when disabled is one None check per command.
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Latency_Histogram:
+    # HDR style histogram: buckets are linear up to 2^(SUB_BUCKET_BITS+1), after that each power of two is split into 2^SUB_BUCKET_BITS buckets.
+    # With 4 bits every recorded value is within 1/16 (6.25%) of its bucket, from nanoseconds up to hours, in a fixed size list.
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+    LINEAR_BITS = SUB_BUCKET_BITS + 1
+    MAX_VALUE_BITS = 48  # ~78 hours in ns
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (Latency_Histogram.bucketIndex((1 << Latency_Histogram.MAX_VALUE_BITS) - 1) + 1)
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    @staticmethod
+    def bucketIndex(value: int) -> int:
+        shift = value.bit_length() - Latency_Histogram.LINEAR_BITS
+        if (shift <= 0):
+            return value
+        return shift * Latency_Histogram.SUB_BUCKET_COUNT + (value >> shift)
+
+    @staticmethod
+    def bucketValue(index: int) -> int:
+        # The largest value that lands in the bucket.
+        if (index < 2 * Latency_Histogram.SUB_BUCKET_COUNT):
+            return index
+        shift = index // Latency_Histogram.SUB_BUCKET_COUNT - 1
+        sub_bucket = index % Latency_Histogram.SUB_BUCKET_COUNT + Latency_Histogram.SUB_BUCKET_COUNT
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value: int, count: int = 1):
+        # count records the same value that many times.
+        if (value < 0):
+            value = 0
+        index = Latency_Histogram.bucketIndex(value)
+        if (index >= len(self.counts)):
+            index = len(self.counts) - 1
+        self.counts[index] += count
+        self.count += count
+        self.total += value * count
+        if (self.min == None or value < self.min):
+            self.min = value
+        if (value > self.max):
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        if (self.count == 0):
+            return 0
+        target = max(1, int(self.count * percent / 100 + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if (seen >= target):
+                return min(Latency_Histogram.bucketValue(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count != 0 else 0.0
+
+
+class Command_Stats:
+    def __init__(self) -> None:
+        self.latency_ns = Latency_Histogram()
+        self.timeouts = 0
+        self.errors = 0
+
+
+class Six15_API_Backend_Stats:
+    # Counted by the backend, only from the thread that owns it.
+    def __init__(self) -> None:
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.reports_out = 0
+        self.reports_in = 0
+        self.read_retries = 0
+        self.read_timeouts = 0
+
+
+class Six15_API_Stats:
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.commands: Dict[str, Command_Stats] = {}
+        self.backend = Six15_API_Backend_Stats()
+        self.start_time = time.monotonic()
+
+    def recordCommand(self, name: str, latency_ns: int, error: Optional[BaseException]):
+        with self.lock:
+            stats = self.commands.get(name)
+            if (stats == None):
+                stats = Command_Stats()
+                self.commands[name] = stats
+            stats.latency_ns.record(latency_ns)
+            if (error != None):
+                if (isinstance(error, TimeoutError)):
+                    stats.timeouts += 1
+                else:
+                    stats.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        # Latencies in ms.
+        with self.lock:
+            commands = {}
+            for name, stats in self.commands.items():
+                histogram = stats.latency_ns
+                command = {"count": histogram.count, "timeouts": stats.timeouts, "errors": stats.errors, "mean_ms": histogram.mean() / 1e6}
+                for percent in Six15_API_Stats.PERCENTILES:
+                    command[f"p{percent}_ms"] = histogram.percentile(percent) / 1e6
+                command["max_ms"] = histogram.max / 1e6
+                commands[name] = command
+        return {"seconds": time.monotonic() - self.start_time, "commands": commands, "backend": dict(vars(self.backend))}
+
+    @staticmethod
+    def format(snapshot: Dict[str, Any]) -> str:
+        percentile_names = [f"p{percent}" for percent in Six15_API_Stats.PERCENTILES]
+        lines = [f"Stats over {snapshot['seconds']:.1f}s"]
+        lines.append(f"{'Command':<26}{'Count':>8}{'Timeout':>8}{'Error':>6}{'Mean':>9}" + "".join(f"{name:>9}" for name in percentile_names) + f"{'Max':>9}  (ms)")
+        for name, command in sorted(snapshot["commands"].items()):
+            percentiles = "".join(f"{command[name + '_ms']:9.3f}" for name in percentile_names)
+            lines.append(f"{name:<26}{command['count']:8}{command['timeouts']:8}{command['errors']:6}{command['mean_ms']:9.3f}{percentiles}{command['max_ms']:9.3f}")
+        backend = snapshot["backend"]
+        lines.append(f"Out: {backend['bytes_out']} bytes in {backend['reports_out']} reports. In: {backend['bytes_in']} bytes in {backend['reports_in']} reports.")
+        lines.append(f"Read retries: {backend['read_retries']} Read timeouts: {backend['read_timeouts']}")
+        reactor = snapshot.get("reactor")
+        if (reactor != None):
+            lines.append(f"Queue depth: {reactor['queue_depth']}")
+            for priority, wait in sorted(reactor["wait_seconds"].items()):
+                lines.append(f"Queue wait (priority {priority}): count:{wait['count']} mean:{wait['average'] * 1000:.3f}ms max:{wait['max'] * 1000:.3f}ms")
+        return "\n".join(lines)
@@ -4,8 +4,16 @@ import time
 import lib_six15_api.pydfu as PyDfu
 from lib_six15_api.six15_api import Six15_API
 from lib_six15_api.logger import Logger
+from lib_six15_api.hotplug_monitor import Hotplug_Monitor
 from PySide6.QtCore import QThread
 
+VID_STM32_BOOTLOADER = 0x0483
+PID_STM32_BOOTLOADER = 0xDF11
+
+# How often to double check the device, even if the hotplug monitor hasn't reported anything.
+RECHECK_INTERVAL_SECONDS = 5.0
+
+
 def find_STM32_Bootloader() -> Optional[usb.core.Device]:
     devices = PyDfu.get_dfu_devices()
     if (devices is None or len(devices) != 1):
@@ -13,6 +21,12 @@ def find_STM32_Bootloader() -> Optional[usb.core.Device]:
     return devices[0]
 
 
+def watch_STM32_Bootloader() -> Hotplug_Monitor:
+    monitor = Hotplug_Monitor.instance()
+    monitor.watch(VID_STM32_BOOTLOADER, PID_STM32_BOOTLOADER, lambda: find_STM32_Bootloader() != None)
+    return monitor
+
+
 class BootloaderListenThread(QThread):
 
     def __init__(self, callback) -> None:
@@ -22,9 +36,14 @@ class BootloaderListenThread(QThread):
         self.finished.connect(self.deviceFound)
 
     def run(self):
+        monitor = watch_STM32_Bootloader()
         while self.oled_2k_bootloader == None and not self.isInterruptionRequested():
             # Logger.info("Waiting for device connect")
             try:
+                monitor.waitForState(VID_STM32_BOOTLOADER, PID_STM32_BOOTLOADER, True, RECHECK_INTERVAL_SECONDS, self.isInterruptionRequested)
+                if (self.isInterruptionRequested()):
+                    break
+                # A timeout probes too, in case the hotplug monitor missed the device connecting.
                 self.oled_2k_bootloader = find_STM32_Bootloader()
                 if (self.oled_2k_bootloader == None):
                     time.sleep(0.5)  # value is in seconds
@@ -50,12 +69,14 @@ class BootloaderDisconnectThread(QThread):
         return find_STM32_Bootloader() != None
 
     def run(self):
+        monitor = watch_STM32_Bootloader()
         while not self.isInterruptionRequested():
             # Logger.info("Waiting for device disconnect")
             try:
-                if (self.isConnected()):
-                    time.sleep(0.5)  # value is in seconds
-                else:
+                monitor.waitForState(VID_STM32_BOOTLOADER, PID_STM32_BOOTLOADER, False, RECHECK_INTERVAL_SECONDS, self.isInterruptionRequested)
+                if (self.isInterruptionRequested()):
+                    break
+                if (not self.isConnected()):
                     break
             except Exception as e:
                 if (not self.isInterruptionRequested()):
@@ -1,17 +1,45 @@
-from typing import Optional, Callable
+from typing import List, Optional, Callable
 
+from lib_six15_api.firmware_image import Firmware_Element, Firmware_Image
+from lib_six15_api.flash_manifest import Flash_Manifest_Store
 from lib_six15_api.logger import Logger
 import lib_six15_api.pydfu as PyDfu
 
 
-def flash_and_verify_STM32_FW(file_name: str, do_flash: bool, do_verify: bool, callback: Optional[Callable[[bool, bool, float], None]] = None) -> bool:
-    elements = PyDfu.read_dfu_file(file_name)
-    if not elements:
-        Logger.error("No data in dfu file")
-        return
+def load_image(file_name: str, bin_address: Optional[int] = None) -> Optional[Firmware_Image]:
+    # Any format Firmware_Image.load() knows. Logs why if it can't be loaded, or has nothing in it.
+    try:
+        image = Firmware_Image.load(file_name, bin_address)
+    except (OSError, ValueError) as e:
+        Logger.error(f"Can't load firmware: {e}")
+        return None
+    if (len(image.elements) == 0):
+        Logger.error(f"No data in firmware file {file_name}")
+        image.close()
+        return None
+    for line in image.describe():
+        Logger.verbose(line)
+    return image
 
+
+def flash_and_verify_STM32_FW(file_name: str, do_flash: bool, do_verify: bool, callback: Optional[Callable[[bool, bool, float], None]] = None,
+                              manifest_directory: Optional[str] = None, bin_address: Optional[int] = None, allow_mass_erase: bool = False) -> bool:
+    # With a manifest_directory, only pages that changed since the last update of this device are erased and written,
+    # see Flash_Manifest_Store. Otherwise every page of the image is.
+    # bin_address is where a .bin file goes, other formats have their addresses in them.
+    # Pages outside the image are kept, unless allow_mass_erase lets a mass erase wipe them when that's faster.
     if (not do_flash and not do_verify):
         return False
+    image = load_image(file_name, bin_address)
+    if (image == None):
+        return False
+    with image:
+        return flash_and_verify_elements(image.elements, file_name, do_flash, do_verify, callback, manifest_directory, allow_mass_erase)
+
+
+def flash_and_verify_elements(elements: List[Firmware_Element], file_name: str, do_flash: bool, do_verify: bool,
+                              callback: Optional[Callable[[bool, bool, float], None]], manifest_directory: Optional[str],
+                              allow_mass_erase: bool = False) -> bool:
     PyDfu.init()
 
     def progress_flash(addr, offset, size):
@@ -24,17 +52,89 @@ def flash_and_verify_STM32_FW(file_name: str, do_flash: bool, do_verify: bool, c
             percent = (offset / size * 100)
             callback(False, True, percent)
 
-    if (do_flash):
-        PyDfu.write_elements(elements, False, progress=progress_flash)
-        if (callback):
-            callback(True, False, 100)
-
-    if (do_verify):
+    def verify() -> bool:
+        if (not do_verify):
+            return False
         verify_ok = PyDfu.verify_elements(elements, progress=progress_verify)
         if (callback):
             callback(True, True, 100)
+        return verify_ok
+
+    manifests = Flash_Manifest_Store(manifest_directory) if manifest_directory != None else None
+    serial_number = PyDfu.get_serial_number() if manifests != None else None
+    if (do_flash and serial_number != None):
+        old_hashes = manifests.load(serial_number)
+        # Until it verifies, what's on the device isn't known.
+        manifests.forget(serial_number)
+        page_hashes = flash_differential(elements, old_hashes, progress_flash, callback, allow_mass_erase)
+        verify_ok = verify()
+        if (not verify_ok and do_verify and old_hashes != None):
+            # Something else flashed it since the manifest was saved. What's really there is read back instead.
+            Logger.warn("STM32 didn't match its flash manifest, flashing the pages that differ from what it reads back")
+            page_hashes = flash_differential(elements, None, progress_flash, callback, allow_mass_erase)
+            verify_ok = verify()
+        if (verify_ok):
+            manifests.save(serial_number, page_hashes, file_name)
     else:
-        verify_ok = False
+        if (do_flash):
+            if (manifests != None):
+                Logger.info("STM32 bootloader has no serial number, flashing every page")
+            flash_full(elements, progress_flash, callback, allow_mass_erase)
+        verify_ok = verify()
 
     PyDfu.exit_dfu()
     return verify_ok
+
+
+def flash_full(elements, progress_flash, callback: Optional[Callable[[bool, bool, float], None]], allow_mass_erase: bool):
+    PyDfu.reset_timing()
+    PyDfu.write_elements(elements, False, progress=progress_flash, allow_mass_erase=allow_mass_erase)
+    if (callback):
+        callback(True, False, 100)
+    log_timing()
+
+
+def flash_differential(elements, old_hashes, progress_flash, callback: Optional[Callable[[bool, bool, float], None]], allow_mass_erase: bool):
+    # Returns the page hashes of elements.
+    PyDfu.reset_timing()
+    page_hashes, plan = PyDfu.write_elements_differential(elements, old_hashes, progress=progress_flash, allow_mass_erase=allow_mass_erase)
+    if (callback):
+        callback(True, False, 100)
+    if (plan["mass_erase"]):
+        Logger.info(f"STM32 mass erased and flashed all {plan['pages']} pages, too many differed from {describe_hashes(old_hashes)}")
+    else:
+        Logger.info(f"STM32 flashed the {plan['pages']} of {plan['total_pages']} pages that differ from {describe_hashes(old_hashes)}")
+    log_timing()
+    return page_hashes
+
+
+def describe_hashes(old_hashes) -> str:
+    return "its flash manifest" if old_hashes != None else "what it read back"
+
+
+def plan_STM32_FW(file_name: str, manifest_directory: Optional[str] = None, bin_address: Optional[int] = None,
+                  allow_mass_erase: bool = False) -> Optional[dict]:
+    # Prints what flash_and_verify_STM32_FW() would erase and write, without changing anything, and returns the plan.
+    image = load_image(file_name, bin_address)
+    if (image == None):
+        return None
+    PyDfu.init()
+    serial_number = PyDfu.get_serial_number() if manifest_directory != None else None
+    with image:
+        if (serial_number != None):
+            old_hashes = Flash_Manifest_Store(manifest_directory).load(serial_number)
+            plan, _ = PyDfu.plan_differential(image.elements, old_hashes, allow_mass_erase)
+            Logger.info(f"Only the pages that differ from {describe_hashes(old_hashes)} would be flashed")
+        else:
+            plan = PyDfu.plan_elements(image.elements, allow_mass_erase=allow_mass_erase)
+    PyDfu.print_plan(plan)
+    PyDfu.exit_dfu()
+    return plan
+
+
+def log_timing():
+    # Where the flashing time went, the device being busy erasing or programming, or everything else.
+    for stage, timing in PyDfu.get_timing().items():
+        Logger.verbose("DFU %s: %d x %.1fms, %.1fms device busy, %.1f status requests each", stage, timing["count"],
+                       timing["seconds"] / timing["count"] * 1000, timing["busy_seconds"] / timing["count"] * 1000,
+                       timing["status_requests"] / timing["count"])
@@ -8,6 +8,10 @@ from framework_ir import Framework_IR
 import usb.core
 import thread_debug as ThreadDebug
 from lib_six15_api.logger import Logger
+import framework_ir_six15_api as Six15_API
+
+# How often to double check the device, even if the hotplug monitor hasn't reported anything.
+RECHECK_INTERVAL_SECONDS = 5.0
 
 
 class Framework_IR_DeviceListenThread(QThread):
@@ -22,9 +26,14 @@ class Framework_IR_DeviceListenThread(QThread):
     def run(self):
         ThreadDebug.debug_this_thread()
         finder = Framework_IR_Finder()
+        monitor = Framework_IR_Finder.watchHotplug()
         while self.framework_ir == None and not self.isInterruptionRequested():
             # Logger.info("Waiting for device connect")
             try:
+                monitor.waitForState(Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR, True, RECHECK_INTERVAL_SECONDS, self.isInterruptionRequested)
+                if (self.isInterruptionRequested()):
+                    break
+                # A timeout probes too, in case the hotplug monitor missed the device connecting.
                 self.framework_ir = finder.getFramework_IR()
                 if (self.framework_ir == None):
                     time.sleep(0.5)  # value is in seconds
@@ -50,12 +59,14 @@ class Framework_IR_DeviceDisconnectThread(QThread):
 
     def run(self):
         ThreadDebug.debug_this_thread()
+        monitor = Framework_IR_Finder.watchHotplug()
         while self.framework_ir != None and not self.isInterruptionRequested():
             # Logger.info("Waiting for device disconnect")
             try:
+                monitor.waitForState(Six15_API.VID_SIX15, Six15_API.PID_FRAMEWORK_IR, False, RECHECK_INTERVAL_SECONDS, self.isInterruptionRequested)
+                if (self.isInterruptionRequested()):
+                    break
                 self.framework_ir = self.framework_ir if self.framework_ir.isConnected() else None
-                if (self.framework_ir != None):
-                    time.sleep(0.5)  # value is in seconds
             except Exception as e:
                 if (self.framework_ir != None and not self.isInterruptionRequested()):
                     Logger.error(f"Error in Framework_IR_DeviceDisconnectThread: {e}")
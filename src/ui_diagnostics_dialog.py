@@ -0,0 +1,90 @@
+from typing import Callable, Optional
+from PySide6.QtWidgets import QDialog, QGridLayout, QPlainTextEdit, QPushButton, QWidget
+from PySide6.QtCore import QThread, QTimer
+from PySide6.QtGui import QFontDatabase
+from framework_ir import Framework_IR
+from framework_ir_log_watcher import Framework_IR_LogWatcher
+from lib_six15_api.six15_api_stats import Latency_Histogram, Six15_API_Stats
+from ui_event_log_model import Event_Log_Model
+
+
+class Diagnostics_Dialog(QDialog):
+    # Shows command latencies and traffic counters while it's open.
+    # Stats are only recorded while the dialog is open, the rest of the time they cost nothing.
+    REFRESH_INTERVAL_MS = 1000
+
+    def __init__(self, parent: QWidget, getFramework_IR: Callable[[], Optional[Framework_IR]], getLogWatcher: Callable[[], Optional[QThread]] = lambda: None,
+                 event_log_model: Optional[Event_Log_Model] = None) -> None:
+        super().__init__(parent)
+        self.getFramework_IR = getFramework_IR
+        self.getLogWatcher = getLogWatcher
+        self.event_log_model = event_log_model
+        self.stats: Optional[Six15_API_Stats] = None
+        self.setWindowTitle("Diagnostics")
+        self.resize(760, 320)
+
+        layout = QGridLayout(self)
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.text, 0, 0, 1, 2)
+        reset_button = QPushButton("Reset", self)
+        reset_button.clicked.connect(self.resetClicked)
+        layout.addWidget(reset_button, 1, 0)
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button, 1, 1)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    # Recording runs from show to hide, whichever way the dialog closes, Close, Esc or the title bar.
+    # Hides the window system sends, like minimizing the main window, leave it running.
+    def showEvent(self, event):
+        if (not event.spontaneous()):
+            self.reset()
+            self.timer.start(Diagnostics_Dialog.REFRESH_INTERVAL_MS)
+        return super().showEvent(event)
+
+    def hideEvent(self, event):
+        if (not event.spontaneous()):
+            self.timer.stop()
+            self.stats = None
+            framework_ir = self.getFramework_IR()
+            if (framework_ir != None):
+                framework_ir.setStats(None)
+        return super().hideEvent(event)
+
+    def resetClicked(self):
+        # Log latency is always recorded, so unlike the device stats it's only reset here.
+        if (self.event_log_model != None):
+            self.event_log_model.device_latency_ns = Latency_Histogram()
+        self.reset()
+
+    def reset(self):
+        self.stats = Six15_API_Stats()
+        self.attach(self.getFramework_IR())
+        self.refresh()
+
+    def attach(self, framework_ir: Optional[Framework_IR]):
+        # Called when a device connects, so counting continues with the new device.
+        if (framework_ir != None and self.stats != None):
+            framework_ir.setStats(self.stats)
+
+    def refresh(self):
+        framework_ir = self.getFramework_IR()
+        if (framework_ir == None or framework_ir.stats == None):
+            self.text.setPlainText("No device connected")
+            return
+        text = Six15_API_Stats.format(framework_ir.getStats())
+        log_watcher = self.getLogWatcher()
+        if (isinstance(log_watcher, Framework_IR_LogWatcher)):
+            text += f"\nLog poll interval: {log_watcher.getPollInterval() * 1000:.0f}ms Log lines/s: {log_watcher.getLinesPerSecond():.1f}"
+        log_store = getattr(log_watcher, "log_store", None)
+        if (log_store != None):
+            text += f"\nSaved log: {log_store.written} lines written, {log_store.dropped} dropped, in {log_store.directory}"
+        if (self.event_log_model != None):
+            latency = self.event_log_model.device_latency_ns
+            percentiles = " ".join(f"p{percent}:{latency.percentile(percent) / 1e6:.1f}ms" for percent in Six15_API_Stats.PERCENTILES)
+            text += f"\nDevice log read to shown: {percentiles} max:{latency.max / 1e6:.1f}ms ({latency.count} lines)"
+        self.text.setPlainText(text)
@@ -0,0 +1,155 @@
+from array import array
+from bisect import bisect_left
+import time
+from typing import Any, List, Optional, Sequence
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+from lib_six15_api.logger import LogLevel, Log_Record, Log_Timestamp_Cache
+from lib_six15_api.logger_qt import Qt_Log_Sink
+from lib_six15_api.log_index import Log_Index
+from lib_six15_api.six15_api_stats import Latency_Histogram
+
+
+class Event_Log_Model(QAbstractListModel):
+    # The event log, kept in a fixed size ring buffer. Once it's full the oldest lines are dropped,
+    # so memory use stays flat no matter how long the GUI runs.
+    # Views only ask for the rows they show, so text and colors are only made for visible lines.
+    DEFAULT_CAPACITY = 100_000
+
+    LEVELS = list(LogLevel)
+    LEVEL_TO_INDEX = {level: index for index, level in enumerate(LEVELS)}
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, parent=None) -> None:
+        super().__init__(parent)
+        self.capacity = capacity
+        # Parallel arrays instead of an object per line.
+        self.times = array('d', bytes(8 * capacity))
+        self.levels = bytearray(capacity)
+        self.messages: List[Optional[str]] = [None] * capacity
+        self.start = 0  # Index of the oldest line
+        self.count = 0
+        self.dropped = 0
+        self.timestamps = Log_Timestamp_Cache("%Y-%m-%d %H:%M:%S| ")
+        self.colors = [Qt_Log_Sink.LOG_LEVEL_TO_COLOR[level] for level in Event_Log_Model.LEVELS]
+        # From when each device line was read, to when it was added here to be shown.
+        self.device_latency_ns = Latency_Histogram()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if (parent.isValid()):
+            return 0
+        return self.count
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if (not index.isValid() or index.row() >= self.count):
+            return None
+        slot = (self.start + index.row()) % self.capacity
+        if (role == Qt.ItemDataRole.DisplayRole):
+            return self.timestamps.get(self.times[slot]) + self.messages[slot]
+        if (role == Qt.ItemDataRole.ForegroundRole):
+            return self.colors[self.levels[slot]]
+        return None
+
+    def message(self, row: int) -> str:
+        return self.data(self.index(row), Qt.ItemDataRole.DisplayRole)
+
+    def appendRecords(self, records: List[Log_Record]):
+        if (len(records) == 0):
+            return
+        if (len(records) > self.capacity):
+            self.dropped += len(records) - self.capacity
+            records = records[-self.capacity:]
+        overflow = self.count + len(records) - self.capacity
+        if (overflow > 0):
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for offset in range(overflow):
+                self.messages[(self.start + offset) % self.capacity] = None
+            self.start = (self.start + overflow) % self.capacity
+            self.count -= overflow
+            self.dropped += overflow
+            self.endRemoveRows()
+
+        self.beginInsertRows(QModelIndex(), self.count, self.count + len(records) - 1)
+        slot = (self.start + self.count) % self.capacity
+        level_to_index = Event_Log_Model.LEVEL_TO_INDEX
+        device_prefix = Log_Index.DEVICE_PREFIX
+        # Lines read together share a time, so their latency is recorded once per run of equal times.
+        now = time.monotonic()
+        run_time = 0.0
+        run_count = 0
+        for record in records:
+            self.times[slot] = record.time
+            self.levels[slot] = level_to_index[record.level]
+            self.messages[slot] = record.message
+            slot += 1
+            if (slot == self.capacity):
+                slot = 0
+            if (record.message.startswith(device_prefix)):
+                if (record.time != run_time):
+                    if (run_count != 0):
+                        self.device_latency_ns.record(int((now - run_time) * 1e9), run_count)
+                    run_time = record.time
+                    run_count = 0
+                run_count += 1
+        if (run_count != 0):
+            self.device_latency_ns.record(int((now - run_time) * 1e9), run_count)
+        self.count += len(records)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.messages = [None] * self.capacity
+        self.start = 0
+        self.count = 0
+        self.endResetModel()
+
+
+class Log_Search_Model(QAbstractListModel):
+    # The lines of a Log_Index that match a search, shown the same way as Event_Log_Model.
+    # Only the ids of the lines are kept here.
+
+    def __init__(self, log_index: Log_Index, parent=None) -> None:
+        super().__init__(parent)
+        self.log_index = log_index
+        self.ids = array('I')
+        self.timestamps = Log_Timestamp_Cache("%Y-%m-%d %H:%M:%S| ")
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if (parent.isValid()):
+            return 0
+        return len(self.ids)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if (not index.isValid() or index.row() >= len(self.ids)):
+            return None
+        record = self.log_index.record(self.ids[index.row()])
+        if (record == None):
+            # Dropped from the index since the search.
+            return None
+        if (role == Qt.ItemDataRole.DisplayRole):
+            return self.timestamps.get(record.time) + record.message
+        if (role == Qt.ItemDataRole.ForegroundRole):
+            return Qt_Log_Sink.LOG_LEVEL_TO_COLOR[record.level]
+        return None
+
+    def message(self, row: int) -> str:
+        return self.data(self.index(row), Qt.ItemDataRole.DisplayRole)
+
+    def setIds(self, ids: Sequence[int]):
+        self.beginResetModel()
+        self.ids = array('I', ids)
+        self.endResetModel()
+
+    def appendIds(self, ids: Sequence[int]):
+        if (len(ids) == 0):
+            return
+        self.beginInsertRows(QModelIndex(), len(self.ids), len(self.ids) + len(ids) - 1)
+        self.ids.extend(ids)
+        self.endInsertRows()
+
+    def dropBefore(self, first_id: int):
+        # Removes the rows of lines the index has dropped, the ones with ids before first_id.
+        count = bisect_left(self.ids, first_id)
+        if (count == 0):
+            return
+        self.beginRemoveRows(QModelIndex(), 0, count - 1)
+        del self.ids[:count]
+        self.endRemoveRows()